@@ -22,6 +22,9 @@ There are a number of GFF-specific classes:
 
  * GFFIterator: line-by-line iteration through a GFF
  * GFFFile: read data from GFF into memory so it can be easily interrogated
+ * GFFRecordList: container for GFF data lines (used by GFFFile)
+ * PrefetchReader: read lines from a file in a background thread (used
+   by GFFIterator)
  * GFFAttributes: read data from GFF attributes field to make it easier to
    handle
  * GFFID: handle data stored in 'ID' attribute
@@ -31,6 +34,14 @@ There is an additional base class:
  * OrderedDictionary: augumented dictionary which keeps its keys in the
    order they were added to the dictionary
 
+Functions
+---------
+
+ * parse_gff_attributes: lightweight parsing of a GFF attributes string
+   into a dictionary (for quickly checking attribute values)
+ * quote, unquote: percent-encoding and decoding of attribute values
+   (wrappers which only import 'urllib' when first used)
+
 Usage examples
 --------------
 
@@ -82,16 +93,21 @@ To iterate over all lines and print just the 'name' part of the
 # Import modules that this module depends on
 #######################################################################
 
+import sys
 import logging
-import copy
+import threading
+try:
+    # Python 3
+    import queue
+except ImportError:
+    # Python 2
+    import Queue as queue
 try:
     # Python 3
-    from urllib.parse import quote,unquote
+    from collections.abc import Iterator
 except ImportError:
     # Python 2
-    from urllib import quote,unquote
-from collections import Iterator
-from bcftbx.TabFile import TabFile
+    from collections import Iterator
 from bcftbx.TabFile import TabDataLine
 
 #######################################################################
@@ -118,6 +134,15 @@ COMMENT = 1
 # "Annotation" lines are tab-delimited fields containing annotation data 
 ANNOTATION = 2
 
+# Fraction of deleted records in a GFFRecordList which triggers
+# compaction
+COMPACTION_THRESHOLD = 0.5
+
+# Approximate size (in bytes) of the blocks of lines read by a
+# PrefetchReader, and maximum number of blocks it holds in memory
+PREFETCH_BLOCK_SIZE = 256*1024
+PREFETCH_MAX_BLOCKS = 8
+
 #######################################################################
 # Class definitions
 #######################################################################
@@ -156,32 +181,301 @@ class GFFDataLine(TabDataLine):
         """
         return self._format
 
-class GFFFile(TabFile):
+class GFFRecordList(object):
+    """Container for GFF data lines
+
+    Stores GFFDataLines in order, with:
+
+    - O(1) appending of lines
+    - O(1) lookup and deletion of lines by their line number in
+      the source file (see 'getByLineNumber' and
+      'deleteByLineNumber')
+    - fast iteration over the lines
+
+    Deleted lines are replaced by placeholders, which are
+    removed when the list is compacted; compaction happens
+    automatically when the fraction of deleted lines exceeds
+    COMPACTION_THRESHOLD, or when lines are accessed by
+    position.
+
+    Automatic compaction is deferred while the lines are being
+    iterated over (until the last iteration finishes), so lines
+    can be deleted by line number inside a loop over the list.
+    (Accessing lines by position inside the loop still compacts
+    the list, and shouldn't be mixed with deletions.)
+
+    The index of line numbers is only built when it is first
+    needed, so there is no overhead when loading data that is
+    never looked up by line number.
+
+    Also provides the methods of bcftbx's TabFile which are
+    used with GFF data (i.e. indexing by position, 'append',
+    'insert', 'lookup', 'indexByLineNumber', 'sort', 'header'
+    and 'nColumns'), for compatibility.
+    """
+    def __init__(self,gffdataline=None):
+        """Create a new GFFRecordList instance
+
+        Arguments:
+          gffdataline: (optional) class to use for new lines
+            created by 'append' and 'insert' (defaults to
+            GFFDataLine)
+        """
+        if gffdataline is None:
+            gffdataline = GFFDataLine
+        self.__gffdataline = gffdataline
+        self.__records = []
+        self.__ndeleted = 0
+        self.__index = None
+        self.__iterators = 0
+
+    def __len__(self):
+        return len(self.__records) - self.__ndeleted
+
+    def __iter__(self):
+        self.__iterators += 1
+        try:
+            for line in self.__records:
+                if line is not None:
+                    yield line
+        finally:
+            self.__iterators -= 1
+            self.__auto_compact()
+
+    def __getitem__(self,key):
+        if self.__ndeleted:
+            self.compact()
+        return self.__records[key]
+
+    def __delitem__(self,key):
+        if self.__ndeleted:
+            self.compact()
+        if isinstance(key,slice):
+            del(self.__records[key])
+            self.__index = None
+            return
+        if key < 0:
+            key += len(self.__records)
+        if key < 0 or key >= len(self.__records):
+            raise IndexError("list index out of range")
+        self.__delete(key)
+
+    def __new_line(self,data=None,tabdata=None):
+        """Internal: make a new data line
+        """
+        line = self.__gffdataline(line=tabdata,column_names=GFF_COLUMNS)
+        if data is not None:
+            for i,value in enumerate(data):
+                line[i] = value
+        return line
+
+    def __delete(self,i):
+        """Internal: replace the line at position i with a placeholder
+        """
+        line = self.__records[i]
+        self.__records[i] = None
+        self.__ndeleted += 1
+        if self.__index is not None:
+            lineno = line.lineno()
+            if self.__index.get(lineno) == i:
+                del(self.__index[lineno])
+        self.__auto_compact()
+        return line
+
+    def __auto_compact(self):
+        """Internal: compact if there are enough deleted lines
+
+        Does nothing while the lines are being iterated over
+        (as the iterators are working from the current list).
+        """
+        if self.__iterators:
+            return
+        if self.__ndeleted > COMPACTION_THRESHOLD*len(self.__records):
+            self.compact()
+
+    def __build_index(self):
+        """Internal: build the index of line numbers to positions
+        """
+        index = dict()
+        for i,line in enumerate(self.__records):
+            if line is not None:
+                lineno = line.lineno()
+                if lineno is not None:
+                    index[lineno] = i
+        self.__index = index
+
+    def __position(self,n):
+        """Internal: return the position of a line number (or None)
+        """
+        if self.__index is None:
+            self.__build_index()
+        return self.__index.get(n)
+
+    def compact(self):
+        """Remove the placeholders for deleted lines
+        """
+        if not self.__ndeleted:
+            return
+        self.__records = [line for line in self.__records
+                          if line is not None]
+        self.__ndeleted = 0
+        self.__index = None
+
+    def append(self,data=None,tabdata=None,tabdataline=None):
+        """Append a line to the end of the data
+
+        Arguments:
+          data: (optional) list of values for the new line
+          tabdata: (optional) tab-delimited string with the
+            values for the new line
+          tabdataline: (optional) existing data line to append
+
+        Returns:
+          The appended data line.
+        """
+        if tabdataline is None:
+            tabdataline = self.__new_line(data=data,tabdata=tabdata)
+        if self.__index is not None:
+            lineno = tabdataline.lineno()
+            if lineno is not None:
+                self.__index[lineno] = len(self.__records)
+        self.__records.append(tabdataline)
+        return tabdataline
+
+    def insert(self,i,data=None,tabdata=None,tabdataline=None):
+        """Insert a line into the data before position i
+
+        Arguments:
+          i: position to insert the line at
+          data: (optional) list of values for the new line
+          tabdata: (optional) tab-delimited string with the
+            values for the new line
+          tabdataline: (optional) existing data line to insert
+
+        Returns:
+          The inserted data line.
+        """
+        if tabdataline is None:
+            tabdataline = self.__new_line(data=data,tabdata=tabdata)
+        if self.__ndeleted:
+            self.compact()
+        self.__records.insert(i,tabdataline)
+        self.__index = None
+        return tabdataline
+
+    def getByLineNumber(self,n):
+        """Return the line with the specified line number
+
+        Arguments:
+          n: line number in the source file
+
+        Raises:
+          IndexError: if there is no line with the line number
+        """
+        i = self.__position(n)
+        if i is None:
+            raise IndexError("No line number %d" % n)
+        return self.__records[i]
+
+    def deleteByLineNumber(self,n):
+        """Delete the line with the specified line number
+
+        Arguments:
+          n: line number in the source file
+
+        Returns:
+          The deleted data line.
+
+        Raises:
+          IndexError: if there is no line with the line number
+        """
+        i = self.__position(n)
+        if i is None:
+            raise IndexError("No line number %d" % n)
+        return self.__delete(i)
+
+    def indexByLineNumber(self,n):
+        """Return the position of the line with the specified line number
+
+        NB deleting lines by position is much slower than using
+        'deleteByLineNumber', as the positions have to be
+        recalculated after each deletion.
+
+        Arguments:
+          n: line number in the source file
+
+        Raises:
+          IndexError: if there is no line with the line number
+        """
+        if self.__ndeleted:
+            self.compact()
+        i = self.__position(n)
+        if i is None:
+            raise IndexError("No line number %d" % n)
+        return i
+
+    def lookup(self,key,value):
+        """Return the lines where the specified field has a value
+
+        Arguments:
+          key: name of the field (e.g. 'feature')
+          value: value to match
+
+        Returns:
+          List of matching data lines.
+        """
+        return [line for line in self if line[key] == value]
+
+    def sort(self,sort_func,reverse=False):
+        """Sort the lines in place
+
+        Arguments:
+          sort_func: function which takes a data line and
+            returns the key to sort on
+          reverse: if True then sort in descending order
+        """
+        self.compact()
+        self.__records.sort(key=sort_func,reverse=reverse)
+        self.__index = None
+
+    def header(self):
+        """Return the column names
+        """
+        return list(GFF_COLUMNS)
+
+    def nColumns(self):
+        """Return the number of columns
+        """
+        return len(GFF_COLUMNS)
+
+class GFFFile(GFFRecordList):
     """Class for handling GFF files in-memory
 
-    Subclass of TabFile which uses the GFFIterator to process the
-    contents of a GFF file and store annotation lines as GFFDataLines.
+    Subclass of GFFRecordList which uses the GFFIterator to process
+    the contents of a GFF file and store annotation lines as
+    GFFDataLines.
 
     Data from the file can then be extracted and modified using the
-    methods of the TabFile and GFFDataLine classes.
+    methods of the GFFRecordList and GFFDataLine classes.
 
     See http://www.sanger.ac.uk/resources/software/gff/spec.html
     for the GFF specification.
     """
-    def __init__(self,gff_file,fp=None,gffdataline=GFFDataLine,format='gff'):
+    def __init__(self,gff_file,fp=None,gffdataline=GFFDataLine,format='gff',
+                 prefetch=False):
         # Storage for format info
         self._format = format
         self._version = None
-        # Initialise empty TabFile
-        TabFile.__init__(self,None,fp=None,
-                         tab_data_line=GFFDataLine,
-                         column_names=GFF_COLUMNS)
+        # Initialise empty record list
+        GFFRecordList.__init__(self,gffdataline=gffdataline)
         # Populate by iterating over GFF file
+        append = self.append
         for line in GFFIterator(gff_file=gff_file,fp=fp,
-                                gffdataline=gffdataline):
+                                gffdataline=gffdataline,
+                                prefetch=prefetch):
            if line.type == ANNOTATION:
-                # Append to TabFile
-                self.append(tabdataline=line)
+                # Append to the records
+                append(tabdataline=line)
            elif line.type == PRAGMA:
                # Try to extract relevant data
                pragma = str(line)[2:].split()
@@ -197,7 +491,8 @@ class GFFFile(TabFile):
         fp = open(filen,'w')
         if self.format == 'gff':
             fp.write("##gff-version 3\n")
-        TabFile.write(self,fp=fp)
+        for line in self:
+            fp.write("%s\n" % line)
         fp.close()
 
     @property
@@ -230,18 +525,22 @@ class OrderedDictionary(object):
 
     The 'keys()' method returns the OrderedDictionary's keys in
     the correct order.
+
+    Lookups and membership tests use the underlying dictionary
+    (so don't depend on the number of keys); only deletions and
+    insertions need to search the list of keys.
     """
     def __init__(self):
         self.__keys = []
         self.__dict = {}
 
     def __getitem__(self,key):
-        if key not in self.__keys:
+        if key not in self.__dict:
             raise KeyError
         return self.__dict[key]
 
     def __setitem__(self,key,value):
-        if key not in self.__keys:
+        if key not in self.__dict:
             self.__keys.append(key)
         self.__dict[key] = value
 
@@ -257,16 +556,16 @@ class OrderedDictionary(object):
         return len(self.__keys)
 
     def __contains__(self,key):
-        return key in self.__keys
+        return key in self.__dict
 
     def __iter__(self):
         return iter(self.__keys)
 
     def keys(self):
-        return copy.copy(self.__keys)
+        return list(self.__keys)
 
     def insert(self,i,key,value):
-        if key not in self.__keys:
+        if key not in self.__dict:
             self.__keys.insert(i,key)
             self.__dict[key] = value
         else:
@@ -464,6 +763,102 @@ class GFFID(object):
         else:
             return "%s:%s:%d" % (self.code,self.name,self.index)
 
+class PrefetchReader(object):
+    """PrefetchReader
+
+    Class which reads lines from a file-like object in a background
+    thread, so that reading (e.g. waiting for a network filesystem)
+    overlaps with processing the lines in the main thread.
+
+    The lines are read in blocks which are passed to the main thread
+    via a bounded queue, which limits the amount of data held in
+    memory if the reading gets ahead of the processing.
+
+    Example:
+    >>> reader = PrefetchReader(open("my.gff",'rt'))
+    >>> line = reader.readline()
+    """
+
+    def __init__(self,fp,block_size=PREFETCH_BLOCK_SIZE,
+                 max_blocks=PREFETCH_MAX_BLOCKS):
+        """Create a new PrefetchReader and start the reader thread
+
+        Arguments:
+           fp: file-like object to read lines from (the caller
+             is responsible for closing it, after the reader
+             has been closed)
+           block_size: approximate size in bytes of each block
+             of lines to read
+           max_blocks: maximum number of blocks which can be
+             waiting to be processed
+        """
+        self.__fp = fp
+        self.__block_size = block_size
+        self.__queue = queue.Queue(max_blocks)
+        self.__stop = threading.Event()
+        self.__block = []
+        self.__index = 0
+        self.__eof = False
+        self.__thread = threading.Thread(target=self.__read_blocks)
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def __read_blocks(self):
+        """Internal: read blocks of lines into the queue
+
+        Runs in the reader thread. An empty block indicates
+        EOF; if reading fails then the exception is put on the
+        queue instead, to be raised in the main thread.
+        """
+        try:
+            while True:
+                block = self.__fp.readlines(self.__block_size)
+                if not self.__put(block) or not block:
+                    return
+        except Exception as ex:
+            self.__put(ex)
+
+    def __put(self,item):
+        """Internal: put an item on the queue
+
+        Waits for space on the queue unless the reader is
+        stopped; returns False if the reader was stopped.
+        """
+        while not self.__stop.is_set():
+            try:
+                self.__queue.put(item,timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def readline(self):
+        """Return the next line (or an empty string at EOF)
+        """
+        while self.__index >= len(self.__block):
+            if self.__eof:
+                return ''
+            block = self.__queue.get()
+            if isinstance(block,Exception):
+                self.__eof = True
+                raise block
+            if not block:
+                self.__eof = True
+                return ''
+            self.__block = block
+            self.__index = 0
+        line = self.__block[self.__index]
+        self.__index += 1
+        return line
+
+    def close(self):
+        """Stop the reader thread and wait for it to finish
+        """
+        self.__stop.set()
+        self.__thread.join()
+        self.__block = []
+        self.__eof = True
+
 class GFFIterator(Iterator):
     """GFFIterator
 
@@ -473,9 +868,18 @@ class GFFIterator(Iterator):
     Example looping over all reads
     >>> for record in GFFIterator(gff_file):
     >>>    print(record)
+
+    If 'prefetch' is set then the file is read in a background
+    thread (see PrefetchReader), which can hide the time spent
+    waiting for slow (e.g. network) filesystems. If the iteration
+    is abandoned before the end of the file then the 'close'
+    method can be called to stop the thread (this also happens
+    when the iterator is deleted).
     """
 
-    def __init__(self,gff_file=None,fp=None,gffdataline=GFFDataLine):
+    def __init__(self,gff_file=None,fp=None,gffdataline=GFFDataLine,
+                 format='gff',feature_types=None,line_filter=None,
+                 prefetch=False):
         """Create a new GFFIterator
 
         Arguments:
@@ -483,40 +887,181 @@ class GFFIterator(Iterator):
            fp: file-like object to read GFF data from
            gffdataline: GFFDataLine-like class to instantiate
              and return for each record in the GFF
+           format: format of the data (e.g. 'gff')
+           feature_types: if set then should be a list of
+             feature types; annotation lines for other types
+             of feature are skipped before they are converted
+             to data lines (pragmas and comments are always
+             returned)
+           line_filter: if set then should be a function which
+             takes the raw text of an annotation line and returns
+             True if the line should be returned, False if it
+             should be skipped (the function is only called for
+             lines which pass the 'feature_types' check)
+           prefetch: if True then read the data in a background
+             thread while the records are being processed
         """
+        # Set when the iterator is closed (NB initially set
+        # so that nothing is closed if the setup fails)
+        self.__closed = True
         if fp is not None:
             self.__fp = fp
             self.__close_fp = False
         else:
-            self.__fp = open(gff_file,'rU')
+            if sys.version_info[0] < 3:
+                # Python 2: use universal newlines mode
+                self.__fp = open(gff_file,'rU')
+            else:
+                # Python 3: universal newlines is the default
+                self.__fp = open(gff_file,'rt')
             self.__close_fp = True
+        if prefetch:
+            self.__reader = PrefetchReader(self.__fp)
+        else:
+            self.__reader = None
+        self.__closed = False
         self.__gffdataline = gffdataline
         self.__lineno = 0
+        self._format = format
+        if feature_types is not None:
+            feature_types = set(feature_types)
+        self.__feature_types = feature_types
+        self.__line_filter = line_filter
+
+    @property
+    def format(self):
+        """Return the format e.g. 'gff'
+
+        """
+        return self._format
+
+    def close(self):
+        """Stop reading the GFF file
+
+        Stops the background thread (if prefetching) and closes
+        the file (if it was opened by the iterator); this is
+        done automatically on reaching the end of the file, or
+        when the iterator is deleted. No more records are
+        returned after the iterator is closed.
+        """
+        if self.__closed:
+            return
+        self.__closed = True
+        if self.__reader is not None:
+            self.__reader.close()
+        if self.__close_fp:
+            self.__fp.close()
+
+    def __del__(self):
+        # Stop the background thread if the iterator is
+        # abandoned before reaching the end of the file
+        self.close()
 
     def __next__(self):
         """Return next record from GFF file as a GFFDataLine object
         """
-        line = self.__fp.readline()
-        self.__lineno += 1
-        if line != '':
-            # Set type for line
-            if line.startswith("##"):
-                # Pragma
-                type_ = PRAGMA
-            elif line.startswith("#"):
-                # Comment line
-                type_ = COMMENT
-            else:
-                # Annotation line
-                type_ = ANNOTATION
-            # Convert to GFFDataLine
-            return self.__gffdataline(line=line,lineno=self.__lineno,gff_line_type=type_)
-        else:
-            # Reached EOF
-            if self.__close_fp: self.__fp.close()
+        if self.__closed:
             raise StopIteration
+        if self.__reader is not None:
+            readline = self.__reader.readline
+        else:
+            readline = self.__fp.readline
+        while True:
+            line = readline()
+            self.__lineno += 1
+            if line != '':
+                # Set type for line
+                if line.startswith("##"):
+                    # Pragma
+                    type_ = PRAGMA
+                elif line.startswith("#"):
+                    # Comment line
+                    type_ = COMMENT
+                else:
+                    # Annotation line
+                    type_ = ANNOTATION
+                    if self.__feature_types is not None:
+                        # Skip unwanted feature types
+                        fields = line.split('\t',3)
+                        if len(fields) < 3 or \
+                           fields[2] not in self.__feature_types:
+                            continue
+                    if self.__line_filter is not None and \
+                       not self.__line_filter(line):
+                        # Skip lines rejected by the filter
+                        continue
+                # Convert to GFFDataLine
+                return self.__gffdataline(line=line,lineno=self.__lineno,
+                                          gff_line_type=type_)
+            else:
+                # Reached EOF
+                self.close()
+                raise StopIteration
 
     def next(self):
         """Return next record from GFF file (Python 2)
         """
         return self.__next__()
+
+#######################################################################
+# Functions
+#######################################################################
+
+def parse_gff_attributes(attributes):
+    """Quickly extract keyed values from a GFF attributes string
+
+    Lightweight alternative to GFFAttributes, for use when only
+    the values of one or two attributes are needed (for example
+    when filtering lines).
+
+    Arguments:
+      attributes: attributes string from a GFF line
+
+    Returns:
+      Dictionary with attribute names as keys referencing the
+      (percent-decoded) values. Values without keys are
+      discarded.
+    """
+    data = dict()
+    for item in attributes.split(';'):
+        try:
+            i = item.index('=')
+        except ValueError:
+            # No equals sign
+            continue
+        key = item[:i].strip()
+        if key:
+            data[key] = unquote(item[i+1:].strip())
+    return data
+
+def quote(s,safe='/'):
+    """Percent-encode a string
+
+    Wrapper for 'quote' from 'urllib' which defers importing
+    'urllib' until it is first needed; on the first call the
+    wrapper replaces itself with the 'urllib' function, so
+    subsequent calls go directly to it.
+    """
+    global quote
+    try:
+        # Python 3
+        from urllib.parse import quote
+    except ImportError:
+        # Python 2
+        from urllib import quote
+    return quote(s,safe=safe)
+
+def unquote(s):
+    """Percent-decode a string
+
+    Wrapper for 'unquote' from 'urllib' which defers importing
+    'urllib' until it is first needed (see 'quote').
+    """
+    global unquote
+    try:
+        # Python 3
+        from urllib.parse import unquote
+    except ImportError:
+        # Python 2
+        from urllib import unquote
+    return unquote(s)
@@ -33,6 +33,12 @@ There are a number of GTF-specific classes:
 
 These classes are built on top of the GFF handling classes.
 
+Functions
+---------
+
+ * parse_gtf_attributes: lightweight parsing of a GTF attributes
+   string into a dictionary (for quickly checking attribute values)
+
 Usage examples
 --------------
 
@@ -86,6 +92,7 @@ from .GFFFile import GFFAttributes
 from .GFFFile import GFFIterator
 from .GFFFile import OrderedDictionary
 from .GFFFile import GFF_COLUMNS
+from .GFFFile import unquote
 
 #######################################################################
 # Classes
@@ -167,7 +174,7 @@ class GTFFile(GFFFile):
     annotation lines.
 
     Data from the file can then be extracted and modified using the
-    methods of the GFFFile superclass (and its TabFile superclass)
+    methods of the GFFFile superclass (and its GFFRecordList superclass)
     and the GTFDataLine.
 
     GTF is alledgedly the same as GFF version 2. See
@@ -182,4 +189,42 @@ class GTFFile(GFFFile):
 class GTFIterator(GFFIterator):
     def __init__(self,gtf_file=None,fp=None,**args):
         args['gffdataline'] = GTFDataLine
+        args['format'] = 'gtf'
         GFFIterator.__init__(self,gff_file=gtf_file,fp=fp,**args)
+
+#######################################################################
+# Functions
+#######################################################################
+
+def parse_gtf_attributes(attributes):
+    """Quickly extract values from a GTF attributes string
+
+    Lightweight alternative to GTFAttributes, for use when only
+    the values of one or two attributes are needed (for example
+    when filtering lines).
+
+    Arguments:
+      attributes: attributes string from a GTF line
+
+    Returns:
+      Dictionary with attribute names as keys referencing the
+      (percent-decoded) values, with any enclosing quotes
+      removed. If an attribute appears more than once then only
+      the first value is kept.
+    """
+    data = dict()
+    for item in attributes.split(';'):
+        if '%' in item:
+            # Percent-decode (as for GTFAttributes)
+            item = unquote(item)
+        item = item.strip().split(' ',1)
+        if not item[0] or item[0] in data:
+            continue
+        try:
+            value = item[1].strip()
+        except IndexError:
+            value = ''
+        if value.startswith('"') and value.endswith('"'):
+            value = value[1:-1]
+        data[item[0]] = value
+    return data
@@ -6,8 +6,73 @@
 
 import os
 import logging
+import json
+import array
+import itertools
+from collections import deque
+from collections import OrderedDict
+from collections import namedtuple
 from .GFFFile import OrderedDictionary 
-from bcftbx.TabFile import TabFile
+from .GFFFile import PRAGMA
+from .GFFFile import COMMENT
+from .GFFFile import parse_gff_attributes
+from .GTFFile import parse_gtf_attributes
+from .instrumentation import WarningCounter
+from .instrumentation import ProgressReporter
+
+#######################################################################
+# Constants
+#######################################################################
+
+# Header identifying SQLite database files
+SQLITE_MAGIC = b"SQLite format 3\x00"
+
+# Schema for annotation lookup databases
+_LOOKUP_DB_SCHEMA = """
+CREATE TABLE metadata (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE records (rowid INTEGER PRIMARY KEY, id TEXT, seqname TEXT,
+                      feature TEXT, start INTEGER, end INTEGER,
+                      strand TEXT, attributes TEXT, lineno INTEGER);
+CREATE INDEX records_id ON records (id);
+CREATE TABLE parents (id TEXT PRIMARY KEY, parent TEXT);
+CREATE TABLE ancestors (id TEXT PRIMARY KEY, record INTEGER);
+"""
+
+# Default maximum number of annotations cached by lookups
+DEFAULT_ANNOTATION_CACHE_SIZE = 100000
+
+# Statistics for annotation caches
+CacheInfo = namedtuple('CacheInfo',['hits','misses','maxsize','currsize'])
+
+# Columns appended to feature data by annotation
+ANNOTATION_COLUMNS = ('exon_parent',
+                      'feature_type_exon_parent',
+                      'gene_ID',
+                      'gene_name',
+                      'chr',
+                      'start',
+                      'end',
+                      'strand',
+                      'gene_length',
+                      'locus',
+                      'description')
+
+# Default number of lines in each chunk of feature data when
+# annotating in parallel
+FEATURE_DATA_CHUNK_SIZE = 10000
+
+# Buffer size for annotated output files
+OUTPUT_BUFFER_SIZE = 1024*1024
+
+# Fields to fetch from the 'records' table
+_LOOKUP_DB_RECORD_FIELDS = "seqname,feature,start,end,strand,attributes,lineno"
+
+#######################################################################
+# Module globals
+#######################################################################
+
+# Lookup used by annotation worker processes
+_WORKER_LOOKUP = None
 
 #######################################################################
 # Class definitions
@@ -38,35 +103,106 @@ class GFFAnnotationLookup(object):
     - getAnnotation: returns a GFFAnnotation object for the
       feature that matches the supplied id
 
+    - prefetch: computes and caches the annotation for a list
+      of ids
+
+    - cacheInfo: returns the hits, misses, maximum size and
+      current size of the annotation cache
+
+    Annotations are cached, so repeated requests for the same
+    feature return the same GFFAnnotation object (the least
+    recently used annotations are discarded once the cache is
+    full).
+
     Note that for GTF data only 'gene' features are added to the
     lookup tables.
+
+    The lookup can be built from either a GFFFile/GTFFile, or
+    directly from a GFFIterator/GTFIterator (in which case the
+    data is never held in memory in full). If 'compact' is
+    specified then only the fields needed for the annotation
+    are kept for each feature (see GFFAnnotationRecord), e.g.
+
+    >>> lookup = GFFAnnotationLookup(GFFIterator("my.gff"),
+    ...                              compact=True)
+
+    Unless 'verbose' is specified, warnings which could be issued
+    for large numbers of lines or features are collected in a
+    WarningCounter (available via the 'warnings' property) rather
+    than being logged individually. Warnings from building the
+    lookup are summarised once it has been built; the calling
+    program should call 'warnings.report()' to summarise those
+    from subsequent lookups.
     """
 
-    def __init__(self,gff_data,id_attr=None,feature_type=None):
+    def __init__(self,gff_data,id_attr=None,feature_type=None,
+                 compact=False,verbose=False,
+                 cache_size=DEFAULT_ANNOTATION_CACHE_SIZE):
         """Create a new GFFAnnotationLookup instance
 
         Arguments:
-          gff_data: a GFFFile object populated from a GFF file
+          gff_data: a GFFFile object populated from a GFF file,
+            or a GFFIterator/GTFIterator
           id_attr: the attribute to use to extract the ID of
             of a feature (defaults to 'ID' for GFF and 'gene_id'
             for GTF, if not set)
           feature_type: if not None then only allow features
             of the specified type to be considered as parents
             when fetching annotation (GFF only)
-
+          compact: if True then store GFFAnnotationRecord
+            objects with just the data needed for annotation,
+            rather than references to the full data lines
+          verbose: if True then report each feature looked
+            up, and log every warning individually
+          cache_size: maximum number of annotations to keep
+            in the cache (set to zero to disable caching)
         """
+        self._init_reporting(verbose)
+        self._init_cache(cache_size)
         self.__feature_data_format = gff_data.format
         self.__lookup_id = {}
         self.__lookup_parent = {}
+        self.__lookup_ancestor = {}
         self.__feature_type = feature_type
+        self.__compact = compact
         print("Input file is '%s' format" % self.__feature_data_format)
         if self.__feature_data_format == 'gff':
             self._load_from_gff(gff_data,id_attr=id_attr)
+            self._build_ancestor_lookup()
         elif self.__feature_data_format == 'gtf':
             self._load_from_gtf(gff_data,id_attr=id_attr)
         else:
             raise Exception("Unknown format for feature data: '%s'" %
                             gff_data.format)
+        # Summarise warnings from loading the data
+        self.__warnings.report()
+        self.__warnings.reset()
+
+    def _init_reporting(self,verbose):
+        """Internal: set up the verbosity and warning counter
+        """
+        self.__verbose = verbose
+        self.__warnings = WarningCounter()
+
+    def _init_cache(self,cache_size):
+        """Internal: set up the cache of annotations
+        """
+        self.__cache = OrderedDict()
+        self.__cache_size = cache_size
+        self.__cache_hits = 0
+        self.__cache_misses = 0
+
+    def _warn(self,category,message):
+        """Internal: log or count a warning
+
+        Arguments:
+          category: category to count the warning under
+          message: full text of the warning
+        """
+        if self.__verbose:
+            logging.warning(message)
+        else:
+            self.__warnings.add(category,message)
 
     def _load_from_gff(self,gff_data,id_attr=None):
         """Create the lookup tables from GFF input
@@ -75,13 +211,16 @@ class GFFAnnotationLookup(object):
             id_attr = 'ID'
         parent_attr = 'Parent'
         for line in gff_data:
+            if line.type in (PRAGMA,COMMENT):
+                # Skip non-annotation lines from iterators
+                continue
             if id_attr in line['attributes']:
                 # Check that the ID is unique
                 idx = line['attributes'][id_attr]
                 if idx not in self.__lookup_id:
                     self.__lookup_id[idx] = []
                 # Store reference to data by ID
-                self.__lookup_id[idx].append(line)
+                self.__lookup_id[idx].append(self._store(line))
                 if parent_attr in line['attributes']:
                     # Store reference to parent by ID
                     parent = line['attributes'][parent_attr]
@@ -89,12 +228,92 @@ class GFFAnnotationLookup(object):
                     # Check for multiple parents
                     if len(parent.split(',')) > 1:
                         # Issue a warning but continue for now
-                        logging.warning("Multiple parents found on "
-                                        "line %d: %s" % (line.lineno(),
-                                                         parent))
+                        self._warn("Multiple parents found",
+                                   "Multiple parents found on "
+                                   "line %d: %s" % (line.lineno(),
+                                                    parent))
             else:
-                logging.warning("No identifier attribute (%s) on line %d" % 
-                                (id_attr,line.lineno()))
+                self._warn("No identifier attribute (%s)" % id_attr,
+                           "No identifier attribute (%s) on line %d" %
+                           (id_attr,line.lineno()))
+
+    def _store(self,line):
+        """Return the data to store in the lookup for a line
+
+        This is either the line itself, or a compact
+        GFFAnnotationRecord if the lookup was created in
+        compact mode.
+        """
+        if self.__compact:
+            return GFFAnnotationRecord(line)
+        return line
+
+    def _build_ancestor_lookup(self):
+        """Create the lookup table of ancestor genes (GFF only)
+
+        For each feature with a parent, the chain of parents is
+        followed to the 'root' feature (i.e. the first feature
+        without a parent), and the ancestor gene is taken from
+        the data for the root. Roots are memoised for every
+        feature on each chain (so each link is only followed
+        once overall).
+
+        Chains which contain a cycle, or which end with a parent
+        that isn't in the data, are reported once here and the
+        features on those chains have no ancestor gene.
+        """
+        roots = {}
+        genes = {}
+        for idx in self.__lookup_parent:
+            if idx in roots:
+                continue
+            # Follow parents until reaching a feature with a
+            # known root or without a parent
+            path = []
+            on_path = set()
+            idx0 = idx
+            while True:
+                if idx0 in roots:
+                    root = roots[idx0]
+                    break
+                if idx0 in on_path:
+                    # Parent cycle
+                    cycle = path[path.index(idx0):] + [idx0]
+                    self._warn("Parent cycle detected",
+                               "Parent cycle detected: %s" %
+                               ' -> '.join(cycle))
+                    root = None
+                    break
+                try:
+                    parent = self.__lookup_parent[idx0]
+                except KeyError:
+                    # No parent so this is the root
+                    root = idx0
+                    if root not in self.__lookup_id:
+                        # Dangling parent (multiple parents have
+                        # already been reported on loading)
+                        if len(root.split(',')) == 1:
+                            self._warn("Parent not found",
+                                       "Parent '%s' not found "
+                                       "(referenced by '%s')" %
+                                       (root,path[-1]))
+                        root = None
+                    break
+                path.append(idx0)
+                on_path.add(idx0)
+                idx0 = parent
+            # Store the root and ancestor gene for each feature
+            # on the path
+            if root not in genes:
+                genes[root] = None
+                if root is not None:
+                    for data in self.__lookup_id[root]:
+                        if data['feature'] == 'gene':
+                            genes[root] = data
+                            break
+            for idx0 in path:
+                roots[idx0] = root
+                self.__lookup_ancestor[idx0] = genes[root]
 
     def _load_from_gtf(self,gtf_data,id_attr=None):
         """Create the lookup tables from GTF input
@@ -102,16 +321,48 @@ class GFFAnnotationLookup(object):
         if id_attr is None:
             id_attr = 'gene_id'
         for line in gtf_data:
+            if line.type in (PRAGMA,COMMENT):
+                # Skip non-annotation lines from iterators
+                continue
             # Only interested in 'gene' features
             if line['feature'] == 'gene':
                 if id_attr in line['attributes']:
                     idx = line['attributes'][id_attr]
-                    self.__lookup_id[idx] = [line]
+                    self.__lookup_id[idx] = [self._store(line)]
                 else:
-                    logging.warning("No '%s' attribute found on "
-                                    "line %d: %s" % (id_attr,
-                                                     line.lineno(),
-                                                     line))
+                    self._warn("No '%s' attribute found" % id_attr,
+                               "No '%s' attribute found on "
+                               "line %d: %s" % (id_attr,
+                                                line.lineno(),
+                                                line))
+
+    @property
+    def format(self):
+        """Return the format of the source data e.g. 'gff'
+
+        """
+        return self.__feature_data_format
+
+    @property
+    def feature_type(self):
+        """Return the feature type used to match parent features
+
+        """
+        return self.__feature_type
+
+    @property
+    def verbose(self):
+        """Return True if the lookup is in verbose mode
+
+        """
+        return self.__verbose
+
+    @property
+    def warnings(self):
+        """Return the WarningCounter for the lookup
+
+        """
+        return self.__warnings
 
     def getDataFromID(self,idx):
         """Return line of data from GFF file matching the ID attribute
@@ -147,20 +398,11 @@ class GFFAnnotationLookup(object):
         Returns:
           Line of data for the gene which is the ancestor of the
           feature identified by the supplied ID attribute; returns None
-          if no parent is found.
+          if no parent is found (or if the chain of parents contains
+          a cycle or a missing parent).
         """
-        # Follow parents until we find the "ancestor" gene
-        idx0 = idx
-        try:
-            while True:
-                idx0 = self.getParentID(idx0)
-        except KeyError as ex:
-            if idx0 != idx:
-                # Locate gene record in list
-                for data in self.getDataFromID(idx0):
-                    if data['feature'] == 'gene':
-                        return data
-        return None
+        # Ancestor genes are precomputed when the lookup is built
+        return self.__lookup_ancestor.get(idx)
 
     def getAnnotation(self,idx):
         """Return annotation data for the supplied feature ID
@@ -171,16 +413,74 @@ class GFFAnnotationLookup(object):
         Returns:
           GFFAnnotation object populated with the annotation data
           for the feature identified by the supplied ID attribute.
+          NB the object may be shared with other callers via the
+          cache, so it shouldn't be modified.
         """
         # Return annotation for an ID
-        print("Collecting annotation for %s" % idx)
+        if self.verbose:
+            print("Collecting annotation for %s" % idx)
+        try:
+            # Move to the most recently used end of the cache
+            annotation = self.__cache.pop(idx)
+            self.__cache_hits += 1
+        except KeyError:
+            annotation = self._build_annotation(idx)
+            self.__cache_misses += 1
+        if self.__cache_size > 0:
+            self.__cache[idx] = annotation
+            if len(self.__cache) > self.__cache_size:
+                # Discard the least recently used annotation
+                self.__cache.popitem(last=False)
+        return annotation
+
+    def prefetch(self,ids):
+        """Compute and cache the annotation data for multiple IDs
+
+        Arguments:
+          ids: iterable of feature IDs to get annotation for
+
+        Returns:
+          Dictionary with the GFFAnnotation objects for each of
+          the IDs.
+        """
+        annotations = dict()
+        for idx in ids:
+            if idx not in annotations:
+                annotations[idx] = self.getAnnotation(idx)
+        return annotations
+
+    def cacheInfo(self):
+        """Return statistics for the annotation cache
+
+        Returns:
+          CacheInfo named tuple with 'hits', 'misses',
+          'maxsize' and 'currsize' fields.
+        """
+        return CacheInfo(self.__cache_hits,
+                         self.__cache_misses,
+                         self.__cache_size,
+                         len(self.__cache))
+
+    def clearCache(self):
+        """Remove all annotations from the cache
+
+        The hit and miss counts are also reset.
+        """
+        self._init_cache(self.__cache_size)
+
+    def _build_annotation(self,idx):
+        """Internal: create a new GFFAnnotation for a feature ID
+
+        Arguments:
+          idx: ID attribute of feature to get annotation data for
+        """
         # Parent feature data
         parent_feature = None
         try:
             for data in self.getDataFromID(idx):
-                if self.__feature_type:
+                if self.feature_type:
                     # Match the feature type
-                    if data['feature'] == self.__feature_type:
+                    if data['feature'] == self.feature_type:
                         parent_feature = data
                         break
                 else:
@@ -191,11 +491,12 @@ class GFFAnnotationLookup(object):
             # No parent data
             pass
         if not parent_feature:
-            logging.warning("Unable to locate parent data for feature "
-                            "'%s'" % idx)
+            self._warn("Unable to locate parent data",
+                       "Unable to locate parent data for feature "
+                       "'%s'" % idx)
             return GFFAnnotation(idx)
         # Parent gene data
-        if self.__feature_data_format != 'gtf':
+        if self.format != 'gtf':
             gene = self.getAncestorGene(idx)
             if not gene:
                 return GFFAnnotation(idx,parent_feature)
@@ -203,6 +504,311 @@ class GFFAnnotationLookup(object):
             gene = parent_feature
         return GFFAnnotation(idx,parent_feature,gene)
 
+    def save(self,db_file):
+        """Write the lookup data to an SQLite database
+
+        The database can be reopened later using
+        GFFAnnotationLookupDB, without having to reread
+        the source GFF/GTF data. Only the data needed for
+        annotation is stored for each feature (see
+        GFFAnnotationRecord).
+
+        Arguments:
+          db_file: path to the database file to create
+            (an existing file will be overwritten)
+        """
+        import sqlite3
+        if os.path.exists(db_file):
+            os.remove(db_file)
+        cx = sqlite3.connect(db_file)
+        cx.executescript(_LOOKUP_DB_SCHEMA)
+        cx.execute("INSERT INTO metadata VALUES ('format',?)",
+                   (self.__feature_data_format,))
+        # Records (storing database row ids for each line so
+        # that ancestors can refer to them)
+        rowids = {}
+        rowid = 0
+        records = []
+        for idx in self.__lookup_id:
+            for line in self.__lookup_id[idx]:
+                rowid += 1
+                rowids[id(line)] = rowid
+                if not isinstance(line,GFFAnnotationRecord):
+                    line = GFFAnnotationRecord(line)
+                attributes = [[attr,line['attributes'][attr]]
+                              for attr in line['attributes']]
+                records.append((rowid,idx,line['seqname'],
+                                line['feature'],line['start'],
+                                line['end'],line['strand'],
+                                json.dumps(attributes),line.lineno()))
+        cx.executemany("INSERT INTO records VALUES (?,?,?,?,?,?,?,?,?)",
+                       records)
+        # Parents and ancestor genes
+        cx.executemany("INSERT INTO parents VALUES (?,?)",
+                       self.__lookup_parent.items())
+        cx.executemany("INSERT INTO ancestors VALUES (?,?)",
+                       [(idx,rowids[id(gene)])
+                        for idx,gene in self.__lookup_ancestor.items()
+                        if gene is not None])
+        cx.commit()
+        cx.close()
+
+class GFFAnnotationLookupDB(GFFAnnotationLookup):
+    """GFFAnnotationLookup using data stored in an SQLite database
+
+    Provides the same lookup methods as GFFAnnotationLookup
+    but fetches the data using indexed queries on a database
+    previously created by the 'save' method of a lookup
+    instance, e.g.
+
+    >>> GFFAnnotationLookup(GFFFile("my.gff")).save("my.gff.db")
+    >>> lookup = GFFAnnotationLookupDB("my.gff.db")
+
+    The data lines returned by the lookup methods are
+    GFFAnnotationRecord objects.
+    """
+
+    def __init__(self,db_file,feature_type=None,verbose=False,
+                 cache_size=DEFAULT_ANNOTATION_CACHE_SIZE):
+        """Create a new GFFAnnotationLookupDB instance
+
+        Arguments:
+          db_file: path to the SQLite database file
+          feature_type: if not None then only allow features
+            of the specified type to be considered as parents
+            when fetching annotation (GFF only)
+          verbose: if True then report each feature looked
+            up, and log every warning individually
+          cache_size: maximum number of annotations to keep
+            in the cache (set to zero to disable caching)
+        """
+        self._init_reporting(verbose)
+        self._init_cache(cache_size)
+        if not is_annotation_lookup_db(db_file):
+            raise Exception("'%s': not an annotation lookup "
+                            "database" % db_file)
+        self.__db_file = db_file
+        self.__cx = None
+        self.__pid = None
+        self.__feature_type = feature_type
+        self.__feature_data_format = self._query_one(
+            "SELECT value FROM metadata WHERE key='format'")[0]
+        print("Input file is '%s' format" % self.__feature_data_format)
+
+    @property
+    def format(self):
+        """Return the format of the source data e.g. 'gff'
+
+        """
+        return self.__feature_data_format
+
+    @property
+    def feature_type(self):
+        """Return the feature type used to match parent features
+
+        """
+        return self.__feature_type
+
+    def __getstate__(self):
+        # Database connections can't be pickled, so drop the
+        # connection (it is reopened when next needed)
+        state = self.__dict__.copy()
+        state['_GFFAnnotationLookupDB__cx'] = None
+        state['_GFFAnnotationLookupDB__pid'] = None
+        return state
+
+    def _connection(self):
+        """Internal: return a connection to the database
+
+        The connection is reopened if the process has changed
+        (as SQLite connections can't be shared across forked
+        processes).
+        """
+        if self.__cx is None or self.__pid != os.getpid():
+            import sqlite3
+            self.__cx = sqlite3.connect(self.__db_file)
+            self.__pid = os.getpid()
+        return self.__cx
+
+    def _query_one(self,sql,params=()):
+        """Internal: return the first row from a query (or None)
+        """
+        return self._connection().execute(sql,params).fetchone()
+
+    def _record(self,row):
+        """Internal: convert a database row to a GFFAnnotationRecord
+        """
+        record = GFFAnnotationRecord()
+        record.seqname,record.feature,record.start,record.end,\
+            record.strand = row[:5]
+        if self.__feature_data_format == 'gtf':
+            record.attributes = _GTFRecordAttributes()
+        else:
+            record.attributes = OrderedDictionary()
+        for attr,value in json.loads(row[5]):
+            record.attributes[attr] = value
+        record._lineno = row[6]
+        record._format = self.__feature_data_format
+        return record
+
+    def getDataFromID(self,idx):
+        """Return line of data from GFF file matching the ID attribute
+
+        Arguments:
+          idx: ID attribute to search for
+
+        Returns:
+          List of data records where the value of the ID attribute
+          matches the one supplied; raises KeyError exception if no
+          match is found.
+        """
+        rows = self._connection().execute(
+            "SELECT %s FROM records WHERE id=? ORDER BY rowid" %
+            _LOOKUP_DB_RECORD_FIELDS,(idx,)).fetchall()
+        if not rows:
+            raise KeyError(idx)
+        return [self._record(row) for row in rows]
+
+    def getParentID(self,idx):
+        """Return ID attribute value for parent feature
+
+        Arguments:
+          idx: ID attribute of feature to find the parent of
+
+        Returns:
+          ID attribute value for the parent feature; raises
+          KeyError exception if no parent is found.
+        """
+        row = self._query_one("SELECT parent FROM parents WHERE id=?",
+                              (idx,))
+        if row is None:
+            raise KeyError(idx)
+        return row[0]
+
+    def getAncestorGene(self,idx):
+        """Return data for the ancestor gene of the specified feature
+
+        Arguments:
+          idx: ID attribute of feature to find the ancestor gene of
+
+        Returns:
+          Data record for the gene which is the ancestor of the
+          feature identified by the supplied ID attribute; returns
+          None if no ancestor gene was found.
+        """
+        row = self._query_one(
+            "SELECT %s FROM records WHERE rowid="
+            "(SELECT record FROM ancestors WHERE id=?)" %
+            _LOOKUP_DB_RECORD_FIELDS,(idx,))
+        if row is None:
+            return None
+        return self._record(row)
+
+    def save(self,db_file):
+        """Write the lookup data to an SQLite database
+
+        As the data are already stored in a database, this
+        copies the database file.
+
+        Arguments:
+          db_file: path to the database file to create
+            (an existing file will be overwritten)
+        """
+        import shutil
+        if os.path.exists(db_file) and \
+           os.path.samefile(db_file,self.__db_file):
+            # Nothing to do
+            return
+        shutil.copyfile(self.__db_file,db_file)
+
+class GFFAnnotationRecord(object):
+    """Compact record storing the GFF/GTF data needed for annotation
+
+    Stores just the 'seqname', 'feature', 'start', 'end' and
+    'strand' fields from a GFF/GTF data line, plus a subset of
+    the attributes ('Parent' and 'Name' for GFF, 'gene_name'
+    for GTF, and for both the 'description' attribute and any
+    attributes that follow it).
+
+    The data can be accessed in the same way as for a
+    GFFDataLine (e.g. record['start'] or
+    record['attributes']['Name']), so records can be used in
+    place of the full data lines in GFFAnnotationLookup and
+    GFFAnnotation.
+    """
+    __slots__ = ('seqname','feature','start','end','strand',
+                 'attributes','_lineno','_format')
+
+    def __init__(self,line=None):
+        """Create a new GFFAnnotationRecord instance
+
+        Arguments:
+          line (GFFDataLine): GFF or GTF data line to take
+            the data from (if not supplied then the data
+            must be set explicitly)
+        """
+        if line is None:
+            for attr in self.__slots__:
+                setattr(self,attr,None)
+            return
+        self.seqname = line['seqname']
+        self.feature = line['feature']
+        self.start = line['start']
+        self.end = line['end']
+        self.strand = line['strand']
+        self._lineno = line.lineno()
+        self._format = line.format
+        # Store the subset of attributes (keeping the original
+        # order, as this is used to build the description)
+        if self._format == 'gtf':
+            self.attributes = _GTFRecordAttributes()
+            keep_attributes = ('gene_name',)
+        else:
+            self.attributes = OrderedDictionary()
+            keep_attributes = ('Parent','Name')
+        attributes = line['attributes']
+        store_attribute = False
+        for attr in attributes:
+            if attr == 'description':
+                store_attribute = True
+            if store_attribute or attr in keep_attributes:
+                self.attributes[attr] = attributes[attr]
+
+    def __getitem__(self,key):
+        if key not in self.__slots__[:6]:
+            raise KeyError(key)
+        return getattr(self,key)
+
+    def __repr__(self):
+        return '\t'.join([str(x) for x in (self.seqname,
+                                            self.feature,
+                                            self.start,
+                                            self.end,
+                                            self.strand)])
+
+    @property
+    def format(self):
+        """Return the format e.g. 'gff'
+
+        """
+        return self._format
+
+    def lineno(self):
+        """Return the line number of the original data line
+        """
+        return self._lineno
+
+class _GTFRecordAttributes(OrderedDictionary):
+    """Internal: projected GTF attributes for GFFAnnotationRecord
+
+    Returns None for missing attributes, as for GTFAttributes.
+    """
+    def __getitem__(self,key):
+        try:
+            return OrderedDictionary.__getitem__(self,key)
+        except KeyError:
+            return None
+
 class GFFAnnotation(object):
     """Container class for GFF annotation data
 
@@ -317,6 +923,8 @@ class HTSeqCountFile(object):
         # Create dictionaries to store data
         self.__htseq_counts = OrderedDictionary()
         self.__htseq_table = OrderedDictionary()
+        # Counts in feature order
+        self.__counts = []
         # Total reads counted
         self.__total_reads = 0
         # Read in data from file
@@ -327,16 +935,16 @@ class HTSeqCountFile(object):
         # Go through the file line-by-line
         for line in fp:
             # All lines are two tab-delimited fields
-            name = line.split('\t')[0]
-            count = line.strip('\n').split('\t')[1]
+            name,count = _split_htseq_count_line(line)
             # Check if we've encountered the trailing table
-            if line.startswith('no_feature') or line.startswith('__no_feature'):
+            if _is_htseq_count_table_start(name):
                 reading_feature_counts = False
             # Determine what type of data we're storing
             if reading_feature_counts:
                 # Feature-by-feature counts i.e.:
                 # DDB0166998	1
                 self.__htseq_counts[name] = count
+                self.__counts.append(int(count))
                 self.__total_reads += int(count)
             else:
                 # Trailing table i.e.:
@@ -358,6 +966,11 @@ class HTSeqCountFile(object):
         """
         return int(self.__htseq_counts[feature_id])
 
+    def counts(self):
+        """Return list of counts in the same order as the feature IDs
+        """
+        return [c for c in self.__counts]
+
     def table(self):
         """Return the trailing table data
 
@@ -367,93 +980,344 @@ class HTSeqCountFile(object):
         """
         return self.__htseq_table
 
+class HTSeqCountMatrix(object):
+    """Class for combining counts from multiple htseq-count files
+
+    The counts from each file are stored as a column of integers
+    (one column per file), with a single index of feature IDs
+    shared between all the columns, e.g.
+
+    >>> counts = HTSeqCountMatrix()
+    >>> for htseqfile in htseq_files:
+    ...    counts.add(htseqfile,HTSeqCountFile(htseqfile))
+    >>> for feature_id in counts.feature_IDs():
+    ...    print(counts.counts(feature_id))
+
+    The feature IDs are taken from the first file that is added.
+    Files from the same annotation should list the features in
+    the same order, in which case the counts can be stored
+    directly; otherwise the counts are realigned to the index
+    (an exception is raised if the features don't match).
+    """
+
+    def __init__(self):
+        """Create new HTSeqCountMatrix instance
+        """
+        self.__names = []
+        self.__feature_ids = None
+        self.__index = {}
+        self.__columns = []
+        self.__tables = []
+
+    def add(self,name,htseq):
+        """Add the counts from an htseq-count file
+
+        Arguments:
+          name: name to associate with the counts
+          htseq: populated HTSeqCountFile instance
+        """
+        feature_ids = htseq.feature_IDs()
+        counts = htseq.counts()
+        if self.__feature_ids is None:
+            # First file defines the feature index
+            self.__feature_ids = feature_ids
+            for i,feature_id in enumerate(feature_ids):
+                self.__index[feature_id] = i
+            column = array.array('l',counts)
+        elif feature_ids == self.__feature_ids:
+            # Same features in the same order
+            column = array.array('l',counts)
+        else:
+            # Realign to the index
+            if len(feature_ids) != len(self.__feature_ids):
+                raise Exception("%s: number of features (%d) doesn't "
+                                "match %s (%d)" % (name,
+                                                   len(feature_ids),
+                                                   self.__names[0],
+                                                   len(self.__feature_ids)))
+            logging.warning("%s: features are not in the same order as "
+                            "%s; realigning counts" % (name,
+                                                       self.__names[0]))
+            column = array.array('l',[0])*len(self.__feature_ids)
+            for feature_id,count in zip(feature_ids,counts):
+                try:
+                    column[self.__index[feature_id]] = count
+                except KeyError:
+                    raise Exception("%s: feature '%s' not found in %s" %
+                                    (name,feature_id,self.__names[0]))
+        self.__names.append(name)
+        self.__columns.append(column)
+        self.__tables.append(htseq.table())
+
+    def names(self):
+        """Return the names associated with each set of counts
+        """
+        return [n for n in self.__names]
+
+    def feature_IDs(self):
+        """Return the list of feature IDs in the index
+        """
+        if self.__feature_ids is None:
+            return []
+        return [f for f in self.__feature_ids]
+
+    def counts(self,feature_id):
+        """Return the counts for a feature ID from each file
+
+        Arguments:
+          feature_id: feature ID to fetch the counts for
+
+        Returns:
+          List of counts, in the order that the files were
+          added.
+        """
+        i = self.__index[feature_id]
+        return [column[i] for column in self.__columns]
+
+    def column(self,name):
+        """Return the counts from a file
+
+        Arguments:
+          name: name that the counts were added under
+
+        Returns:
+          Array of counts, in the same order as the feature
+          IDs.
+        """
+        return self.__columns[self.__names.index(name)]
+
+    def table(self):
+        """Return the combined trailing table data
+
+        Returns:
+          OrderedDictionary object with the statistics (taken
+          from the first file) as keys referencing lists of the
+          values from each file.
+        """
+        table = OrderedDictionary()
+        if not self.__tables:
+            return table
+        for name in self.__tables[0]:
+            table[name] = [t[name] for t in self.__tables]
+        return table
+
 #######################################################################
 # Functions
 #######################################################################
 
-def annotate_feature_data(gff_lookup,feature_data_file,out_file):
+def is_annotation_lookup_db(filen):
+    """Check if a file is an SQLite annotation lookup database
+
+    Arguments:
+      filen: path to the file to check
+
+    Returns:
+      True if the file starts with the SQLite header, False
+      otherwise.
+    """
+    try:
+        with open(filen,'rb') as fp:
+            return fp.read(len(SQLITE_MAGIC)) == SQLITE_MAGIC
+    except IOError:
+        return False
+
+def read_feature_ids(feature_files,htseq_count=False):
+    """Collect the feature IDs from feature data files
+
+    Arguments:
+      feature_files: list of tab-delimited feature data files
+        with the feature IDs in the first column (comment
+        lines, including any header, and blank lines are
+        ignored)
+      htseq_count: if True then the files are htseq-count
+        output (the trailing summary table is ignored)
+
+    Returns:
+      Set of feature IDs.
+    """
+    feature_ids = set()
+    for feature_file in feature_files:
+        with open(feature_file,'rt') as fp:
+            for line in fp:
+                if not line.strip() or line.startswith('#'):
+                    continue
+                name = line.rstrip('\n').split('\t')[0]
+                if htseq_count and _is_htseq_count_table_start(name):
+                    break
+                feature_ids.add(name)
+    return feature_ids
+
+def find_lookup_ids(gff_file,feature_ids,id_attr=None,format='gff'):
+    """Find the IDs of the records needed to annotate a set of features
+
+    For GFF data this is the set of feature IDs plus the IDs
+    of all their ancestors (found by following the 'Parent'
+    attributes); for GTF data it is just the feature IDs.
+
+    The GFF file is read once, extracting only the ID and
+    'Parent' attributes from each line.
+
+    Arguments:
+      gff_file: GFF or GTF file to get the parents from
+      feature_ids: iterable of feature IDs
+      id_attr: the attribute used for feature IDs (defaults
+        to 'ID' for GFF and 'gene_id' for GTF)
+      format: either 'gff' (the default) or 'gtf'
+
+    Returns:
+      Set of IDs.
+    """
+    lookup_ids = set(feature_ids)
+    if format == 'gtf':
+        return lookup_ids
+    if id_attr is None:
+        id_attr = 'ID'
+    # Collect the parent of every feature
+    parents = dict()
+    with open(gff_file,'rt') as fp:
+        for line in fp:
+            if line.startswith('#'):
+                continue
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) < 9:
+                continue
+            attributes = parse_gff_attributes(fields[8])
+            try:
+                parents[attributes[id_attr]] = attributes['Parent']
+            except KeyError:
+                pass
+    # Add the ancestors of the features
+    for idx in feature_ids:
+        while idx in parents:
+            idx = parents[idx]
+            if idx in lookup_ids:
+                # Already seen (also stops on parent cycles)
+                break
+            lookup_ids.add(idx)
+    return lookup_ids
+
+def id_line_filter(ids,id_attr=None,format='gff'):
+    """Return a function which filters GFF/GTF lines by ID
+
+    The returned function can be supplied as the 'line_filter'
+    argument of GFFIterator or GTFIterator, to skip lines which
+    don't have one of the specified IDs before they are parsed
+    in full, e.g.
+
+    >>> ids = find_lookup_ids("my.gff",feature_ids)
+    >>> gff = GFFIterator("my.gff",line_filter=id_line_filter(ids))
+
+    Arguments:
+      ids: set of IDs to keep
+      id_attr: the attribute to get the ID from (defaults to
+        'ID' for GFF and 'gene_id' for GTF)
+      format: either 'gff' (the default) or 'gtf'
+
+    Returns:
+      Function which takes a line and returns True if the ID
+      is in the set of IDs, and False if not.
+    """
+    if format == 'gtf':
+        parse_attributes = parse_gtf_attributes
+        if id_attr is None:
+            id_attr = 'gene_id'
+    else:
+        parse_attributes = parse_gff_attributes
+        if id_attr is None:
+            id_attr = 'ID'
+    def line_filter(line):
+        try:
+            attributes = line.rstrip('\n').split('\t')[8]
+        except IndexError:
+            return False
+        return parse_attributes(attributes).get(id_attr) in ids
+    return line_filter
+
+def annotate_feature_data(gff_lookup,feature_data_file,out_file,
+                          progress_interval=None,nprocs=1,
+                          chunk_size=FEATURE_DATA_CHUNK_SIZE):
     """Annotate feature data with gene information
 
     Reads in 'feature data' from a tab-delimited input file with feature
     IDs in the first column; outputs these data with data about the
     parent gene appended to each line.
 
+    Each line is annotated and written as soon as it has been read,
+    so the feature data is never held in memory. The input fields
+    are written out exactly as they appear in the input file.
+
+    If the first line starts with '#' and has at least as many
+    fields as the first data line then it is used as the header
+    for the output (with the '#' removed); otherwise a generic
+    header is used ('data0', 'data1' etc). Other comment lines
+    and blank lines are dropped.
+
+    If more than one process is specified then the lines are
+    split into chunks which are annotated in parallel by worker
+    processes (each with a copy of the lookup), and written out
+    in the original order.
+
     Arguments:
       gff_lookup         populated GFFAnnotationLookup instance
       feature_data_file  input data file with feature IDs in first column
       out_file           name of output file
+      progress_interval  if set then report progress at this interval
+                         (in seconds)
+      nprocs             number of processes to use for annotation
+      chunk_size         number of lines in each chunk when using
+                         multiple processes
+
+    Returns:
+      Number of features annotated.
     """
-    # Determine if input file has a header line
     print("Reading in data from %s" % feature_data_file)
-    with open(feature_data_file,'rt') as fp:
-        for line in fp:
-            if line.startswith('#'):
-                first_line_is_header = True
-            else:
-                first_line_is_header = False
-            break
-
-    # Read the feature data into a TabFile
-    try:
-        input_data = TabFile(filen=feature_data_file,
-                             first_line_is_header=first_line_is_header)
-    except IndexError as ex:
-        if first_line_is_header:
-            # Maybe first line was just a comment?
-            # Try again without header
-            input_data = TabFile(filen=feature_data_file)
-        else:
-            # Some other failure
-            raise ex
-
-    # Initialise columns for output
-    if input_data.header():
-        # Copy header
-        columns = [c for c in input_data.header()]
-    else:
-        # Make generic header
-        columns = ['data%d' % x for x in range(0,input_data.nColumns())]
-
-    # Create and populate second TabFile for output
-    feature_data = TabFile(column_names=columns)
-    for line in input_data:
-        feature_data.append(data=[x for x in line])
-
-    # Append columns for annotation
-    print("Appending columns for annotation")
-    for colname in ('exon_parent',
-                    'feature_type_exon_parent',
-                    'gene_ID',
-                    'gene_name',
-                    'chr',
-                    'start',
-                    'end',
-                    'strand',
-                    'gene_length',
-                    'locus',
-                    'description'):
-        feature_data.appendColumn(colname)
-
-    for line in feature_data:
-        feature_ID = line[0]
-        annotation = gff_lookup.getAnnotation(feature_ID)
-        line['exon_parent'] = annotation.parent_feature_name
-        line['feature_type_exon_parent'] = annotation.parent_feature_type
-        line['gene_ID'] = annotation.parent_feature_parent
-        line['gene_name'] = annotation.parent_gene_name
-        line['chr'] = annotation.chr
-        line['start'] = annotation.start
-        line['end'] = annotation.end
-        line['strand'] = annotation.strand
-        line['gene_length'] = annotation.gene_length
-        line['locus'] = annotation.gene_locus
-        line['description'] = annotation.description
-
-    # Output
     print("Writing output file %s" % out_file)
-    feature_data.write(out_file,include_header=True,no_hash=True)
-
-def annotate_htseq_count_data(gff_lookup,htseq_files,out_file):
+    progress = ProgressReporter(interval=progress_interval,
+                                label="features")
+    with open(feature_data_file,'rt') as fp, \
+         open(out_file,'wt',OUTPUT_BUFFER_SIZE) as fpout:
+        # Check for possible header (compared against first
+        # data line)
+        comment = None
+        line = fp.readline()
+        if line.startswith('#'):
+            comment = line.rstrip('\n')[1:].split('\t')
+            lines = fp
+        else:
+            lines = itertools.chain([line],fp)
+        lines = _iter_feature_data_lines(lines)
+        first_line = next(lines,None)
+        # Write the header
+        if first_line is None:
+            # No data lines
+            header = comment if comment is not None else []
+        else:
+            ncols = len(first_line.split('\t'))
+            if comment is not None and len(comment) >= ncols:
+                header = comment
+            else:
+                # Make generic header
+                header = ['data%d' % x for x in range(0,ncols)]
+            lines = itertools.chain([first_line],lines)
+        fpout.write("%s\n" % '\t'.join(header + list(ANNOTATION_COLUMNS)))
+        if first_line is not None:
+            # Annotate and write the lines
+            if nprocs > 1:
+                _annotate_feature_data_parallel(gff_lookup,lines,fpout,
+                                                nprocs,chunk_size,
+                                                progress)
+            else:
+                for line in lines:
+                    fpout.write(_annotate_feature_line(gff_lookup,line))
+                    progress.update()
+    progress.finish()
+    gff_lookup.warnings.report()
+    gff_lookup.warnings.reset()
+    return progress.count
+
+def annotate_htseq_count_data(gff_lookup,htseq_files,out_file,
+                              progress_interval=None,stream=False,
+                              nthreads=1):
     """Annotate count data from htseq-count output with gene information
 
     Reads in data from one or more htseq-count output files and combines
@@ -463,10 +1327,26 @@ def annotate_htseq_count_data(gff_lookup,htseq_files,out_file):
     Also creates an output 'stats' file which combines the summary data
     from the tail of each htseq-count file.
 
+    By default the counts from all the files are loaded into memory
+    before the output is written. In 'stream' mode the files are
+    read together line by line instead, and each annotated line is
+    written as soon as it has been read; in this mode the files must
+    list the same features in the same order (an exception is raised
+    otherwise).
+
     Arguments:
       gff_lookup:  populated GFFAnnotationLookup instance
       htseq_files: list of output files from htseq-count to use as input
       out_file:    name of output file
+      progress_interval: if set then report progress at this
+                   interval (in seconds)
+      stream:      if True then read the htseq-count files in
+                   lock step rather than loading them into memory
+      nthreads:    number of threads to use to load the htseq-count
+                   files concurrently (ignored in 'stream' mode)
+
+    Returns:
+      Number of features annotated.
     """
     # Output files
     annotated_counts_out_file = out_file
@@ -476,64 +1356,272 @@ def annotate_htseq_count_data(gff_lookup,htseq_files,out_file):
                      "_stats"+os.path.splitext(annotated_counts_out_file)[1])
 
     # Process the HTSeq-count files
-    print("Processing HTSeq-count files")
-    htseq_data = {}
-    for htseqfile in htseq_files:
-        print("\t%s" % htseqfile)
-        htseq_data[htseqfile] = HTSeqCountFile(htseqfile)
-
-    # Create a TabFile for output
-    print("Building annotated count file for output")
-    annotated_counts = TabFile(column_names=['exon_parent',
-                                             'feature_type_exon_parent',
-                                             'gene_ID',
-                                             'gene_name',
-                                             'chr',
-                                             'start',
-                                             'end',
-                                             'strand',
-                                             'gene_length',
-                                             'locus',
-                                             'description'])
-    for htseqfile in htseq_files:
-        annotated_counts.appendColumn(os.path.basename(htseqfile))
-
-    # Combine feature counts and parent feature data
-    for feature_ID in htseq_data[htseq_files[0]].feature_IDs():
-        # Get annotation data
-        annotation = gff_lookup.getAnnotation(feature_ID)
-        # Build the data line
-        data = [annotation.parent_feature_name,
-                annotation.parent_feature_type,
-                annotation.parent_feature_parent,
-                annotation.parent_gene_name,
-                annotation.chr,
-                annotation.start,
-                annotation.end,
-                annotation.strand,
-                annotation.gene_length,
-                annotation.gene_locus,
-                annotation.description]
-        # Add the counts from each file
+    if stream:
+        # Read counts from all files together
+        print("Streaming HTSeq-count files")
         for htseqfile in htseq_files:
-            data.append(htseq_data[htseqfile].count(feature_ID))
-        # Add to the tabfile
-        annotated_counts.append(data=data)
+            print("\t%s" % htseqfile)
+        table = OrderedDictionary()
+        feature_counts = _iter_htseq_counts_lockstep(htseq_files,table)
+        nfeatures = None
+    else:
+        # Load counts from each file
+        print("Processing HTSeq-count files")
+        htseq_counts = HTSeqCountMatrix()
+        if nthreads > 1:
+            # Load files concurrently (results are still returned
+            # in the original order)
+            from multiprocessing.pool import ThreadPool
+            pool = ThreadPool(min(nthreads,len(htseq_files)))
+            htseq_data = pool.imap(HTSeqCountFile,htseq_files)
+        else:
+            pool = None
+            htseq_data = (HTSeqCountFile(f) for f in htseq_files)
+        try:
+            for htseqfile,htseq in zip(htseq_files,htseq_data):
+                print("\t%s" % htseqfile)
+                htseq_counts.add(htseqfile,htseq)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        table = htseq_counts.table()
+        feature_IDs = htseq_counts.feature_IDs()
+        feature_counts = ((feature_ID,htseq_counts.counts(feature_ID))
+                          for feature_ID in feature_IDs)
+        nfeatures = len(feature_IDs)
 
-    # Write the file
-    print("Writing output file %s" % annotated_counts_out_file)
-    annotated_counts.write(annotated_counts_out_file,include_header=True,no_hash=True)
+    # Combine feature counts and parent feature data
+    print("Writing annotated count file %s" % annotated_counts_out_file)
+    progress = ProgressReporter(total=nfeatures,
+                                interval=progress_interval,
+                                label="features")
+    with open(annotated_counts_out_file,'wt',OUTPUT_BUFFER_SIZE) as fp:
+        fp.write("%s\n" % '\t'.join(list(ANNOTATION_COLUMNS) +
+                                     [os.path.basename(f)
+                                      for f in htseq_files]))
+        for feature_ID,counts in feature_counts:
+            # Get annotation data
+            annotation = gff_lookup.getAnnotation(feature_ID)
+            # Build the data line with the counts from each file
+            data = _annotation_fields(annotation)
+            data.extend(counts)
+            fp.write("%s\n" % '\t'.join([str(x) for x in data]))
+            progress.update()
+    progress.finish()
+    gff_lookup.warnings.report()
+    gff_lookup.warnings.reset()
 
     # Make second file for the trailing table data
-    print("Building trailing tables data file for output")
-    table_counts = TabFile(column_names=['count'])
-    for htseqfile in htseq_files:
-        table_counts.appendColumn(htseqfile)
-    for name in htseq_data[htseq_files[0]].table():
-        # Build the data line
-        data = [name]
-        for htseqfile in htseq_files:
-            data.append(htseq_data[htseqfile].table()[name])
-        table_counts.append(data=data)
-    print("Writing output file %s" % tables_out_file)
-    table_counts.write(tables_out_file,include_header=True,no_hash=True)
+    print("Writing trailing tables data file %s" % tables_out_file)
+    with open(tables_out_file,'wt') as fp:
+        fp.write("%s\n" % '\t'.join(['count'] + list(htseq_files)))
+        for name in table:
+            fp.write("%s\n" % '\t'.join([name] +
+                                         [str(x) for x in table[name]]))
+    return progress.count
+
+#######################################################################
+# Internal functions
+#######################################################################
+
+def _annotation_fields(annotation):
+    """Internal: return list of annotation values for output
+
+    The values are in the same order as ANNOTATION_COLUMNS.
+
+    Arguments:
+      annotation: populated GFFAnnotation instance
+    """
+    return [annotation.parent_feature_name,
+            annotation.parent_feature_type,
+            annotation.parent_feature_parent,
+            annotation.parent_gene_name,
+            annotation.chr,
+            annotation.start,
+            annotation.end,
+            annotation.strand,
+            annotation.gene_length,
+            annotation.gene_locus,
+            annotation.description]
+
+def _iter_feature_data_lines(lines):
+    """Internal: yield the data lines from feature data
+
+    Blank lines and comment lines are skipped, and trailing
+    newlines are removed.
+
+    Arguments:
+      lines: iterable of lines from a feature data file
+    """
+    for line in lines:
+        if not line.strip() or line.lstrip().startswith('#'):
+            continue
+        yield line.rstrip('\n')
+
+def _annotate_feature_line(gff_lookup,line):
+    """Internal: return line of feature data with annotation appended
+
+    Arguments:
+      gff_lookup: populated GFFAnnotationLookup instance
+      line: line of feature data (without trailing newline)
+        with the feature ID in the first field
+
+    Returns:
+      Annotated line (including trailing newline).
+    """
+    annotation = gff_lookup.getAnnotation(line.split('\t',1)[0])
+    return "%s\t%s\n" % (line,'\t'.join([str(x) for x in
+                                          _annotation_fields(annotation)]))
+
+def _annotate_feature_data_parallel(gff_lookup,lines,fpout,nprocs,
+                                    chunk_size,progress):
+    """Internal: annotate feature data lines using multiple processes
+
+    The lines are split into chunks which are annotated by a
+    pool of worker processes; only a limited number of chunks
+    are queued at any time, and the annotated chunks are written
+    in the original order. Warnings from the workers are merged
+    into the lookup's warnings.
+
+    Arguments:
+      gff_lookup: populated GFFAnnotationLookup instance (which
+        is copied to each worker)
+      lines: iterable of feature data lines
+      fpout: file object to write annotated lines to
+      nprocs: number of worker processes
+      chunk_size: number of lines in each chunk
+      progress: ProgressReporter to update
+    """
+    from multiprocessing import Pool
+    pool = Pool(nprocs,
+                initializer=_init_annotation_worker,
+                initargs=(gff_lookup,))
+    pending = deque()
+    def write_next_chunk():
+        annotated,nlines,warnings = pending.popleft().get()
+        fpout.write(annotated)
+        gff_lookup.warnings.merge(warnings)
+        progress.update(nlines)
+    try:
+        chunk = []
+        for line in lines:
+            chunk.append(line)
+            if len(chunk) == chunk_size:
+                pending.append(pool.apply_async(_annotate_feature_chunk,
+                                                (chunk,)))
+                chunk = []
+                if len(pending) >= 2*nprocs:
+                    write_next_chunk()
+        if chunk:
+            pending.append(pool.apply_async(_annotate_feature_chunk,
+                                            (chunk,)))
+        while pending:
+            write_next_chunk()
+        pool.close()
+    except Exception:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+def _init_annotation_worker(gff_lookup):
+    """Internal: store the lookup for an annotation worker process
+    """
+    global _WORKER_LOOKUP
+    _WORKER_LOOKUP = gff_lookup
+    _WORKER_LOOKUP.warnings.reset()
+
+def _annotate_feature_chunk(lines):
+    """Internal: annotate a chunk of feature data in a worker process
+
+    Arguments:
+      lines: list of feature data lines
+
+    Returns:
+      Tuple (ANNOTATED,NLINES,WARNINGS) where ANNOTATED is the
+      text of the annotated lines, NLINES is the number of lines
+      and WARNINGS is a WarningCounter with the warnings from
+      annotating the chunk.
+    """
+    annotated = ''.join([_annotate_feature_line(_WORKER_LOOKUP,line)
+                         for line in lines])
+    warnings = WarningCounter()
+    warnings.merge(_WORKER_LOOKUP.warnings)
+    _WORKER_LOOKUP.warnings.reset()
+    return (annotated,len(lines),warnings)
+
+def _split_htseq_count_line(line):
+    """Internal: return the name and count from a line of htseq-count output
+
+    Arguments:
+      line: line from an htseq-count file
+
+    Returns:
+      Tuple (NAME,COUNT) where COUNT is the unconverted string.
+    """
+    fields = line.rstrip('\n').split('\t')
+    return (fields[0],fields[1])
+
+def _is_htseq_count_table_start(name):
+    """Internal: check if name is the start of htseq-count trailing table
+    """
+    return name.startswith('no_feature') or name.startswith('__no_feature')
+
+def _iter_htseq_counts_lockstep(htseq_files,table):
+    """Internal: read counts from multiple htseq-count files in lock step
+
+    Reads lines from all the files together, checking that the
+    names agree, and yields the feature ID and the counts from
+    each file for each line. The trailing table data (plus the
+    total counted into genes for each file) is added to the
+    supplied table once all the features have been read.
+
+    Arguments:
+      htseq_files: list of htseq-count files
+      table: OrderedDictionary to populate with the trailing
+        table data (each name referencing a list of values
+        from each file)
+
+    Yields:
+      Tuples of the form (FEATURE_ID,[COUNT1,COUNT2,...]).
+    """
+    fps = [open(f,'rt') for f in htseq_files]
+    totals = [0]*len(htseq_files)
+    reading_feature_counts = True
+    lineno = 0
+    try:
+        while True:
+            lines = [fp.readline() for fp in fps]
+            lineno += 1
+            if not any(lines):
+                # Reached the end of all files
+                break
+            for htseqfile,line in zip(htseq_files,lines):
+                if not line:
+                    raise Exception("%s: unexpected end of file at "
+                                    "line %d" % (htseqfile,lineno))
+            fields = [_split_htseq_count_line(line) for line in lines]
+            name = fields[0][0]
+            for htseqfile,field in zip(htseq_files,fields):
+                if field[0] != name:
+                    raise Exception("%s: '%s' on line %d doesn't match "
+                                    "'%s' in %s" % (htseqfile,
+                                                    field[0],
+                                                    lineno,
+                                                    name,
+                                                    htseq_files[0]))
+            counts = [int(field[1]) for field in fields]
+            # Check if we've encountered the trailing table
+            if _is_htseq_count_table_start(name):
+                reading_feature_counts = False
+            if reading_feature_counts:
+                for i,count in enumerate(counts):
+                    totals[i] += count
+                yield (name,counts)
+            else:
+                table[name] = counts
+    finally:
+        for fp in fps:
+            fp.close()
+    table.insert(0,'total_counted_into_genes',totals)
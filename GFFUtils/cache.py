@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+#
+#     cache.py: content-addressed cache for intermediate results
+#     Copyright (C) University of Manchester 2020 Peter Briggs
+#
+
+"""
+Content-addressed cache for the results of processing stages.
+
+Each cache entry is identified by a key, which is a hash of
+everything that determines the result of the stage (e.g. the
+contents of the input files, the options and the key of the
+previous stage), along with the GFFUtils and Python versions.
+If any of the inputs change then so does the key, so entries
+never need to be invalidated explicitly.
+
+An entry can hold a Python object (stored using 'pickle') and
+any number of named files, e.g.
+
+>>> cache = StageCache("/path/to/cache")
+>>> key = cache.key(cache.file_digest("my.gff"),"--clean")
+>>> gff_data = cache.load(key)
+>>> if gff_data is None:
+...    gff_data = clean(GFFFile("my.gff"))
+...    cache.save(key,data=gff_data)
+
+Entries are written to a temporary directory which is then
+renamed, so processes sharing a cache never see a partially
+written entry.
+
+NB objects are loaded using 'pickle', so only use cache
+directories which are trusted.
+"""
+
+import os
+import sys
+import shutil
+import hashlib
+import logging
+import tempfile
+try:
+    # Python 2
+    import cPickle as pickle
+except ImportError:
+    # Python 3
+    import pickle
+from . import get_version
+
+#######################################################################
+# Constants
+#######################################################################
+
+# Name of the file used to store the object for an entry
+DATA_FILE = "data.pickle"
+
+# Size of blocks to read when computing file digests
+DIGEST_BLOCK_SIZE = 1024*1024
+
+#######################################################################
+# Classes
+#######################################################################
+
+class StageCache(object):
+    """
+    Cache of stage results in a local directory
+
+    Entries are stored in subdirectories of the cache
+    directory called '<KEY[:2]>/<KEY>'.
+    """
+    def __init__(self,cache_dir):
+        """
+        Create a new StageCache instance
+
+        Arguments:
+          cache_dir: path to the cache directory (will be
+            created if it doesn't exist)
+        """
+        self.__cache_dir = os.path.abspath(cache_dir)
+        self.__digests = {}
+        if not os.path.isdir(self.__cache_dir):
+            os.makedirs(self.__cache_dir)
+
+    @property
+    def cache_dir(self):
+        """
+        Return the path to the cache directory
+        """
+        return self.__cache_dir
+
+    def key(self,*parts):
+        """
+        Return a key for a cache entry
+
+        The key is the SHA-256 hash of the parts (which are
+        converted to strings) plus the GFFUtils and Python
+        versions.
+
+        Arguments:
+          parts: the values which determine the result
+            stored in the entry
+        """
+        h = hashlib.sha256()
+        for part in ("GFFUtils %s" % get_version(),
+                     "Python %d" % sys.version_info[0]) + parts:
+            h.update(str(part).encode('utf-8'))
+            h.update(b'\0')
+        return h.hexdigest()
+
+    def file_digest(self,filen):
+        """
+        Return the SHA-256 hash of the contents of a file
+
+        Digests are remembered (keyed by the path, size and
+        modification time of the file), so each file is only
+        read once.
+
+        Arguments:
+          filen: path to the file
+        """
+        filen = os.path.abspath(filen)
+        st = os.stat(filen)
+        file_id = (filen,st.st_size,st.st_mtime)
+        try:
+            return self.__digests[file_id]
+        except KeyError:
+            pass
+        h = hashlib.sha256()
+        with open(filen,'rb') as fp:
+            while True:
+                block = fp.read(DIGEST_BLOCK_SIZE)
+                if not block:
+                    break
+                h.update(block)
+        digest = h.hexdigest()
+        self.__digests[file_id] = digest
+        return digest
+
+    def path(self,key):
+        """
+        Return the path to the directory for an entry
+
+        Arguments:
+          key: key for the entry
+        """
+        return os.path.join(self.__cache_dir,key[:2],key)
+
+    def has(self,key):
+        """
+        Check if there is an entry for a key
+
+        Arguments:
+          key: key for the entry
+        """
+        return os.path.isdir(self.path(key))
+
+    def load(self,key):
+        """
+        Return the object stored in an entry
+
+        Arguments:
+          key: key for the entry
+
+        Returns:
+          The stored object, or None if there is no entry
+          or the entry doesn't have an object (or it can't
+          be loaded).
+        """
+        data_file = os.path.join(self.path(key),DATA_FILE)
+        if not os.path.exists(data_file):
+            return None
+        try:
+            with open(data_file,'rb') as fp:
+                return pickle.load(fp)
+        except Exception as ex:
+            logging.warning("Failed to load cache entry %s: %s" % (key,ex))
+            return None
+
+    def file(self,key,name):
+        """
+        Return the path to a file stored in an entry
+
+        Arguments:
+          key: key for the entry
+          name: name the file was stored under
+
+        Returns:
+          Path to the file, or None if there is no entry or
+          the entry doesn't have the file.
+        """
+        filen = os.path.join(self.path(key),name)
+        if os.path.exists(filen):
+            return filen
+        return None
+
+    def remove(self,key):
+        """
+        Remove an entry (e.g. if it can't be loaded)
+
+        Arguments:
+          key: key for the entry
+        """
+        if self.has(key):
+            shutil.rmtree(self.path(key),ignore_errors=True)
+
+    def save(self,key,data=None,files=None):
+        """
+        Store an object and/or files in an entry
+
+        If there is already an entry for the key then it is
+        left unchanged.
+
+        Arguments:
+          key: key for the entry
+          data: (optional) object to store
+          files: (optional) dictionary mapping names to paths
+            of files to copy into the entry
+        """
+        if self.has(key):
+            return
+        entry_dir = self.path(key)
+        parent_dir = os.path.dirname(entry_dir)
+        if not os.path.isdir(parent_dir):
+            try:
+                os.makedirs(parent_dir)
+            except OSError:
+                # Created by another process
+                pass
+        tmp_dir = tempfile.mkdtemp(prefix=".tmp.",dir=parent_dir)
+        try:
+            if data is not None:
+                with open(os.path.join(tmp_dir,DATA_FILE),'wb') as fp:
+                    pickle.dump(data,fp,pickle.HIGHEST_PROTOCOL)
+            if files:
+                for name in files:
+                    shutil.copyfile(files[name],os.path.join(tmp_dir,name))
+            os.rename(tmp_dir,entry_dir)
+        except OSError:
+            # Entry was created by another process
+            if not self.has(key):
+                raise
+        finally:
+            if os.path.exists(tmp_dir):
+                shutil.rmtree(tmp_dir)
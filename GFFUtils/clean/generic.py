@@ -70,6 +70,92 @@ def GFFUpdateAttributes(gff_data,update_keys={},exclude_keys=[],
             del(attributes.nokeys()[:])
         logging.debug("Updated data for output: %s" % data['attributes'])
 
+def GFFCompileAttributeRules(rules):
+    """
+    Compile a list of attribute rules into a single function
+
+    Each rule is a tuple where the first item is the name
+    of the operation and any remaining items are the
+    arguments for that operation:
+
+    - ('update',update_keys,no_empty_values): replace the
+      values of keys by copying from other keys in the same
+      line (see 'GFFUpdateAttributes' for details of the
+      arguments)
+    - ('exclude',exclude_keys): remove the keys in the
+      supplied list
+    - ('exclude_nokeys',): remove any 'nokeys' data
+    - ('decode',): turn off percent encoding of attribute
+      values on output (see 'GFFDecodeAttributes')
+
+    The rules are applied in the order that they appear in
+    the list; consecutive 'exclude' rules are merged.
+
+    Arguments:
+      rules: list of rule tuples
+
+    Returns:
+      Function which takes a GFFAttributes object and applies
+        all the rules to it in place.
+    """
+    # Check the logging level once rather than formatting
+    # debug messages for every record
+    debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+    operations = []
+    exclude_keys = None
+    for rule in rules:
+        name = rule[0]
+        if name == 'exclude':
+            # Accumulate keys for consecutive exclusions
+            if exclude_keys is None:
+                exclude_keys = []
+                operations.append(_exclude_keys_operation(exclude_keys,
+                                                          debug))
+            exclude_keys.extend([key for key in rule[1]
+                                 if key not in exclude_keys])
+            continue
+        exclude_keys = None
+        if name == 'update':
+            operations.append(_update_keys_operation(rule[1],rule[2],
+                                                     debug))
+        elif name == 'exclude_nokeys':
+            operations.append(_exclude_nokeys_operation)
+        elif name == 'decode':
+            operations.append(_decode_operation)
+        else:
+            raise ValueError("Unrecognised attribute rule '%s'" % name)
+    def apply_rules(attributes):
+        for operation in operations:
+            operation(attributes)
+    return apply_rules
+
+def GFFApplyAttributeRules(gff_data,rules):
+    """
+    Apply a list of attribute rules in a single pass
+
+    The rules are compiled using 'GFFCompileAttributeRules'
+    and then applied to the attributes of each record in
+    turn, so that all the updates are made in one pass over
+    the data (rather than one pass per operation).
+
+    Arguments:
+      gff_data: a GFFFile object containing the GFF file
+        data (which is modified in place)
+      rules: list of rule tuples (see
+        'GFFCompileAttributeRules')
+
+    Returns:
+      The modified GFFFile object.
+    """
+    apply_rules = GFFCompileAttributeRules(rules)
+    debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+    for data in gff_data:
+        apply_rules(data['attributes'])
+        if debug:
+            logging.debug("Updated data for output: %s" %
+                          data['attributes'])
+    return gff_data
+
 def GFFAddExonIDs(gff_data):
     """
     Construct and insert a ID attribute for exons
@@ -172,3 +258,63 @@ def GFFDecodeAttributes(gff_data):
         attributes = record['attributes']
         attributes.encode(False)
     return gff_data
+
+#######################################################################
+# Internal functions
+#######################################################################
+
+def _update_keys_operation(update_keys,no_empty_values,debug):
+    """
+    Internal: return function replacing attribute values
+
+    NB the keys are updated in the order that they appear in
+    the attributes (as for 'GFFUpdateAttributes'), since the
+    result can depend on the order when keys are updated from
+    other keys which are themselves updated.
+    """
+    def update(attributes):
+        for key in attributes.keys():
+            try:
+                lookup_key = update_keys[key]
+            except KeyError:
+                # No mapping found for key, ignore
+                continue
+            try:
+                new_value = attributes[lookup_key]
+            except KeyError:
+                logging.warning("Cannot update value of attribute '%s': "
+                                "replacement attribute '%s' not found" %
+                                (key,lookup_key))
+                continue
+            if no_empty_values and new_value == '':
+                # If new value is empty then don't replace
+                if debug:
+                    logging.debug("Not replacing '%s' with empty value "
+                                  "'%s'" % (key,lookup_key))
+            else:
+                attributes[key] = new_value
+    return update
+
+def _exclude_keys_operation(exclude_keys,debug):
+    """
+    Internal: return function removing attributes
+    """
+    def exclude(attributes):
+        for key in exclude_keys:
+            if key in attributes:
+                del(attributes[key])
+                if debug:
+                    logging.debug("Excluding %s" % key)
+    return exclude
+
+def _exclude_nokeys_operation(attributes):
+    """
+    Internal: remove 'nokeys' data from attributes
+    """
+    del(attributes.nokeys()[:])
+
+def _decode_operation(attributes):
+    """
+    Internal: turn off percent encoding for attributes
+    """
+    attributes.encode(False)
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+#
+#     clean.pipeline: run multiple stages of cleaning operations
+#     Copyright (C) University of Manchester 2020 Peter Briggs
+#
+
+import time
+import logging
+
+#######################################################################
+# Classes
+#######################################################################
+
+class CleaningPipeline(object):
+    """
+    Run an ordered list of cleaning stages on GFF data
+
+    A CleaningPipeline runs a sequence of 'stages' on the
+    same in-memory GFF data, so that the data only has to
+    be read from file and written back out once however
+    many stages there are.
+
+    Each stage is a function which takes the GFF data as
+    its first argument, and which returns the updated data
+    (or None, if the data was modified in place), e.g.
+
+    >>> pipeline = CleaningPipeline()
+    >>> pipeline.add_stage("add exon IDs",GFFAddExonIDs)
+    >>> pipeline.add_stage("decode",GFFDecodeAttributes)
+    >>> gff_data = pipeline.run(GFFFile("my.gff"))
+
+    The time taken for each stage is recorded and can be
+    retrieved via the 'timings' method after the pipeline
+    has been run.
+
+    Optionally the data can be written to a 'checkpoint'
+    file after each stage.
+
+    The pipeline can also be started part way through (for
+    example, with data restored from a cache of the results
+    of earlier stages), and a function can be supplied which
+    is called after each stage (for example, to update the
+    cache).
+    """
+    def __init__(self,checkpoint_base=None):
+        """
+        Create a new CleaningPipeline instance
+
+        Arguments:
+          checkpoint_base: if set then the GFF data will be
+            written to a file called '<BASE>_stage<N>.gff'
+            after each stage (where N is the stage number,
+            starting from 1)
+        """
+        self.__stages = []
+        self.__timings = []
+        self.__first_stage = 1
+        self.__checkpoint_base = checkpoint_base
+
+    def add_stage(self,name,func,*args,**kws):
+        """
+        Append a stage to the pipeline
+
+        Arguments:
+          name: name to identify the stage
+          func: function to run for the stage; it will be
+            invoked as 'func(gff_data,*args,**kws)'
+          args: (optional) additional positional arguments
+            to supply to the function
+          kws: (optional) additional keyword arguments to
+            supply to the function
+        """
+        self.__stages.append((name,func,args,kws))
+
+    def stages(self):
+        """
+        Return the names of the stages in the pipeline
+        """
+        return [stage[0] for stage in self.__stages]
+
+    def checkpoint_file(self,n):
+        """
+        Return the name of the checkpoint file for a stage
+
+        Arguments:
+          n: the stage number (starting from 1)
+
+        Returns:
+          Name of the checkpoint file, or None if checkpoints
+            are not enabled.
+        """
+        if self.__checkpoint_base is None:
+            return None
+        return "%s_stage%d.gff" % (self.__checkpoint_base,n)
+
+    def run(self,gff_data,first_stage=1,after_stage=None):
+        """
+        Run the stages in order on the GFF data
+
+        Arguments:
+          gff_data: GFFFile object with the data to process
+          first_stage: (optional) number of the stage to
+            start from (starting from 1); the data should be
+            the output from the preceding stage
+          after_stage: (optional) function which is called
+            after each stage, and which is invoked as
+            'after_stage(n,name,gff_data)' (where n is the
+            stage number, starting from 1)
+
+        Returns:
+          The GFFFile object after the final stage.
+        """
+        self.__timings = []
+        self.__first_stage = first_stage
+        nstages = len(self.__stages)
+        for i,stage in enumerate(self.__stages,start=1):
+            if i < first_stage:
+                continue
+            name,func,args,kws = stage
+            if nstages > 1:
+                print("Stage %d/%d: %s" % (i,nstages,name))
+            start_time = time.time()
+            result = func(gff_data,*args,**kws)
+            if result is not None:
+                gff_data = result
+            self.__timings.append((name,time.time()-start_time))
+            checkpoint_file = self.checkpoint_file(i)
+            if checkpoint_file:
+                print("Writing checkpoint file %s" % checkpoint_file)
+                gff_data.write(checkpoint_file)
+            if after_stage is not None:
+                after_stage(i,name,gff_data)
+        return gff_data
+
+    def timings(self):
+        """
+        Return the times taken for each stage in the last run
+
+        Returns:
+          List of tuples of the form (NAME,SECONDS).
+        """
+        return [t for t in self.__timings]
+
+    def report(self):
+        """
+        Print a summary of the time taken by each stage
+        """
+        print("Stage timings:")
+        for i,timing in enumerate(self.__timings,start=self.__first_stage):
+            name,elapsed = timing
+            print("\t%d\t%.2fs\t%s" % (i,elapsed,name))
+        print("\tTotal\t%.2fs" % sum([t[1] for t in self.__timings]))
@@ -8,6 +8,72 @@ import logging
 from ..GFFFile import GFFID
 from ..GFFFile import OrderedDictionary
 
+#######################################################################
+# Classes
+#######################################################################
+
+class IndexedMappingData(object):
+    """
+    Mapping data with genes indexed by name
+
+    Wraps a TabFile with mapping data (i.e. with columns
+    'name','chr','start','end','strand') and builds an index
+    of the genes by name, so that looking up the genes which
+    match an SGD name doesn't require a search of all the
+    mapping data.
+
+    The object can be used in place of the TabFile by the
+    'GFFResolveDuplicateSGDs' and 'GFFInsertMissingGenes'
+    functions. As the mapping data is only read, the same
+    object can be shared when cleaning multiple GFF files.
+    """
+    def __init__(self,mapping_data):
+        """
+        Create a new IndexedMappingData instance
+
+        Arguments:
+          mapping_data: a TabFile object containing the
+            mapping data
+        """
+        self.__mapping_data = mapping_data
+        self.__index = {}
+        for gene in mapping_data:
+            name = gene['name']
+            try:
+                self.__index[name].append(gene)
+            except KeyError:
+                self.__index[name] = [gene]
+
+    def lookup(self,key,value):
+        """
+        Return genes where the value of a column matches
+
+        Lookups on the 'name' column use the index; other
+        columns fall back to a search of the mapping data.
+
+        Arguments:
+          key: name of the column to match
+          value: value to match
+
+        Returns:
+          List of matching genes.
+        """
+        if key == 'name':
+            return [gene for gene in self.__index.get(value,[])]
+        return self.__mapping_data.lookup(key,value)
+
+    def filename(self):
+        """
+        Return the name of the file the mapping data came from
+        """
+        return self.__mapping_data.filename()
+
+    def __iter__(self):
+        return iter(self.__mapping_data)
+
+    def __len__(self):
+        return len(self.__mapping_data)
+
 #######################################################################
 # Functions
 #######################################################################
@@ -48,12 +48,13 @@ import sys
 import os
 import glob
 import logging
+import tempfile
 from argparse import ArgumentParser
-from ..GFFFile import GFFFile
-from ..GTFFile import GTFFile
-from ..annotation import GFFAnnotationLookup
-from ..annotation import annotate_htseq_count_data
-from ..annotation import annotate_feature_data
+from .profiling import add_profile_option
+from .profiling import start_profiling
+
+# Name of the lookup database file in cache entries
+LOOKUP_DB_FILE = "lookup.db"
 
 # Main program
 #
@@ -76,7 +77,9 @@ def main():
                        "counted etc (in <GFF_FILE>_annot_stats.txt).")
     p.add_argument('-v','--version',action='version',version=__version__)
     p.add_argument('gff_file',metavar="GFF_FILE",
-                   help="GFF or GTF file to get annotation data from")
+                   help="GFF or GTF file to get annotation data from "
+                   "(or a lookup database previously created using "
+                   "--save-lookup)")
     p.add_argument('feature_files',metavar="FEATURE_FILE",nargs="+",
                    help="feature data to annotate; should be either "
                    "tab-delimited data, or output from htseq-count (if "
@@ -99,8 +102,90 @@ def main():
                    default=False,
                    help="htseq-count mode: input is one or more FEATURE_FILEs "
                    "output from htseq-count")
+    p.add_argument('--stream',action="store_true",dest="stream",
+                   default=False,
+                   help="htseq-count mode only: read the FEATURE_FILEs "
+                   "together line by line rather than loading them into "
+                   "memory (requires that all the files list the same "
+                   "features in the same order)")
+    p.add_argument('-j','--threads',action='store',type=int,
+                   dest='nthreads',default=1,
+                   help="number of threads/processes to use: in the "
+                   "default mode the FEATURE_FILE is split into chunks "
+                   "which are annotated in parallel by this many "
+                   "processes; in htseq-count mode this is the number of "
+                   "threads used to read the FEATURE_FILEs concurrently "
+                   "(ignored if --stream is specified) (default: 1)")
+    p.add_argument('--restrict-to-features',action="store_true",
+                   dest="restrict_to_features",default=False,
+                   help="only load records from GFF_FILE for the "
+                   "features listed in the FEATURE_FILEs (plus their "
+                   "parents); can reduce the time and memory needed when "
+                   "the FEATURE_FILEs only contain a small subset of the "
+                   "features in a large GFF/GTF")
+    p.add_argument('--save-lookup',action="store",dest="lookup_db",
+                   metavar="DB_FILE",default=None,
+                   help="save the lookup data built from GFF_FILE to "
+                   "SQLite database DB_FILE; DB_FILE can then be used "
+                   "in place of GFF_FILE in subsequent runs, to avoid "
+                   "reprocessing the GFF/GTF data")
+    p.add_argument('--cache-dir',action="store",dest="cache_dir",
+                   metavar="DIR",default=None,
+                   help="store the lookup data built from GFF_FILE in "
+                   "the cache directory DIR, and reuse it on subsequent "
+                   "runs with the same GFF_FILE contents and ID "
+                   "attribute (NB only use cache directories which are "
+                   "trusted)")
+    p.add_argument('--verbose',action="store_true",dest="verbose",
+                   default=False,
+                   help="report each feature as it is annotated, and "
+                   "output every warning individually (default is to "
+                   "report progress periodically and summarise warnings "
+                   "at the end)")
+    p.add_argument('--progress-interval',action="store",
+                   dest="progress_interval",metavar="SECONDS",
+                   type=float,default=10.0,
+                   help="interval in seconds between progress reports "
+                   "when annotating features (default: 10)")
+    p.add_argument('--stats-json',action='store',metavar='FILE',
+                   dest='stats_file',default=None,
+                   help="write the wall time, CPU time, number of records "
+                   "and peak memory for each stage (building the lookup, "
+                   "annotation etc) to FILE in JSON format; the file is "
+                   "updated as each stage starts and finishes, so if the "
+                   "program is killed it shows the stage that was running")
+    p.add_argument('--trace-memory',action='store_true',
+                   dest='trace_memory',
+                   help="also trace the peak memory allocated by Python "
+                   "in each stage for --stats-json (NB this slows down "
+                   "the program significantly)")
+    add_profile_option(p)
     args = p.parse_args()
 
+    # Start profiling
+    if args.profile_file is not None:
+        try:
+            start_profiling(args.profile_file,
+                            prog="gff_annotation_extractor",
+                            input_files=[args.gff_file]+args.feature_files)
+        except ValueError as ex:
+            p.error(str(ex))
+
+    # NB GFFUtils modules are imported here rather than at the
+    # top of the module, to keep startup fast
+    from ..GFFFile import GFFIterator
+    from ..GTFFile import GTFIterator
+    from ..annotation import GFFAnnotationLookup
+    from ..annotation import GFFAnnotationLookupDB
+    from ..annotation import is_annotation_lookup_db
+    from ..annotation import read_feature_ids
+    from ..annotation import find_lookup_ids
+    from ..annotation import id_line_filter
+    from ..annotation import annotate_htseq_count_data
+    from ..annotation import annotate_feature_data
+    from ..instrumentation import StageRecorder
+    from ..cache import StageCache
+
     # Determine what mode to operate in
     htseq_count_mode = args.htseq_count
 
@@ -124,6 +209,18 @@ def main():
     if not htseq_count_mode and len(feature_data_files) > 1:  
         p.error("Expected GFF/GTF file and a single feature data file")
 
+    # Check number of threads
+    if args.nthreads < 1:
+        p.error("Number of threads must be a positive integer")
+
+    # Streaming is only available for htseq-count mode
+    if args.stream and not htseq_count_mode:
+        p.error("--stream can only be used with --htseq-count")
+
+    # Memory tracing is only available with stats output
+    if args.trace_memory and not args.stats_file:
+        p.error("--trace-memory requires --stats-json")
+
     # Feature type being considered
     feature_type = args.feature_type
 
@@ -133,31 +230,154 @@ def main():
     else:
         out_file = os.path.splitext(os.path.basename(gff_file))[0] + "_annot.txt"
 
-    # Process GFF/GTF data
-    print("Reading data from %s" % gff_file)
-    if gff_file.endswith('.gtf'):
-        gff = GTFFile(gff_file)
-    else:
-        gff = GFFFile(gff_file)
-    feature_format = gff.format.upper()
+    # Recorder for the resources used by each stage
+    stats = StageRecorder(trace_memory=args.trace_memory,
+                          stats_file=args.stats_file,
+                          metadata=dict(program="gff_annotation_extractor",
+                                        version=__version__,
+                                        input=gff_file))
+
+    # Look for lookup data from a previous run in the cache
+    restrict_to_features = args.restrict_to_features
+    cache = None
+    cached_db = None
+    if args.cache_dir:
+        if is_annotation_lookup_db(gff_file):
+            logging.warning("--cache-dir is ignored for lookup database")
+        else:
+            if restrict_to_features:
+                logging.warning("--restrict-to-features is ignored when "
+                                "using --cache-dir")
+                restrict_to_features = False
+            cache = StageCache(args.cache_dir)
+            cache_key = cache.key("gff_annotation_extractor lookup",
+                                  cache.file_digest(gff_file),
+                                  gff_file.endswith('.gtf'),
+                                  args.id_attribute)
+            cached_db = cache.file(cache_key,LOOKUP_DB_FILE)
 
-    # Build lookup
-    print("Creating lookup for %s" % feature_format)
-    feature_lookup = GFFAnnotationLookup(gff,
+    if is_annotation_lookup_db(gff_file):
+        # Use previously saved lookup data
+        print("Opening lookup database %s" % gff_file)
+        if args.id_attribute:
+            logging.warning("ID attribute is ignored for lookup "
+                            "database")
+        if args.lookup_db:
+            p.error("--save-lookup can't be used with a lookup database")
+        if args.restrict_to_features:
+            logging.warning("--restrict-to-features is ignored for "
+                            "lookup database")
+        with stats.stage("open lookup database"):
+            feature_lookup = GFFAnnotationLookupDB(gff_file,
+                                                   feature_type=feature_type,
+                                                   verbose=args.verbose)
+    elif cached_db:
+        # Use lookup data from the cache
+        print("Opening cached lookup database %s" % cached_db)
+        with stats.stage("open lookup database"):
+            feature_lookup = GFFAnnotationLookupDB(cached_db,
+                                                   feature_type=feature_type,
+                                                   verbose=args.verbose)
+        if args.lookup_db:
+            print("Saving lookup data to %s" % args.lookup_db)
+            with stats.stage("save lookup"):
+                feature_lookup.save(args.lookup_db)
+    else:
+        # Process GFF/GTF data
+        # NB data is streamed directly into the lookup, which only
+        # keeps the fields needed for annotation; for GTF only the
+        # 'gene' lines are parsed
+        if gff_file.endswith('.gtf'):
+            feature_format = 'gtf'
+        else:
+            feature_format = 'gff'
+        line_filter = None
+        if restrict_to_features:
+            # Only load records for the features of interest
+            if args.lookup_db:
+                p.error("--save-lookup can't be used with "
+                        "--restrict-to-features")
+            print("Collecting feature IDs")
+            with stats.stage("collect feature IDs") as stage:
+                feature_ids = read_feature_ids(feature_data_files,
+                                               htseq_count=htseq_count_mode)
+                lookup_ids = find_lookup_ids(gff_file,feature_ids,
+                                             id_attr=args.id_attribute,
+                                             format=feature_format)
+                stage.records = len(feature_ids)
+            print("Restricting lookup to %d IDs (from %d features)" %
+                  (len(lookup_ids),len(feature_ids)))
+            line_filter = id_line_filter(lookup_ids,
                                          id_attr=args.id_attribute,
-                                         feature_type=feature_type)
+                                         format=feature_format)
+        print("Reading data from %s" % gff_file)
+        if feature_format == 'gtf':
+            gff = GTFIterator(gff_file,feature_types=('gene',),
+                              line_filter=line_filter,
+                              prefetch=True)
+        else:
+            gff = GFFIterator(gff_file,line_filter=line_filter,
+                              prefetch=True)
+        feature_format = feature_format.upper()
+
+        # Build lookup
+        # NB reading the GFF/GTF data happens as the lookup is
+        # built, so is included in this stage
+        print("Creating lookup for %s" % feature_format)
+        with stats.stage("build lookup"):
+            feature_lookup = GFFAnnotationLookup(gff,
+                                                 id_attr=args.id_attribute,
+                                                 feature_type=feature_type,
+                                                 compact=True,
+                                                 verbose=args.verbose)
+
+        # Save lookup data
+        if args.lookup_db:
+            print("Saving lookup data to %s" % args.lookup_db)
+            with stats.stage("save lookup"):
+                feature_lookup.save(args.lookup_db)
+
+        # Store lookup data in the cache
+        if cache is not None:
+            print("Storing lookup data in cache %s" % cache.cache_dir)
+            with stats.stage("save lookup to cache"):
+                if args.lookup_db:
+                    cache.save(cache_key,
+                               files={LOOKUP_DB_FILE:args.lookup_db})
+                else:
+                    fd,db_file = tempfile.mkstemp(suffix=".db")
+                    os.close(fd)
+                    try:
+                        feature_lookup.save(db_file)
+                        cache.save(cache_key,
+                                   files={LOOKUP_DB_FILE:db_file})
+                    finally:
+                        os.remove(db_file)
 
     # Annotate input data
-    if htseq_count_mode:
-        # HTSeq-count mode
-        annotate_htseq_count_data(feature_lookup,
-                                  feature_data_files,
-                                  out_file)
-    else:
-        # Standard mode
-        annotate_feature_data(feature_lookup,
-                              feature_data_files[0],
-                              out_file)
+    with stats.stage("annotate") as stage:
+        if htseq_count_mode:
+            # HTSeq-count mode
+            stage.records = annotate_htseq_count_data(
+                feature_lookup,
+                feature_data_files,
+                out_file,
+                progress_interval=args.progress_interval,
+                stream=args.stream,
+                nthreads=args.nthreads)
+        else:
+            # Standard mode
+            stage.records = annotate_feature_data(
+                feature_lookup,
+                feature_data_files[0],
+                out_file,
+                progress_interval=args.progress_interval,
+                nprocs=args.nthreads)
+
+    # Report the stage statistics
+    if args.stats_file:
+        stats.report()
+        print("Stage statistics written to %s" % args.stats_file)
 
 def GFF3_Annotation_Extractor():
     """
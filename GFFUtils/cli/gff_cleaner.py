@@ -20,20 +20,26 @@ __version__ = get_version()
 
 import os
 import sys
+import shutil
 import logging
+import shlex
+import time
 from argparse import ArgumentParser
-from ..GFFFile import GFFFile
-from ..GFFFile import OrderedDictionary
-from ..clean.sgd import GroupByID
-from ..clean.sgd import GFFGetDuplicateSGDs
-from ..clean.sgd import GFFResolveDuplicateSGDs
-from ..clean.sgd import GFFGroupSGDs
-from ..clean.sgd import GFFInsertMissingGenes
-from ..clean.generic import GFFUpdateAttributes
+from ..clean.generic import GFFApplyAttributeRules
 from ..clean.generic import GFFAddExonIDs
 from ..clean.generic import GFFAddIDAttributes
-from ..clean.generic import GFFDecodeAttributes
-from bcftbx.TabFile import TabFile
+from ..clean.pipeline import CleaningPipeline
+from ..cache import StageCache
+from ..instrumentation import StageRecorder
+from .profiling import add_profile_option
+from .profiling import start_profiling
+# NB modules which depend on bcftbx (i.e. GFFUtils.GFFFile and
+# GFFUtils.clean.sgd) and multiprocessing are imported by the
+# functions which use them, to keep startup fast
+
+# Mapping data loaded from mapping/gene files, keyed by file name
+# (shared by stages and by batch worker processes)
+_MAPPING_DATA = {}
 
 # Main program
 #
@@ -45,13 +51,514 @@ def main():
 
     p = ArgumentParser(description="Utility to perform various 'cleaning' "
                        "operations on a GFF file")
-    p.add_argument('gff_file',metavar="FILE.gff",
-                   help="GFF file to operate on")
+    p.add_argument('gff_files',metavar="FILE.gff",nargs='*',
+                   help="GFF file to operate on (specify multiple files "
+                   "to run in batch mode)")
     p.add_argument('-v','--version',action='version',version=__version__)
     p.add_argument('-o',action='store',dest='output_gff',
                    default=None,
                    help="Name of output GFF file (default is "
-                   "'FILE_clean.gff')")
+                   "'FILE_clean.gff'; not used in batch mode)")
+    add_cleaning_options(p)
+    pipeline = p.add_argument_group("Pipeline options")
+    pipeline.add_argument('--pipeline',action='store',metavar='STAGES_FILE',
+                          dest='pipeline_file',default=None,
+                          help="Run multiple stages of cleaning operations "
+                          "on the input GFF, where STAGES_FILE lists the "
+                          "cleaning options for each stage on a separate "
+                          "line (blank lines and lines starting with '#' "
+                          "are ignored). The GFF is only read and written "
+                          "once regardless of the number of stages. "
+                          "Cannot be combined with other cleaning options")
+    pipeline.add_argument('--checkpoints',action='store_true',
+                          dest='checkpoints',
+                          help="Write the GFF data to 'FILE_stage<n>.gff' "
+                          "after each stage of cleaning operations")
+    pipeline.add_argument('--cache-dir',action='store',metavar='DIR',
+                          dest='cache_dir',default=None,
+                          help="Store the results of each stage of "
+                          "cleaning operations in the cache directory DIR, "
+                          "and reuse them on subsequent runs where the "
+                          "input GFF, mapping files and cleaning options "
+                          "for the stage and all the preceding stages are "
+                          "unchanged (NB only use cache directories which "
+                          "are trusted)")
+    batch = p.add_argument_group("Batch mode options")
+    batch.add_argument('--manifest',action='store',metavar='MANIFEST',
+                       dest='manifest',default=None,
+                       help="Read the names of the GFF files to clean "
+                       "from MANIFEST (one file per line; blank lines "
+                       "and lines starting with '#' are ignored). Implies "
+                       "batch mode")
+    batch.add_argument('-j','--threads',action='store',type=int,
+                       dest='nthreads',default=1,
+                       help="Number of GFF files to clean in parallel in "
+                       "batch mode (default: 1)")
+    batch.add_argument('--summary',action='store',metavar='SUMMARY_FILE',
+                       dest='summary_file',
+                       default='gff_cleaner_summary.txt',
+                       help="Write summary table for batch mode to "
+                       "SUMMARY_FILE (default: 'gff_cleaner_summary.txt')")
+    advanced = p.add_argument_group("Advanced options")
+    advanced.add_argument('--debug',action='store_true',dest='debug',
+                          help="Print debugging information")
+    advanced.add_argument('--stats-json',action='store',metavar='FILE',
+                          dest='stats_file',default=None,
+                          help="Write the wall time, CPU time, number of "
+                          "records and peak memory for each stage (reading, "
+                          "each cleaning operation and writing) to FILE in "
+                          "JSON format. The file is updated as each stage "
+                          "starts and finishes, so if the program is killed "
+                          "it shows the stage that was running (not "
+                          "available in batch mode)")
+    advanced.add_argument('--trace-memory',action='store_true',
+                          dest='trace_memory',
+                          help="Also trace the peak memory allocated by "
+                          "Python in each stage for --stats-json (NB this "
+                          "slows down the program significantly)")
+    add_profile_option(advanced)
+
+    # Process the command line
+    args = p.parse_args()
+
+    # Start profiling
+    if args.profile_file is not None:
+        try:
+            start_profiling(args.profile_file,prog="gff_cleaner",
+                            input_files=args.gff_files+
+                            [args.manifest,args.pipeline_file,
+                             args.mapping_file,args.gene_file])
+        except ValueError as ex:
+            p.error(str(ex))
+
+    # Check for debugging
+    if args.debug:
+        # Turn on debugging output
+        logging.getLogger().setLevel(logging.DEBUG)
+
+    # Input files
+    infiles = [f for f in args.gff_files]
+    if args.manifest:
+        if not os.path.exists(args.manifest):
+            p.error("Manifest file '%s' not found" % args.manifest)
+        infiles.extend(read_manifest(args.manifest))
+    if not infiles:
+        p.error("No input GFF files specified")
+    for infile in infiles:
+        if not os.path.exists(infile):
+            p.error("Input file '%s' not found" % infile)
+    batch_mode = (len(infiles) > 1 or args.manifest is not None)
+    if batch_mode and args.output_gff:
+        p.error("-o cannot be used in batch mode")
+    if batch_mode and args.stats_file:
+        p.error("--stats-json cannot be used in batch mode")
+    if args.trace_memory and not args.stats_file:
+        p.error("--trace-memory requires --stats-json")
+    if args.nthreads < 1:
+        p.error("Number of threads must be a positive integer")
+
+    # Report version
+    print("gffcleaner %s" % __version__)
+
+    # Cleaning stages
+    if args.pipeline_file:
+        if not os.path.exists(args.pipeline_file):
+            p.error("Pipeline file '%s' not found" % args.pipeline_file)
+        if cleaning_options_set(args):
+            p.error("Cleaning options cannot be combined with --pipeline")
+        stages = read_pipeline_stages(args.pipeline_file)
+    else:
+        stages = [('clean',args)]
+
+    # Single file mode
+    if not batch_mode:
+        infile = infiles[0]
+        # Name for output files
+        if not args.output_gff:
+            outbase = os.path.splitext(os.path.basename(infile))[0]
+            outfile = outbase+'_clean.gff'
+        else:
+            outbase = os.path.splitext(os.path.basename(args.output_gff))[0]
+            outfile = args.output_gff
+        # Recorder for the resources used by each stage
+        if args.stats_file:
+            stats = StageRecorder(trace_memory=args.trace_memory,
+                                  stats_file=args.stats_file,
+                                  metadata=dict(program="gff_cleaner",
+                                                version=__version__,
+                                                input=infile))
+        else:
+            stats = None
+        # Cache for the results of each stage
+        if args.cache_dir:
+            cache = StageCache(args.cache_dir)
+        else:
+            cache = None
+        clean_gff_file(infile,outfile,outbase,stages,
+                       checkpoints=args.checkpoints,
+                       stats=stats,
+                       cache=cache)
+        if stats is not None:
+            stats.report()
+            print("Stage statistics written to %s" % args.stats_file)
+        return
+
+    # Batch mode: set up a job for each input file
+    jobs = []
+    outbases = set()
+    for infile in infiles:
+        outbase = os.path.splitext(os.path.basename(infile))[0]
+        if outbase in outbases:
+            p.error("Multiple input files would write to '%s_clean.gff'"
+                    % outbase)
+        outbases.add(outbase)
+        jobs.append((infile,outbase+'_clean.gff',outbase,stages,
+                     args.checkpoints,args.cache_dir,
+                     outbase+'_clean.log'))
+    # Load the mapping data once up front so it can be shared
+    for name,options in stages:
+        for filen in (options.mapping_file,options.gene_file):
+            if filen:
+                load_mapping_file(filen)
+    # Run the jobs
+    print("Cleaning %d GFF files (%d in parallel)" % (len(jobs),
+                                                      args.nthreads))
+    if args.nthreads > 1:
+        from multiprocessing import Pool
+        pool = Pool(min(args.nthreads,len(jobs)),
+                    initializer=_init_batch_worker,
+                    initargs=(_MAPPING_DATA,))
+        try:
+            summaries = pool.map(_run_batch_job,jobs,chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        summaries = [_run_batch_job(job) for job in jobs]
+    # Report and write the summary table
+    write_batch_summary(summaries,args.summary_file)
+    if [s for s in summaries if s['status'] != 'OK']:
+        logging.error("Cleaning failed for one or more GFF files (see "
+                      "summary and logs)")
+        sys.exit(1)
+
+def clean_gff_file(infile,outfile,outbase,stages,checkpoints=False,
+                   stats=None,cache=None):
+    """
+    Read a GFF file, perform cleaning stages and write the result
+
+    Arguments:
+      infile (str): input GFF file
+      outfile (str): output GFF file
+      outbase (str): base name for auxiliary output files
+      stages (list): list of (NAME,OPTIONS) tuples defining
+        the cleaning stages (see 'read_pipeline_stages')
+      checkpoints (bool): if True then write a checkpoint GFF
+        file after each stage
+      stats (StageRecorder): (optional) if supplied then
+        record the resources used by reading, each cleaning
+        operation and writing
+      cache (StageCache): (optional) if supplied then the
+        results of each stage are stored in the cache, and
+        the results of the leading stages are restored from
+        the cache (rather than being recomputed) if the input
+        and options for those stages are unchanged
+
+    Returns:
+      Dictionary: summary data with the keys 'input', 'output',
+        'records_in', 'records_out' and 'time'.
+    """
+    from ..GFFFile import GFFFile
+    start_time = time.time()
+    if stats is None:
+        stats = StageRecorder()
+    print("Input : %s" % infile)
+    print("Output: %s" % outfile)
+
+    # Set up the cleaning stages
+    if checkpoints:
+        checkpoint_base = outbase
+    else:
+        checkpoint_base = None
+    pipeline = CleaningPipeline(checkpoint_base=checkpoint_base)
+    for name,options in stages:
+        pipeline.add_stage(name,clean_gff_data,options,outbase,stats=stats)
+
+    # Keys for caching the results of each stage
+    if cache is not None:
+        keys = cache_keys(cache,infile,stages)
+    else:
+        keys = []
+
+    # Restore the results of the leading stages from the
+    # cache, if possible
+    ncached = 0
+    while ncached < len(keys) and cache.has(keys[ncached]):
+        ncached += 1
+    gff_data = None
+    if ncached:
+        with stats.stage("load from cache") as stage:
+            for i in range(ncached):
+                print("Stage %d: reusing cached result" % (i+1))
+                for suffix in auxiliary_files(stages[i][1]):
+                    filen = cache.file(keys[i],suffix)
+                    if filen:
+                        shutil.copyfile(filen,outbase+suffix)
+                # NB the data for the earlier stages are only
+                # loaded if they're needed for checkpoint files
+                checkpoint_file = pipeline.checkpoint_file(i+1)
+                if not checkpoint_file and i < ncached-1:
+                    continue
+                cached = cache.load(keys[i])
+                if cached is None:
+                    logging.warning("Unable to load cached result for "
+                                    "stage %d: rerunning all stages" % (i+1))
+                    cache.remove(keys[i])
+                    gff_data = None
+                    break
+                records_in,gff_data = cached
+                if checkpoint_file:
+                    print("Writing checkpoint file %s" % checkpoint_file)
+                    gff_data.write(checkpoint_file)
+            if gff_data is not None:
+                stage.records = len(gff_data)
+    if gff_data is None:
+        # Read in data from file
+        ncached = 0
+        with stats.stage("parse") as stage:
+            gff_data = GFFFile(infile,prefetch=True)
+            stage.records = len(gff_data)
+        records_in = len(gff_data)
+
+    # Store the results of each stage in the cache
+    def save_stage(n,name,gff_data):
+        with stats.stage("save to cache",records=len(gff_data)):
+            files = dict()
+            for suffix in auxiliary_files(stages[n-1][1]):
+                if os.path.exists(outbase+suffix):
+                    files[suffix] = outbase+suffix
+            cache.save(keys[n-1],data=(records_in,gff_data),files=files)
+
+    # Perform the cleaning
+    if cache is not None:
+        after_stage = save_stage
+    else:
+        after_stage = None
+    gff_data = pipeline.run(gff_data,
+                            first_stage=ncached+1,
+                            after_stage=after_stage)
+    if len(stages) > 1:
+        pipeline.report()
+
+    # Write to output file
+    print("Writing output file %s" % outfile)
+    with stats.stage("write",records=len(gff_data)):
+        gff_data.write(outfile)
+
+    # Return summary
+    return dict(input=infile,
+                output=outfile,
+                records_in=records_in,
+                records_out=len(gff_data),
+                time=time.time()-start_time)
+
+def cache_keys(cache,infile,stages):
+    """
+    Return the keys for caching the results of each stage
+
+    The key for each stage is computed from the key for the
+    preceding stage (or the contents of the input file, for
+    the first stage) and the cleaning options for the stage
+    (using the contents of any mapping or gene files, rather
+    than their names).
+
+    Arguments:
+      cache (StageCache): the cache
+      infile (str): input GFF file
+      stages (list): list of (NAME,OPTIONS) tuples defining
+        the cleaning stages
+
+    Returns:
+      List: list of keys, one for each stage.
+    """
+    p = ArgumentParser(add_help=False)
+    add_cleaning_options(p)
+    options = sorted(vars(p.parse_args([])))
+    keys = []
+    key = cache.key("gff_cleaner input",cache.file_digest(infile))
+    for name,args in stages:
+        signature = []
+        for option in options:
+            value = getattr(args,option)
+            if option in ('mapping_file','gene_file') and value:
+                value = cache.file_digest(value)
+            signature.append("%s=%r" % (option,value))
+        key = cache.key(key,*signature)
+        keys.append(key)
+    return keys
+
+def auxiliary_files(args):
+    """
+    Return the suffixes for auxiliary files written by a stage
+
+    Arguments:
+      args (Namespace): options specifying the cleaning
+        operations for the stage
+
+    Returns:
+      List: list of suffixes which are appended to the base
+        name to get the auxiliary file names.
+    """
+    suffixes = []
+    if args.report_duplicates:
+        suffixes.append('_duplicates.txt')
+    if args.mapping_file is not None:
+        suffixes.append('_discarded.gff')
+        if args.discard_unresolved:
+            suffixes.append('_unresolved.gff')
+    return suffixes
+
+def read_manifest(manifest):
+    """
+    Read the names of GFF files from a manifest file
+
+    Arguments:
+      manifest (str): path to the manifest file
+
+    Returns:
+      List: list of GFF file names.
+    """
+    gff_files = []
+    with open(manifest,'rt') as fp:
+        for line in fp:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                gff_files.append(line)
+    return gff_files
+
+def load_mapping_file(filen):
+    """
+    Return indexed mapping data from a mapping or gene file
+
+    The data are cached, so that each file is only read
+    and indexed once.
+
+    Arguments:
+      filen (str): path to the mapping or gene file
+
+    Returns:
+      IndexedMappingData: the mapping data.
+    """
+    try:
+        return _MAPPING_DATA[filen]
+    except KeyError:
+        from bcftbx.TabFile import TabFile
+        from ..clean.sgd import IndexedMappingData
+        mapping = IndexedMappingData(
+            TabFile(filen,column_names=('name','chr','start','end',
+                                        'strand')))
+        _MAPPING_DATA[filen] = mapping
+        return mapping
+
+def write_batch_summary(summaries,summary_file):
+    """
+    Print and write a summary table for batch mode
+
+    Arguments:
+      summaries (list): list of summary dictionaries
+        returned for each job
+      summary_file (str): file to write the table to
+    """
+    lines = ["input\toutput\trecords_in\trecords_out\ttime\tstatus"]
+    for summary in summaries:
+        lines.append("%s\t%s\t%s\t%s\t%.2f\t%s" %
+                     (summary['input'],
+                      summary['output'],
+                      summary['records_in'],
+                      summary['records_out'],
+                      summary['time'],
+                      summary['status']))
+    print("Summary:")
+    for line in lines:
+        print("\t%s" % line)
+    print("Writing summary to %s" % summary_file)
+    with open(summary_file,'wt') as fp:
+        for line in lines:
+            fp.write("%s\n" % line)
+
+def _init_batch_worker(mapping_data):
+    """
+    Internal: initialise a batch mode worker process
+
+    Makes the mapping data loaded by the parent process
+    available to the worker (if the process was forked then
+    this is the same copy-on-write data).
+    """
+    _MAPPING_DATA.update(mapping_data)
+
+def _run_batch_job(job):
+    """
+    Internal: clean a single GFF file in batch mode
+
+    Output from the cleaning (including logging messages)
+    is written to a log file for the job.
+
+    Arguments:
+      job (tuple): tuple of (INFILE,OUTFILE,OUTBASE,STAGES,
+        CHECKPOINTS,CACHE_DIR,LOG_FILE)
+
+    Returns:
+      Dictionary: summary data (see 'clean_gff_file'), with
+        an additional 'status' key.
+    """
+    infile,outfile,outbase,stages,checkpoints,cache_dir,log_file = job
+    summary = dict(input=infile,
+                   output=outfile,
+                   records_in='',
+                   records_out='',
+                   time=0.0,
+                   status='OK')
+    start_time = time.time()
+    stdout = sys.stdout
+    logger = logging.getLogger()
+    handlers = [h for h in logger.handlers]
+    with open(log_file,'wt') as log:
+        # Redirect stdout and logging to the log file
+        handler = logging.StreamHandler(log)
+        handler.setFormatter(logging.Formatter('%(levelname)s: %(message)s'))
+        for h in handlers:
+            logger.removeHandler(h)
+        logger.addHandler(handler)
+        sys.stdout = log
+        try:
+            print("gffcleaner %s" % __version__)
+            if cache_dir:
+                cache = StageCache(cache_dir)
+            else:
+                cache = None
+            summary.update(clean_gff_file(infile,outfile,outbase,stages,
+                                          checkpoints=checkpoints,
+                                          cache=cache))
+        except Exception as ex:
+            logging.exception("Cleaning failed for %s" % infile)
+            summary['status'] = "FAILED (%s)" % ex
+            summary['time'] = time.time()-start_time
+        finally:
+            # Restore stdout and logging
+            sys.stdout = stdout
+            logger.removeHandler(handler)
+            for h in handlers:
+                logger.addHandler(h)
+    print("%s: %s (log: %s)" % (infile,summary['status'],log_file))
+    return summary
+
+def add_cleaning_options(p):
+    """
+    Add the options for the cleaning operations to a parser
+
+    Arguments:
+      p (ArgumentParser): parser to add the options to
+    """
     generic = p.add_argument_group("General cleaning operations")
     generic.add_argument('--prepend',action='store',metavar='STR',
                          dest='prepend_str',default=None,
@@ -153,25 +660,86 @@ def main():
                         "the input data (equivalent to specifying all of "
                         "--clean-score, --clean-replace-attributes, "
                         "--clean-exclude-attributes and --clean-group-sgds)")
-    advanced = p.add_argument_group("Advanced options")
-    advanced.add_argument('--debug',action='store_true',dest='debug',
-                          help="Print debugging information")
 
-    # Process the command line
-    args = p.parse_args()
+def cleaning_options_set(args):
+    """
+    Check whether any cleaning options have been set
 
-    # Check for debugging
-    if args.debug:
-        # Turn on debugging output
-        logging.getLogger().setLevel(logging.DEBUG)
+    Arguments:
+      args (Namespace): options returned from the parser
+
+    Returns:
+      Boolean: True if any of the cleaning options differ
+        from their defaults, False otherwise.
+    """
+    p = ArgumentParser(add_help=False)
+    add_cleaning_options(p)
+    defaults = p.parse_args([])
+    for option in vars(defaults):
+        if getattr(args,option) != getattr(defaults,option):
+            return True
+    return False
 
-    # Input file
-    infile = args.gff_file
-    if not os.path.exists(infile):
-        p.error("Input file '%s' not found" % infile)
+def read_pipeline_stages(pipeline_file):
+    """
+    Read the cleaning stages from a pipeline file
 
-    # Report version
-    print("gffcleaner %s" % __version__)
+    Each non-blank line in the file which doesn't start with
+    a '#' character defines a stage, and consists of the
+    cleaning options to apply in that stage, e.g.
+
+    # Example pipeline
+    --prepend=Sbay_
+    --clean
+    --report-duplicates --resolve-duplicates=mapping.txt
+    --insert-missing=mapping.txt
+
+    Arguments:
+      pipeline_file (str): path to the pipeline file
+
+    Returns:
+      List: list of tuples of the form (NAME,OPTIONS) for each
+        stage, where NAME is the text of the line defining the
+        stage and OPTIONS is the Namespace from parsing it.
+    """
+    stages = []
+    with open(pipeline_file,'rt') as fp:
+        for i,line in enumerate(fp,start=1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            p = ArgumentParser(prog="%s (line %d)" % (pipeline_file,i),
+                               add_help=False)
+            add_cleaning_options(p)
+            stages.append((line,p.parse_args(shlex.split(line))))
+    return stages
+
+def clean_gff_data(gff_data,args,outbase,stats=None):
+    """
+    Perform cleaning operations on GFF data
+
+    Arguments:
+      gff_data (GFFFile): the GFF data to clean
+      args (Namespace): options specifying the cleaning
+        operations to perform
+      outbase (str): base name for any auxiliary output
+        files (i.e. reports of duplicates and discards)
+      stats (StageRecorder): (optional) if supplied then
+        record the resources used by each operation
+
+    Returns:
+      GFFFile: the cleaned GFF data.
+    """
+    from ..GFFFile import OrderedDictionary
+    from ..clean.sgd import GroupByID
+    from ..clean.sgd import GFFGetDuplicateSGDs
+    from ..clean.sgd import GFFResolveDuplicateSGDs
+    from ..clean.sgd import GFFGroupSGDs
+    from ..clean.sgd import GFFInsertMissingGenes
+
+    # Recorder for the resources used by each operation
+    if stats is None:
+        stats = StageRecorder()
 
     # Set flags based on command line
 
@@ -222,55 +790,50 @@ def main():
     # Remove attributes that don't conform to KEY=VALUE format
     strict_attributes = args.strict_attributes
 
-    # Name for output files
-    if not args.output_gff:
-        outbase = os.path.splitext(os.path.basename(infile))[0]
-        outfile = outbase+'_clean.gff'
-    else:
-        outbase = os.path.splitext(os.path.basename(args.output_gff))[0]
-        outfile = args.output_gff
-    print("Input : %s" % infile)
-    print("Output: %s" % outfile)
+    # Names for auxiliary output files
     dupfile = outbase+'_duplicates.txt'
     delfile = outbase+'_discarded.gff'
     unresfile = outbase+'_unresolved.gff'
 
-    # Read in data from file
-    gff_data = GFFFile(infile)
-
     # Prepend string to seqname column
     if prepend_str is not None:
-        print("Prepending '%s' to values in 'seqname' column" % prepend_str)
-        for data in gff_data:
-            data['seqname'] = prepend_str+str(data['seqname'])
+        with stats.stage("prepend seqname",records=len(gff_data)):
+            print("Prepending '%s' to values in 'seqname' column" % prepend_str)
+            for data in gff_data:
+                data['seqname'] = prepend_str+str(data['seqname'])
 
     # Check/clean score column values
     if clean_score:
-        print("Replacing 'Anc_*' and blanks with '0's in 'score' column")
-        score_unexpected_values = set()
-        for data in gff_data:
-            try:
-                # Numerical value
-                score = float(data['score'])
-                if score != 0:
-                    score_unexpected_values.add(data['score'])
-            except ValueError:
-                # String value
-                if data['score'].startswith('Anc_') or \
-                   data['score'].strip() == '':
-                    # Replace "Anc_*" or blank values in "score"
-                    # column with zero
-                    data['score'] = '0'
-                else:
-                    score_unexpected_values.add(data['score'])
-        # Report unexpected values
-        score_unexpected_values = sorted(list(score_unexpected_values))
-        n = len(score_unexpected_values)
-        if n > 0:
-            logging.warning("%d 'score' values that are not '', 0 or 'Anc_*'" % n)
-            logging.warning("Other values: %s" %
-                            ', '.join([str(x)
-                                       for x in score_unexpected_values]))
+        with stats.stage("clean score",records=len(gff_data)):
+            print("Replacing 'Anc_*' and blanks with '0's in 'score' column")
+            score_unexpected_values = set()
+            for data in gff_data:
+                try:
+                    # Numerical value
+                    score = float(data['score'])
+                    if score != 0:
+                        score_unexpected_values.add(data['score'])
+                except ValueError:
+                    # String value
+                    if data['score'].startswith('Anc_') or \
+                       data['score'].strip() == '':
+                        # Replace "Anc_*" or blank values in "score"
+                        # column with zero
+                        data['score'] = '0'
+                    else:
+                        score_unexpected_values.add(data['score'])
+            # Report unexpected values
+            score_unexpected_values = sorted(list(score_unexpected_values))
+            n = len(score_unexpected_values)
+            if n > 0:
+                logging.warning("%d 'score' values that are not '', 0 or 'Anc_*'" % n)
+                logging.warning("Other values: %s" %
+                                ', '.join([str(x)
+                                           for x in score_unexpected_values]))
+
+    # Rules for updating the data in the "attributes" column are
+    # collected and then applied together in a single pass
+    attribute_rules = []
 
     # Clean up the data in "attributes" column: replace keys
     if clean_replace_attributes:
@@ -287,8 +850,8 @@ def main():
             print("\t%s -> %s" % (key,attributes_key_map[key]))
         if attributes_dont_replace_with_empty_data:
             print("(Replacement will be skipped if new data is missing/blank)")
-        GFFUpdateAttributes(gff_data,attributes_key_map,[],
-                            attributes_dont_replace_with_empty_data)
+        attribute_rules.append(('update',attributes_key_map,
+                                attributes_dont_replace_with_empty_data))
 
     # Clean up the data in "attributes" column: exclude keys
     if clean_exclude_attributes:
@@ -297,43 +860,58 @@ def main():
         print("Excluding keys:")
         for key in attributes_exclude_keys:
             print("\t%s" % key)
-        GFFUpdateAttributes(gff_data,{},attributes_exclude_keys,True)
+        attribute_rules.append(('exclude',attributes_exclude_keys))
+
+    # Operations after this point depend on (or add to) the attribute
+    # data, so apply any pending rules before performing them
+    if attribute_rules and (group_SGDs or
+                            report_duplicates or
+                            resolve_duplicates or
+                            insert_missing or
+                            add_exon_ids or
+                            add_missing_ids):
+        with stats.stage("apply attribute rules",records=len(gff_data)):
+            GFFApplyAttributeRules(gff_data,attribute_rules)
+        attribute_rules = []
 
     # Set the IDs for consecutive lines with matching SGD names, to
     # indicate that they're in the same gene
     if group_SGDs:
-        print("Grouping SGDs by setting ID's for consecutive lines "
-              "with the same SGD values")
-        GFFGroupSGDs(gff_data)
+        with stats.stage("group SGDs",records=len(gff_data)):
+            print("Grouping SGDs by setting ID's for consecutive lines "
+                  "with the same SGD values")
+            GFFGroupSGDs(gff_data)
 
     # Find duplicates in input file
     if report_duplicates or resolve_duplicates:
-        duplicate_sgds = GFFGetDuplicateSGDs(gff_data)
+        with stats.stage("find duplicates",records=len(gff_data)):
+            duplicate_sgds = GFFGetDuplicateSGDs(gff_data)
                 
     if report_duplicates:
-        # Write to duplicates file
-        print("Writing duplicate SGD names to %s" % dupfile)
-        fd = open(dupfile,'w')
-        ndup = 0
-        ngroups = 0
-        for sgd in duplicate_sgds.keys():
-            assert(len(duplicate_sgds[sgd]) > 1)
-            ndup += 1
-            fd.write("%s\t" % sgd)
-            for data in duplicate_sgds[sgd]:
-                # Write the line number, chromosome, start and strand data
-                line = ';'.join(('L'+str(data.lineno()),
-                                 str(data['seqname']),str(data['start']),str(data['end'])))
-                fd.write("\t%s" % line)
-            fd.write("\n")
-            logging.debug("%s\t%s" % (sgd,duplicate_sgds[sgd]))
-            for group in GroupByID(duplicate_sgds[sgd]):
-                if len(group) > 1: ngroups += 1
-        if ndup == 0:
-            fd.write("No duplicate SGDs\n")
-        fd.close()
-        print("%d duplicates found (of which %d are trivial)" %
-              (ndup,ngroups))
+        with stats.stage("report duplicates",records=len(duplicate_sgds)):
+            # Write to duplicates file
+            print("Writing duplicate SGD names to %s" % dupfile)
+            fd = open(dupfile,'w')
+            ndup = 0
+            ngroups = 0
+            for sgd in duplicate_sgds.keys():
+                assert(len(duplicate_sgds[sgd]) > 1)
+                ndup += 1
+                fd.write("%s\t" % sgd)
+                for data in duplicate_sgds[sgd]:
+                    # Write the line number, chromosome, start and strand data
+                    line = ';'.join(('L'+str(data.lineno()),
+                                     str(data['seqname']),str(data['start']),str(data['end'])))
+                    fd.write("\t%s" % line)
+                fd.write("\n")
+                logging.debug("%s\t%s" % (sgd,duplicate_sgds[sgd]))
+                for group in GroupByID(duplicate_sgds[sgd]):
+                    if len(group) > 1: ngroups += 1
+            if ndup == 0:
+                fd.write("No duplicate SGDs\n")
+            fd.close()
+            print("%d duplicates found (of which %d are trivial)" %
+                  (ndup,ngroups))
 
     if resolve_duplicates:
         print("Resolving duplicate SGDs using data from %s" % cdsfile)
@@ -341,11 +919,15 @@ def main():
         # Get data on best gene mappings from CDS file
         # Format is tab-delimited, each line has:
         # orf      chr      start     end      strand
-        mapping = TabFile(cdsfile,column_names=('name','chr','start','end','strand'))
+        with stats.stage("load mapping data") as stage:
+            mapping = load_mapping_file(cdsfile)
+            stage.records = len(mapping)
         # Overlap margin
         overlap_margin = 1000
         # Perform resolution
-        result = GFFResolveDuplicateSGDs(gff_data,mapping,duplicate_sgds,overlap_margin)
+        with stats.stage("resolve duplicates",records=len(duplicate_sgds)):
+            result = GFFResolveDuplicateSGDs(gff_data,mapping,duplicate_sgds,
+                                             overlap_margin)
         #
         # Report the results
         #
@@ -395,40 +977,40 @@ def main():
 
         # Remove discarded duplicates from the data
         print("Removing discarded duplicates and writing to %s" % delfile)
-        fd = open(delfile,'w')
-        for discard_data in discard:
-            try:
-                ip = gff_data.indexByLineNumber(discard_data.lineno())
-                del(gff_data[ip])
-                fd.write("%s\n" % discard_data)
-            except IndexError:
-                logging.warning("Failed to delete line %d: not found" %
-                                discard_data.lineno())
-        fd.close()
+        with stats.stage("remove discarded duplicates",records=len(discard)):
+            fd = open(delfile,'w')
+            for discard_data in discard:
+                try:
+                    gff_data.deleteByLineNumber(discard_data.lineno())
+                    fd.write("%s\n" % discard_data)
+                except IndexError:
+                    logging.warning("Failed to delete line %d: not found" %
+                                    discard_data.lineno())
+            fd.close()
 
         # Remove unresolved duplicates if requested
         if discard_unresolved:
-            print("Removing unresolved duplicates and writing to %s" %
-                  unresfile)
-            # Get list of unresolved SGDs
-            all_unresolved = result['unresolved_sgds']
-            # Get list of unresolved duplicates
-            unresolved = []
-            for data in gff_data:
-                attributes = data['attributes']
-                if 'SGD' in attributes:
-                    if attributes['SGD'] in all_unresolved:
-                        unresolved.append(data)
-            # Discard them
-            fu = open(unresfile,'w')
-            for discard in unresolved:
-                try:
-                    ip = gff_data.indexByLineNumber(discard.lineno())
-                    del(gff_data[ip])
-                    fu.write("%s\n" % discard)
-                except IndexError:
-                    logging.warning("Failed to delete line %d: not found" % discard.lineno())
-            fu.close()
+            with stats.stage("discard unresolved duplicates",records=len(gff_data)):
+                print("Removing unresolved duplicates and writing to %s" %
+                      unresfile)
+                # Get list of unresolved SGDs
+                all_unresolved = result['unresolved_sgds']
+                # Get list of unresolved duplicates
+                unresolved = []
+                for data in gff_data:
+                    attributes = data['attributes']
+                    if 'SGD' in attributes:
+                        if attributes['SGD'] in all_unresolved:
+                            unresolved.append(data)
+                # Discard them
+                fu = open(unresfile,'w')
+                for discard in unresolved:
+                    try:
+                        gff_data.deleteByLineNumber(discard.lineno())
+                        fu.write("%s\n" % discard)
+                    except IndexError:
+                        logging.warning("Failed to delete line %d: not found" % discard.lineno())
+                fu.close()
 
     # Look for "missing" genes in mapping file
     if insert_missing:
@@ -439,33 +1021,38 @@ def main():
         # Get gene data from CDS file
         # Format is tab-delimited, each line has:
         # orf      chr      start     end      strand
-        mapping = TabFile(genefile,column_names=('name','chr','start','end','strand'))
+        with stats.stage("load mapping data") as stage:
+            mapping = load_mapping_file(genefile)
+            stage.records = len(mapping)
         n_genes_before_insert = len(gff_data)
-        gff_data = GFFInsertMissingGenes(gff_data,mapping)
+        with stats.stage("insert missing genes",records=len(mapping)):
+            gff_data = GFFInsertMissingGenes(gff_data,mapping)
         print("Inserted %d missing genes" %
               (len(gff_data) - n_genes_before_insert))
 
     # Construct and insert ID for exons
     if add_exon_ids:
-        print("Inserting artificial IDs for exon records")
-        gff_data = GFFAddExonIDs(gff_data)
+        with stats.stage("add exon IDs",records=len(gff_data)):
+            print("Inserting artificial IDs for exon records")
+            gff_data = GFFAddExonIDs(gff_data)
 
     # Construct and insert missing ID attributes
     if add_missing_ids:
-        print("Inserting generated IDs for records where IDs are missing")
-        gff_data = GFFAddIDAttributes(gff_data)
+        with stats.stage("add missing IDs",records=len(gff_data)):
+            print("Inserting generated IDs for records where IDs are missing")
+            gff_data = GFFAddIDAttributes(gff_data)
 
     # Strip attributes requested for removal
     if args.rm_attr:
         print("Removing the following attributes from all records:")
         for attr in args.rm_attr:
             print("\t* %s" % attr)
-        GFFUpdateAttributes(gff_data,exclude_keys=args.rm_attr)
+        attribute_rules.append(('exclude',args.rm_attr))
 
     # Remove attributes that don't conform to KEY=VALUE format
     if strict_attributes:
         print("Removing attributes that don't conform to KEY=VALUE format")
-        GFFUpdateAttributes(gff_data,exclude_nokeys=True)
+        attribute_rules.append(('exclude_nokeys',))
 
     # Suppress percent encoding of attributes
     if no_attribute_encoding:
@@ -475,11 +1062,15 @@ def main():
                         "encoded in the output  !!!")
         logging.warning("!!! The resulting GFF may not be readable by this "
                         "or other programs !!!")
-        gff_data = GFFDecodeAttributes(gff_data)
+        attribute_rules.append(('decode',))
 
-    # Write to output file
-    print("Writing output file %s" % outfile)
-    gff_data.write(outfile)
+    # Apply the remaining attribute updates in one pass
+    if attribute_rules:
+        with stats.stage("apply attribute rules",records=len(gff_data)):
+            GFFApplyAttributeRules(gff_data,attribute_rules)
+
+    # Finished
+    return gff_data
 
 def GFFcleaner():
     """
@@ -3,12 +3,628 @@
 #     gtf2bed: convert GTF contents to BED format
 #     Copyright (C) University of Manchester 2012,2020 Peter Briggs
 #
+import os
 import sys
+import shutil
 import logging
+import tempfile
 from argparse import ArgumentParser
-from ..GTFFile import GTFIterator
-from ..GFFFile import ANNOTATION
+from array import array
+from collections import OrderedDict
 from .. import get_version
+from .profiling import add_profile_option
+from .profiling import start_profiling
+
+#######################################################################
+# Constants
+#######################################################################
+
+# Maximum number of transcript models held in memory for unsorted
+# input before spilling to temporary files
+MAX_TRANSCRIPT_MODELS = 200000
+
+# Number of temporary files to spill transcript models into
+SPILL_SHARDS = 16
+
+#######################################################################
+# Classes
+#######################################################################
+
+class GeneSpanAggregator(object):
+    """
+    Compute gene and transcript spans from their exons
+
+    Example usage:
+
+    >>> spans = GeneSpanAggregator(fp,transcripts=True)
+    >>> for line in GTFIterator("my.gtf"):
+    ...    spans.add(line)
+    >>> spans.finish()
+
+    The span of each gene (and optionally of each transcript)
+    is extended by each of its exons as they are added. If the
+    GTF also has explicit 'gene' or 'transcript' lines then
+    exons which fall outside of these are reported as
+    warnings.
+
+    If the input is sorted (i.e. all the lines for each gene
+    appear together) then only the data for the current gene
+    are held in memory, and each gene is written out as soon
+    as a line for a different gene is added. Otherwise the
+    spans are written in the order that the genes first
+    appeared once all the lines have been added.
+    """
+    def __init__(self,fp,transcripts=False,sorted_input=False):
+        """
+        Create a new GeneSpanAggregator instance
+
+        Arguments:
+          fp: file-like object to write the spans to
+          transcripts: if True then also write spans for
+            each transcript (after the span of its gene)
+          sorted_input: if True then write out the span for
+            each gene as soon as a line for another gene is
+            added
+        """
+        self.__fp = fp
+        self.__transcripts = transcripts
+        self.__sorted_input = sorted_input
+        self.__genes = OrderedDict()
+        self.__gene_transcripts = dict()
+        self.__current_gene = None
+        self.__written_genes = set()
+        self.__nwritten = 0
+
+    @property
+    def nwritten(self):
+        """
+        Return the number of spans written so far
+        """
+        return self.__nwritten
+
+    def add(self,line):
+        """
+        Add a line of GTF data
+
+        Only 'gene', 'transcript' and 'exon' lines are used;
+        other lines are ignored.
+
+        Arguments:
+          line: GTFDataLine instance
+        """
+        feature = line['feature']
+        if feature not in ('gene','transcript','exon'):
+            return
+        attributes = line['attributes']
+        gene_id = attributes['gene_id']
+        if gene_id is None:
+            logging.warning("L%d: no 'gene_id' attribute, ignored" %
+                            line.lineno())
+            return
+        if self.__sorted_input and gene_id != self.__current_gene:
+            # Moved onto a new gene
+            self.flush()
+            if gene_id in self.__written_genes:
+                logging.warning("L%d: gene '%s' appears again after "
+                                "other genes (input not sorted?)" %
+                                (line.lineno(),gene_id))
+            self.__current_gene = gene_id
+        # Update the span for the gene
+        try:
+            gene = self.__genes[gene_id]
+        except KeyError:
+            gene = _Span(attributes['gene_name'] or gene_id,'gene')
+            self.__genes[gene_id] = gene
+            self.__gene_transcripts[gene_id] = OrderedDict()
+        if feature == 'gene':
+            gene.declare(line)
+            return
+        if feature == 'exon':
+            gene.extend(line)
+        if not self.__transcripts:
+            return
+        # Update the span for the transcript
+        transcript_id = attributes['transcript_id']
+        if transcript_id is None:
+            logging.warning("L%d: no 'transcript_id' attribute for "
+                            "%s" % (line.lineno(),feature))
+            return
+        transcripts = self.__gene_transcripts[gene_id]
+        try:
+            transcript = transcripts[transcript_id]
+        except KeyError:
+            transcript = _Span(attributes['transcript_name'] or
+                               transcript_id,'transcript')
+            transcripts[transcript_id] = transcript
+        if feature == 'transcript':
+            transcript.declare(line)
+        else:
+            transcript.extend(line)
+
+    def flush(self):
+        """
+        Write out the spans for all the genes held in memory
+        """
+        for gene_id in self.__genes:
+            self.__write(self.__genes[gene_id])
+            transcripts = self.__gene_transcripts[gene_id]
+            for transcript_id in transcripts:
+                self.__write(transcripts[transcript_id])
+            if self.__sorted_input:
+                self.__written_genes.add(gene_id)
+        self.__genes = OrderedDict()
+        self.__gene_transcripts = dict()
+
+    def finish(self):
+        """
+        Write out any remaining spans
+        """
+        self.flush()
+        self.__current_gene = None
+
+    def __write(self,span):
+        # Internal: write the data for a span
+        if span.start is None:
+            logging.warning("%s '%s': no exons or %s line, ignored" %
+                            (span.feature,span.name,span.feature))
+            return
+        self.__fp.write("%s\t%s\t%d\t%d\t%s\t%s\n" % (span.name,
+                                                     span.seqname,
+                                                     span.start,
+                                                     span.end,
+                                                     span.strand,
+                                                     span.feature))
+        self.__nwritten += 1
+
+class _Span(object):
+    """
+    Internal: span of a gene or transcript
+
+    The span is extended by each exon added, and is also
+    checked against the start and end of any explicit 'gene'
+    or 'transcript' line.
+    """
+    __slots__ = ('name','feature','seqname','strand','start','end',
+                 'declared')
+
+    def __init__(self,name,feature):
+        self.name = name
+        self.feature = feature
+        self.seqname = None
+        self.strand = None
+        self.start = None
+        self.end = None
+        self.declared = None
+
+    def declare(self,line):
+        # Set the declared start and end from a gene or
+        # transcript line
+        self.declared = (line['start'],line['end'])
+        if self.start is None:
+            self.seqname = line['seqname']
+            self.strand = line['strand']
+            self.start,self.end = self.declared
+            return
+        # Check the exons that have already been added
+        self.check(line,self.start,self.end)
+        self.start,self.end = self.declared
+
+    def extend(self,line):
+        # Extend the span to include an exon
+        if self.start is None:
+            self.seqname = line['seqname']
+            self.strand = line['strand']
+            self.start = line['start']
+            self.end = line['end']
+        else:
+            if line['seqname'] != self.seqname or \
+               line['strand'] != self.strand:
+                logging.warning("L%d: %s '%s': exon on %s%s, expected "
+                                "%s%s" % (line.lineno(),self.feature,
+                                          self.name,line['seqname'],
+                                          line['strand'],self.seqname,
+                                          self.strand))
+            if self.declared is not None:
+                self.check(line,line['start'],line['end'])
+            else:
+                self.start = min(self.start,line['start'])
+                self.end = max(self.end,line['end'])
+
+    def check(self,line,start,end):
+        # Check that exons lie within the declared span
+        declared_start,declared_end = self.declared
+        if start < declared_start:
+            logging.warning("L%d: %s '%s': exon start is before %s "
+                            "start (%s < %s)" % (line.lineno(),
+                                                 self.feature,
+                                                 self.name,
+                                                 self.feature,
+                                                 start,
+                                                 declared_start))
+        if end > declared_end:
+            logging.warning("L%d: %s '%s': exon end is after %s end "
+                            "(%s > %s)" % (line.lineno(),
+                                           self.feature,
+                                           self.name,
+                                           self.feature,
+                                           end,
+                                           declared_end))
+
+class TranscriptModel(object):
+    """
+    Compact model of a transcript built from its exons and CDS
+
+    The exon coordinates are stored in integer arrays, and the
+    coding region is the range covered by the CDS, start_codon
+    and stop_codon records added to the model.
+
+    Example usage:
+
+    >>> t = TranscriptModel("ENST0001","chr1","+")
+    >>> t.add_exon(1001,1200)
+    >>> t.add_exon(1501,1800)
+    >>> t.add_cds(1101,1600)
+    >>> print(t.bed12())
+    """
+    __slots__ = ('transcript_id','seqname','strand','exon_starts',
+                 'exon_ends','cds_start','cds_end')
+
+    def __init__(self,transcript_id,seqname,strand):
+        """
+        Create a new TranscriptModel instance
+
+        Arguments:
+          transcript_id: ID for the transcript
+          seqname: name of the chromosome/sequence
+          strand: strand of the transcript ('+' or '-')
+        """
+        self.transcript_id = transcript_id
+        self.seqname = seqname
+        self.strand = strand
+        self.exon_starts = array('l')
+        self.exon_ends = array('l')
+        self.cds_start = None
+        self.cds_end = None
+
+    def add_exon(self,start,end):
+        """
+        Add an exon (1-based inclusive coordinates)
+        """
+        self.exon_starts.append(start)
+        self.exon_ends.append(end)
+
+    def add_cds(self,start,end):
+        """
+        Extend the coding region (1-based inclusive coordinates)
+        """
+        if self.cds_start is None:
+            self.cds_start = start
+            self.cds_end = end
+        else:
+            self.cds_start = min(self.cds_start,start)
+            self.cds_end = max(self.cds_end,end)
+
+    def segments(self):
+        """
+        Return the exons and coding region as a list of tuples
+
+        Returns:
+          List of tuples (KIND,START,END) where KIND is 'exon'
+          or 'CDS'.
+        """
+        segments = [('exon',start,end) for start,end in
+                    zip(self.exon_starts,self.exon_ends)]
+        if self.cds_start is not None:
+            segments.append(('CDS',self.cds_start,self.cds_end))
+        return segments
+
+    def bed12(self):
+        """
+        Return the transcript as a line of BED12 data
+
+        Returns:
+          BED12 line (without trailing newline), or None if
+          the transcript has no exons.
+        """
+        if not self.exon_starts:
+            return None
+        exons = sorted(zip(self.exon_starts,self.exon_ends))
+        chrom_start = exons[0][0] - 1
+        chrom_end = max([end for start,end in exons])
+        if self.cds_start is not None:
+            thick_start = self.cds_start - 1
+            thick_end = self.cds_end
+        else:
+            thick_start = chrom_end
+            thick_end = chrom_end
+        return "%s\t%d\t%d\t%s\t0\t%s\t%d\t%d\t0\t%d\t%s,\t%s," % \
+            (self.seqname,
+             chrom_start,
+             chrom_end,
+             self.transcript_id,
+             self.strand,
+             thick_start,
+             thick_end,
+             len(exons),
+             ','.join([str(end-start+1) for start,end in exons]),
+             ','.join([str(start-1-chrom_start) for start,end in exons]))
+
+class TranscriptModelBuilder(object):
+    """
+    Build transcript models from GTF data and write as BED12
+
+    Example usage:
+
+    >>> models = TranscriptModelBuilder(fp,sorted_input=True)
+    >>> for line in GTFIterator("my.gtf"):
+    ...    models.add(line)
+    >>> models.finish()
+
+    Exon, CDS, start_codon and stop_codon lines are grouped
+    by their 'transcript_id' attribute into TranscriptModel
+    instances.
+
+    If the input is sorted (i.e. all the lines for each gene
+    appear together) then the transcripts for each gene are
+    written as soon as a line for a different gene is added.
+
+    Otherwise the models are held in memory and written in
+    the order that the transcripts first appeared. If the
+    number of models exceeds a limit then they are spilled
+    into temporary files (each of which holds a subset of the
+    transcripts), and the models are rebuilt and written one
+    file at a time by 'finish'.
+    """
+    def __init__(self,fp,sorted_input=False,
+                 max_models=MAX_TRANSCRIPT_MODELS,nshards=SPILL_SHARDS,
+                 tmp_dir=None):
+        """
+        Create a new TranscriptModelBuilder instance
+
+        Arguments:
+          fp: file-like object to write the BED12 data to
+          sorted_input: if True then write the transcripts for
+            each gene as soon as a line for another gene is added
+          max_models: maximum number of models to hold in memory
+            for unsorted input before spilling to temporary files
+          nshards: number of temporary files to spill to
+          tmp_dir: (optional) directory to create the temporary
+            files under
+        """
+        self.__fp = fp
+        self.__sorted_input = sorted_input
+        self.__max_models = max_models
+        self.__nshards = nshards
+        self.__tmp_dir = tmp_dir
+        self.__models = OrderedDict()
+        self.__current_gene = None
+        self.__written_genes = set()
+        self.__spill_dir = None
+        self.__shards = None
+        self.__spilled = False
+        self.__nwritten = 0
+
+    @property
+    def nwritten(self):
+        """
+        Return the number of transcripts written so far
+        """
+        return self.__nwritten
+
+    @property
+    def spilled(self):
+        """
+        Return True if models have been spilled to temporary files
+        """
+        return self.__spilled
+
+    def add(self,line):
+        """
+        Add a line of GTF data
+
+        Only 'exon', 'CDS', 'start_codon' and 'stop_codon'
+        lines are used; other lines are ignored.
+
+        Arguments:
+          line: GTFDataLine instance
+        """
+        feature = line['feature']
+        if feature not in ('exon','CDS','start_codon','stop_codon'):
+            return
+        attributes = line['attributes']
+        transcript_id = attributes['transcript_id']
+        if transcript_id is None:
+            logging.warning("L%d: no 'transcript_id' attribute for %s, "
+                            "ignored" % (line.lineno(),feature))
+            return
+        if self.__sorted_input:
+            gene_id = attributes['gene_id']
+            if gene_id != self.__current_gene:
+                # Moved onto a new gene
+                self.flush()
+                if gene_id in self.__written_genes:
+                    logging.warning("L%d: gene '%s' appears again after "
+                                    "other genes (input not sorted?)" %
+                                    (line.lineno(),gene_id))
+                self.__current_gene = gene_id
+        self.__add_segment(transcript_id,
+                           line['seqname'],
+                           line['strand'],
+                           'exon' if feature == 'exon' else 'CDS',
+                           line['start'],
+                           line['end'])
+        if not self.__sorted_input and \
+           len(self.__models) > self.__max_models:
+            self.__spill()
+
+    def flush(self):
+        """
+        Write out the transcript models held in memory
+        """
+        for transcript_id in self.__models:
+            self.__write(self.__models[transcript_id])
+        self.__models = OrderedDict()
+        if self.__current_gene is not None:
+            self.__written_genes.add(self.__current_gene)
+
+    def finish(self):
+        """
+        Write out all remaining transcript models
+        """
+        if self.__spill_dir is None:
+            self.flush()
+            return
+        # Spill the remaining models and then rebuild and
+        # write the models from each temporary file in turn
+        self.__spill()
+        try:
+            for shard in self.__shards:
+                shard.close()
+                with open(shard.name,'rt') as fp:
+                    for line in fp:
+                        segment = line.rstrip('\n').split('\t')
+                        self.__add_segment(segment[0],
+                                           segment[1],
+                                           segment[2],
+                                           segment[3],
+                                           int(segment[4]),
+                                           int(segment[5]))
+                self.flush()
+        finally:
+            shutil.rmtree(self.__spill_dir)
+            self.__spill_dir = None
+            self.__shards = None
+
+    def __add_segment(self,transcript_id,seqname,strand,kind,start,end):
+        # Internal: add an exon or CDS segment to a model
+        try:
+            model = self.__models[transcript_id]
+            if seqname != model.seqname or strand != model.strand:
+                logging.warning("transcript '%s': %s on %s%s, expected "
+                                "%s%s" % (transcript_id,kind,seqname,
+                                          strand,model.seqname,
+                                          model.strand))
+        except KeyError:
+            model = TranscriptModel(transcript_id,seqname,strand)
+            self.__models[transcript_id] = model
+        if kind == 'exon':
+            model.add_exon(start,end)
+        else:
+            model.add_cds(start,end)
+
+    def __spill(self):
+        # Internal: move the models held in memory into the
+        # temporary files
+        if self.__spill_dir is None:
+            self.__spill_dir = tempfile.mkdtemp(prefix="gtf2bed.",
+                                                dir=self.__tmp_dir)
+            self.__shards = [open(os.path.join(self.__spill_dir,
+                                               "shard%03d" % i),'wt')
+                             for i in range(self.__nshards)]
+            self.__spilled = True
+        for transcript_id in self.__models:
+            model = self.__models[transcript_id]
+            shard = self.__shards[_shard_index(transcript_id,
+                                               self.__nshards)]
+            for kind,start,end in model.segments():
+                shard.write("%s\t%s\t%s\t%s\t%d\t%d\n" % (transcript_id,
+                                                         model.seqname,
+                                                         model.strand,
+                                                         kind,
+                                                         start,
+                                                         end))
+        self.__models = OrderedDict()
+
+    def __write(self,model):
+        # Internal: write a model as BED12
+        bed12 = model.bed12()
+        if bed12 is None:
+            logging.warning("transcript '%s': no exons, ignored" %
+                            model.transcript_id)
+            return
+        self.__fp.write("%s\n" % bed12)
+        self.__nwritten += 1
+
+#######################################################################
+# Functions
+#######################################################################
+
+def _shard_index(name,nshards):
+    """
+    Internal: return a stable index in the range 0..nshards-1 for a name
+
+    (The builtin 'hash' can't be used as it is randomised between
+    Python processes.)
+    """
+    h = 0
+    for c in name:
+        h = (h*31 + ord(c)) & 0xffffffff
+    return h % nshards
+
+def write_gene_lines(gtf,fp):
+    """
+    Write the gene lines from GTF data
+
+    For each 'gene' feature, writes a line with the gene name,
+    chromosome, start, end, strand and feature type. Warnings
+    are logged for other features which lie outside the span
+    of their gene.
+
+    Arguments:
+      gtf (iterable): GTF data lines (e.g. a GTFIterator)
+      fp (File): file-like object to write the gene lines to
+    """
+    from ..GFFFile import ANNOTATION
+    this_gene = None
+    start = 0
+    stop = 0
+    for line in gtf:
+        if line.type != ANNOTATION:
+            continue
+        attributes = line['attributes']
+        if line['feature'] == 'gene':
+            # Encountered gene feature
+            # NB genes are tracked by ID rather than name, since
+            # different genes can share the same name
+            this_gene = attributes['gene_id']
+            start = line['start']
+            stop = line['end']
+            fp.write("%s\t%s\t%d\t%d\t%s\t%s\n" %
+                     (attributes['gene_name'],
+                      line['seqname'],
+                      line['start'],
+                      line['end'],
+                      line['strand'],
+                      line['feature']))
+        else:
+            # Non-gene feature
+            if this_gene == attributes['gene_id']:
+                print_details = False
+                if line['start'] < start:
+                    logging.warning("Start is before gene start")
+                    print_details = True
+                elif line['end'] > stop:
+                    logging.warning("End is after gene end "
+                                    "(%s > %s)" % (line['end'],stop))
+                    print_details = True
+                if line['end'] < start:
+                    logging.warning("End is before gene start")
+                    print_details = True
+                elif line['start'] > stop:
+                    logging.warning("Start is after gene end")
+                    print_details = True
+                if print_details:
+                    logging.warning("%s\t%s\t%s\t%s\t%s\t%s" %
+                                    (attributes['gene_name'],
+                                     line['seqname'],
+                                     line['start'],
+                                     line['end'],
+                                     line['strand'],
+                                     line['feature']))
+
+#######################################################################
+# Main program
+#######################################################################
 
 def main():
     """
@@ -23,58 +639,70 @@ def main():
     p.add_argument('-o',action="store",dest="outfile",default=None,
                    help="write output to OUTFILE (default is to write "
                    "to stdout)")
+    p.add_argument('--bed12',action="store_true",default=False,
+                   help="output a BED12 line for each transcript, built "
+                   "from its exons (and CDS, start_codon and stop_codon "
+                   "lines, for the thickStart and thickEnd)")
+    p.add_argument('--aggregate',action="store_true",default=False,
+                   help="compute the span of each gene from its exons "
+                   "(for GTFs without 'gene' lines), instead of only "
+                   "reporting explicit 'gene' lines")
+    p.add_argument('--transcripts',action="store_true",default=False,
+                   help="also report the span of each transcript "
+                   "(implies --aggregate)")
+    p.add_argument('--sorted',action="store_true",dest="sorted_input",
+                   default=False,
+                   help="input has all the lines for each gene together, "
+                   "so only hold one gene in memory at a time (only used "
+                   "with --aggregate and --bed12)")
+    add_profile_option(p)
     args = p.parse_args()
+    # Start profiling
+    if args.profile_file is not None:
+        try:
+            start_profiling(args.profile_file,prog="gtf2bed",
+                            input_files=(args.gtf_in,))
+        except ValueError as ex:
+            p.error(str(ex))
+    # NB GFFUtils modules are imported here rather than at the
+    # top of the module, to keep startup fast
+    from ..GTFFile import GTFIterator
+    from ..GFFFile import ANNOTATION
     # Output stream
     if args.outfile is None:
         fp = sys.stdout
     else:
         fp = open(args.outfile,'wt')
-    # Iterate over GTF
-    for line in GTFIterator(args.gtf_in):
-        this_gene = None
-        start = 0
-        stop = 0
-        attributes = line['attributes']
-        if line.type == ANNOTATION:
-            if line['feature'] == 'gene':
-                # Encountered gene feature
-                if this_gene != attributes['gene_name']:
-                    this_gene = attributes['gene_name']
-                    start = line['start']
-                    stop = line['end']
-                    fp.write("%s\t%s\t%d\t%d\t%s\t%s\n" %
-                             (attributes['gene_name'],
-                              line['seqname'],
-                              line['start'],
-                              line['end'],
-                              line['strand'],
-                              line['feature']))
-            else:
-                # Non-gene feature
-                if this_gene == attributes['gene_name']:
-                    print_details = False
-                    if line['start'] < start:
-                        logging.warn("WARNING Start is before gene start")
-                        print_details = True
-                    elif line['end'] > stop:
-                        logging.warn("WARNING End is after gene end "
-                                     "(%s > %s)" % (line['end'],stop))
-                        print_details = True
-                    if line['end'] < start:
-                        logging.warn("WARNING End is before gene start")
-                        print_details = True
-                    elif line['start'] > stop:
-                        logging.warn("WARNING Start is after gene end")
-                        print_details = True
-                    if print_details:
-                        logging.warn("%s\t%s\t%s\t%s\t%s\t%s" %
-                                     (attributes['gene_name'],
-                                      line['seqname'],
-                                      line['start'],
-                                      line['end'],
-                                      line['strand'],
-                                      line['feature']))
+    if args.bed12:
+        # Build transcript models and output as BED12
+        models = TranscriptModelBuilder(fp,sorted_input=args.sorted_input)
+        for line in GTFIterator(args.gtf_in,
+                                feature_types=('exon',
+                                               'CDS',
+                                               'start_codon',
+                                               'stop_codon')):
+            if line.type == ANNOTATION:
+                models.add(line)
+        models.finish()
+        fp.close()
+        return
+    if args.aggregate or args.transcripts:
+        # Compute spans from the exons
+        spans = GeneSpanAggregator(fp,
+                                   transcripts=args.transcripts,
+                                   sorted_input=args.sorted_input)
+        for line in GTFIterator(args.gtf_in,
+                                feature_types=('gene',
+                                               'transcript',
+                                               'exon')):
+            if line.type == ANNOTATION:
+                spans.add(line)
+        spans.finish()
+        fp.close()
+        return
+    # Output the gene lines
+    write_gene_lines(GTFIterator(args.gtf_in),fp)
     fp.close()
-        
+
 if __name__ == "__main__":
     main()
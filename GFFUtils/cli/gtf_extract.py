@@ -22,10 +22,274 @@ import os
 import sys
 import logging
 from argparse import ArgumentParser
-from ..GFFFile import GFFIterator
-from ..GFFFile import PRAGMA
-from ..GFFFile import ANNOTATION
-from ..GTFFile import GTFIterator
+from collections import deque
+from .profiling import add_profile_option
+from .profiling import start_profiling
+
+#######################################################################
+# Constants
+#######################################################################
+
+# Null character (used when values are missing)
+NULL = '.'
+
+# Number of output lines to collect before writing
+OUTPUT_BATCH_SIZE = 10000
+
+# Size of output file buffer (bytes)
+OUTPUT_BUFFER_SIZE = 1024*1024
+
+# Approximate size of input chunks for parallel extraction (bytes)
+CHUNK_SIZE = 8*1024*1024
+
+#######################################################################
+# Module globals
+#######################################################################
+
+# Extraction settings for worker processes
+_WORKER_SETTINGS = None
+
+#######################################################################
+# Functions
+#######################################################################
+
+def compile_extraction_plan(field_list,is_gff=False,null=NULL):
+    """
+    Return a function which extracts fields from a raw record
+
+    Each field is resolved once as either one of the standard
+    GTF/GFF columns or as the name of an attribute, so that
+    no lookups by name are needed for each record.
+
+    Arguments:
+      field_list: list of field names to extract (either
+        column names e.g. 'seqname', or attribute names)
+      is_gff: if True then attributes are parsed as GFF
+        (otherwise they are parsed as GTF)
+      null: value to return for missing attributes
+
+    Returns:
+      Function which takes a list of the raw column values
+      for a record and returns a list of the values for the
+      requested fields.
+    """
+    # NB GFFUtils modules are imported here rather than at the
+    # top of the module, to keep startup fast
+    from ..GFFFile import GFF_COLUMNS
+    from ..GFFFile import parse_gff_attributes
+    from ..GTFFile import parse_gtf_attributes
+    getters = []
+    for field in field_list:
+        try:
+            getters.append((GFF_COLUMNS.index(field),None))
+        except ValueError:
+            getters.append((None,field))
+    getters = tuple(getters)
+    if not [g for g in getters if g[1] is not None]:
+        # Columns only: no need to parse the attributes
+        columns = tuple([g[0] for g in getters])
+        def extract(fields):
+            return [fields[i] for i in columns]
+        return extract
+    # Attributes are parsed once per record
+    if is_gff:
+        parse_attributes = parse_gff_attributes
+    else:
+        parse_attributes = parse_gtf_attributes
+    def extract(fields):
+        attributes = parse_attributes(fields[8])
+        return [fields[i] if name is None else attributes.get(name,null)
+                for i,name in getters]
+    return extract
+
+def extract_lines(lines,feature_type=None,extract=None,is_gff=False,
+                  keep_header=False,null=NULL):
+    """
+    Generate output lines from raw GTF/GFF input lines
+
+    Arguments:
+      lines: iterable yielding raw lines of GTF or GFF data
+      feature_type: if set then only extract data from
+        lines with this feature type
+      extract: function returned by 'compile_extraction_plan'
+        (if not set then matching lines are output as-is)
+      is_gff: if True then the input is expected to be GFF
+        (otherwise a '##gff-version' pragma raises a
+        ValueError)
+      keep_header: if True then also output pragma lines
+      null: value used to pad truncated lines
+
+    Returns:
+      Generator yielding output lines (including trailing
+      newlines).
+    """
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if line.startswith('##'):
+            # Pragma
+            if not is_gff and line.startswith('##gff-version'):
+                raise ValueError("Input file is GFF not GTF? Rerun "
+                                "using --gff option")
+            if keep_header:
+                yield "%s\n" % line
+            continue
+        elif line.startswith('#') or not line:
+            # Comment or blank line
+            continue
+        fields = line.split('\t')
+        if len(fields) < 9:
+            fields.extend([null]*(9-len(fields)))
+        if feature_type is not None and fields[2] != feature_type:
+            continue
+        if extract is None:
+            yield "%s\n" % line
+        else:
+            yield "%s\n" % '\t'.join(extract(fields))
+
+def write_lines(lines,fp,batch_size=OUTPUT_BATCH_SIZE):
+    """
+    Write lines to a stream in batches
+
+    Arguments:
+      lines: iterable yielding lines to write
+      fp: file-like object to write the lines to
+      batch_size: number of lines to collect before
+        each write
+
+    Returns:
+      The number of lines written.
+    """
+    nlines = 0
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= batch_size:
+            fp.write(''.join(batch))
+            nlines += len(batch)
+            batch = []
+    if batch:
+        fp.write(''.join(batch))
+        nlines += len(batch)
+    return nlines
+
+def find_chunks(filen,chunk_size=CHUNK_SIZE):
+    """
+    Split a file into chunks which start and end on line boundaries
+
+    Arguments:
+      filen: path to the file
+      chunk_size: approximate size of each chunk in bytes
+
+    Returns:
+      List of (START,END) tuples giving the byte offsets of
+      each chunk.
+    """
+    chunks = []
+    size = os.path.getsize(filen)
+    with open(filen,'rb') as fp:
+        start = 0
+        while start < size:
+            fp.seek(min(start+chunk_size,size))
+            fp.readline()
+            end = min(fp.tell(),size)
+            chunks.append((start,end))
+            start = end
+    return chunks
+
+def extract_file_parallel(gtf_file,fp,nprocs,field_list=None,
+                          feature_type=None,is_gff=False,
+                          keep_header=False,chunk_size=CHUNK_SIZE):
+    """
+    Extract data from a GTF/GFF file using multiple processes
+
+    The file is split into line-aligned chunks which are
+    processed by a pool of worker processes; only a limited
+    number of chunks are queued at any time, and the output
+    from each chunk is written in the original order.
+
+    Arguments:
+      gtf_file: path to the GTF or GFF file
+      fp: file-like object to write the output to
+      nprocs: number of worker processes
+      field_list: list of fields to extract (if not set then
+        matching lines are output as-is)
+      feature_type: if set then only extract data from
+        lines with this feature type
+      is_gff: if True then the input is expected to be GFF
+      keep_header: if True then also output pragma lines
+      chunk_size: approximate size of each chunk in bytes
+
+    Returns:
+      The number of lines written.
+    """
+    from multiprocessing import Pool
+    pool = Pool(nprocs,
+                initializer=_init_extract_worker,
+                initargs=(gtf_file,field_list,feature_type,is_gff,
+                          keep_header))
+    pending = deque()
+    nlines = 0
+    try:
+        for chunk in find_chunks(gtf_file,chunk_size):
+            pending.append(pool.apply_async(_extract_chunk,(chunk,)))
+            if len(pending) >= 2*nprocs:
+                output,n = pending.popleft().get()
+                fp.write(output)
+                nlines += n
+        while pending:
+            output,n = pending.popleft().get()
+            fp.write(output)
+            nlines += n
+        pool.close()
+    except Exception:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return nlines
+
+#######################################################################
+# Internal functions
+#######################################################################
+
+def _init_extract_worker(gtf_file,field_list,feature_type,is_gff,
+                         keep_header):
+    """Internal: store the settings for an extraction worker process
+    """
+    global _WORKER_SETTINGS
+    if field_list is None:
+        extract = None
+    else:
+        extract = compile_extraction_plan(field_list,is_gff=is_gff)
+    _WORKER_SETTINGS = dict(gtf_file=gtf_file,
+                            extract=extract,
+                            feature_type=feature_type,
+                            is_gff=is_gff,
+                            keep_header=keep_header)
+
+def _extract_chunk(chunk):
+    """Internal: extract data from a chunk in a worker process
+
+    Arguments:
+      chunk: tuple (START,END) with the byte offsets of the
+        chunk in the input file
+
+    Returns:
+      Tuple (OUTPUT,NLINES) where OUTPUT is the text of the
+      output lines and NLINES is the number of lines.
+    """
+    start,end = chunk
+    with open(_WORKER_SETTINGS['gtf_file'],'rb') as fp:
+        fp.seek(start)
+        data = fp.read(end-start)
+    if not isinstance(data,str):
+        data = data.decode()
+    output = list(extract_lines(data.split('\n'),
+                                feature_type=_WORKER_SETTINGS['feature_type'],
+                                extract=_WORKER_SETTINGS['extract'],
+                                is_gff=_WORKER_SETTINGS['is_gff'],
+                                keep_header=_WORKER_SETTINGS['keep_header']))
+    return (''.join(output),len(output))
 
 # Main program
 #
@@ -57,14 +321,34 @@ def main():
     p.add_argument('-k','--keep-headers',action="store_true",dest="keep_header",
                    default=False,
                    help="copy headers from input file to output")
+    p.add_argument('-j','--threads',action='store',type=int,
+                   dest='nthreads',default=1,
+                   help="number of processes to use: the input file is "
+                   "split into chunks which are processed in parallel "
+                   "(output is in the same order as the input) "
+                   "(default: 1)")
+    add_profile_option(p)
     args = p.parse_args()
 
+    # Start profiling
+    if args.profile_file is not None:
+        try:
+            start_profiling(args.profile_file,prog="gtf_extract",
+                            input_files=(args.gtf_file,))
+        except ValueError as ex:
+            p.error(str(ex))
+
+    # Check number of threads
+    if args.nthreads < 1:
+        p.error("Number of threads must be a positive integer")
+
     # Type of feature to extract data for
     feature_type = args.feature_type
 
     # Fields to report
     if args.field_list is None:
         field_list = None
+        extract = None
     else:
         field_list = []
         for field in args.field_list.split(','):
@@ -73,53 +357,35 @@ def main():
                 field_list.append("seqname")
             else:
                 field_list.append(field)
-
-    # Input file type
-    if args.is_gff:
-        file_iterator =  GFFIterator
-    else:
-        file_iterator =  GTFIterator
+        extract = compile_extraction_plan(field_list,is_gff=args.is_gff)
 
     # Output stream
     if args.outfile is None:
         fp = sys.stdout
     else:
-        fp = open(args.outfile,'w')
-
-    # Null character (used when values are empty)
-    null = '.'
+        fp = open(args.outfile,'w',OUTPUT_BUFFER_SIZE)
 
-    # Iterate through the file line-by-line
-    for line in file_iterator(args.gtf_file):
-        this_gene = None
-        start = 0
-        stop = 0
-        if line.type == PRAGMA:
-            if line[0].startswith('##gff-version') and not args.is_gff:
-                logging.fatal("Input file is GFF not GTF? Rerun using --gff "
-                              "option")
-                sys.exit(1)
-            if args.keep_header:
-                fp.write("%s\n" % line)
-        elif line.type == ANNOTATION:
-            if feature_type is None or line['feature'] == feature_type:
-                # Extract and report data
-                if field_list is None:
-                    fp.write("%s\n" % line)
-                else:
-                    out_line = []
-                    for field in field_list:
-                        try:
-                            # Assume standard field
-                            out_line.append(str(line[field]))
-                        except KeyError:
-                            # Not standard, try as an attribute name
-                            try:
-                                out_line.append(str(line['attributes'][field]))
-                            except KeyError:
-                                # Not an attribute either
-                                out_line.append(str(null))
-                    fp.write("%s\n" % '\t'.join(out_line))
+    # Process the file
+    try:
+        if args.nthreads > 1:
+            # Process chunks in parallel
+            extract_file_parallel(args.gtf_file,fp,args.nthreads,
+                                  field_list=field_list,
+                                  feature_type=feature_type,
+                                  is_gff=args.is_gff,
+                                  keep_header=args.keep_header)
+        else:
+            # Process line-by-line
+            with open(args.gtf_file,'r') as gtf:
+                write_lines(extract_lines(gtf,
+                                          feature_type=feature_type,
+                                          extract=extract,
+                                          is_gff=args.is_gff,
+                                          keep_header=args.keep_header),
+                            fp)
+    except ValueError as ex:
+        logging.fatal(ex)
+        sys.exit(1)
 
     # Finished - close output file
     if args.outfile is not None:
@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+#
+#     profiling.py: common --profile option for the command line utilities
+#     Copyright (C) University of Manchester 2020 Peter Briggs
+#
+
+"""
+Support for running the command line utilities under cProfile.
+
+Each utility adds the option to its parser using
+'add_profile_option', and then calls 'start_profiling' after
+parsing its arguments, e.g.
+
+>>> p = ArgumentParser()
+>>> add_profile_option(p)
+>>> args = p.parse_args()
+>>> if args.profile_file is not None:
+...    try:
+...        start_profiling(args.profile_file,prog="gtf_extract",
+...                        input_files=(args.gtf_file,))
+...    except ValueError as ex:
+...        p.error(str(ex))
+
+Profiling is turned on by '--profile' (writing the statistics
+to '<PROGRAM>.pstats') or by '--profile-file FILE'. NB '--profile'
+doesn't take a value, so that it can't consume a following
+positional argument (which could otherwise be an input file that
+would be overwritten by the statistics).
+
+Profiling stops when the program exits (including via
+'sys.exit'); the raw statistics are then written to a '.pstats'
+file (which can be loaded using the 'pstats' module, e.g. to
+compare runs from different versions), and a summary of the
+hot spots, grouped by module, is written to stderr.
+"""
+
+import os
+import sys
+import atexit
+from argparse import Action
+
+#######################################################################
+# Constants
+#######################################################################
+
+# Number of functions to report
+PROFILE_TOP = 20
+
+# Directory containing the GFFUtils package
+_PACKAGE_PARENT_DIR = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+#######################################################################
+# Classes
+#######################################################################
+
+class _ProfileAction(Action):
+    """
+    Internal: argparse action for the '--profile' flag
+
+    Turns on profiling with the default statistics file,
+    unless a file was already set by '--profile-file'.
+    """
+    def __init__(self,option_strings,dest,**kws):
+        kws['nargs'] = 0
+        Action.__init__(self,option_strings,dest,**kws)
+    def __call__(self,parser,namespace,values,option_string=None):
+        if getattr(namespace,self.dest) is None:
+            setattr(namespace,self.dest,'')
+
+#######################################################################
+# Functions
+#######################################################################
+
+def add_profile_option(p):
+    """
+    Add the '--profile' and '--profile-file' options to a parser
+
+    After parsing, 'profile_file' is None if profiling wasn't
+    requested, blank if '--profile' was specified on its own,
+    or the file name from '--profile-file'.
+
+    Arguments:
+      p: ArgumentParser instance
+    """
+    p.add_argument('--profile',action=_ProfileAction,dest='profile_file',
+                   default=None,
+                   help="run under the Python profiler, write the "
+                   "statistics to '<PROGRAM>.pstats' and report the hot "
+                   "spots to stderr (NB only the main process is "
+                   "profiled)")
+    p.add_argument('--profile-file',action='store',dest='profile_file',
+                   metavar='FILE',
+                   help="as for --profile but write the statistics to "
+                   "FILE (an existing FILE is only overwritten if it "
+                   "has the '.pstats' extension)")
+
+def start_profiling(profile_file,prog=None,top=PROFILE_TOP,
+                    input_files=None):
+    """
+    Start profiling and report the results on exit
+
+    Raises a ValueError if the statistics would overwrite one
+    of the input files, or an existing file which doesn't have
+    the '.pstats' extension.
+
+    Arguments:
+      profile_file: path to write the statistics to (if
+        blank then '<PROG>.pstats' is used)
+      prog: name of the program (default: the name of the
+        running script)
+      top: number of functions to report
+      input_files: (optional) list of input files for the
+        program, which mustn't be overwritten
+
+    Returns:
+      The cProfile.Profile instance.
+    """
+    if prog is None:
+        prog = os.path.basename(sys.argv[0])
+    if not profile_file:
+        profile_file = "%s.pstats" % prog
+    check_profile_file(profile_file,input_files=input_files)
+    # NB profiling modules are only imported when needed
+    import cProfile
+    profile = cProfile.Profile()
+    atexit.register(stop_profiling,profile,profile_file,top=top)
+    profile.enable()
+    return profile
+
+def check_profile_file(profile_file,input_files=None):
+    """
+    Check that statistics can be written to a file
+
+    Raises a ValueError if the file is one of the input
+    files, or an existing file which doesn't have the
+    '.pstats' extension.
+
+    Arguments:
+      profile_file: path to write the statistics to
+      input_files: (optional) list of input files which
+        mustn't be overwritten
+    """
+    if not os.path.exists(profile_file):
+        return
+    if input_files:
+        for filen in input_files:
+            if filen and os.path.exists(filen) and \
+               os.path.samefile(filen,profile_file):
+                raise ValueError("Profile statistics file '%s' is also "
+                                 "an input file" % profile_file)
+    if not profile_file.endswith(".pstats"):
+        raise ValueError("Refusing to overwrite existing file '%s' with "
+                         "profile statistics (use a '.pstats' extension)"
+                         % profile_file)
+
+def stop_profiling(profile,profile_file,top=PROFILE_TOP,fp=None):
+    """
+    Stop profiling, save the statistics and report the hot spots
+
+    Arguments:
+      profile: cProfile.Profile instance
+      profile_file: path to write the statistics to
+      top: number of functions to report
+      fp: (optional) stream to write the report to (default:
+        stderr)
+    """
+    profile.disable()
+    import pstats
+    if fp is None:
+        fp = sys.stderr
+    profile.dump_stats(profile_file)
+    report_profile(pstats.Stats(profile_file),fp,top=top)
+    fp.write("Profile statistics written to %s\n" % profile_file)
+
+def report_profile(stats,fp,top=PROFILE_TOP):
+    """
+    Write a summary of the hot spots from profile statistics
+
+    The summary has the total internal time for each module,
+    and the functions with the highest cumulative time (with
+    the GFFUtils modules named in full, and other code grouped
+    by top-level package).
+
+    Arguments:
+      stats: pstats.Stats instance
+      fp: stream to write the report to
+      top: number of functions to report
+    """
+    modules = {}
+    functions = []
+    for func,data in stats.stats.items():
+        filename,lineno,name = func
+        ncalls,tottime,cumtime = data[1],data[2],data[3]
+        module = module_name(filename)
+        modules[module] = modules.get(module,0.0) + tottime
+        functions.append((cumtime,tottime,ncalls,module,name))
+    fp.write("Time by module (internal time):\n")
+    for module in sorted(modules,key=lambda m: modules[m],reverse=True):
+        if module.startswith("GFFUtils") or modules[module] > 0.0:
+            fp.write("\t%10.3fs\t%s\n" % (modules[module],module))
+    fp.write("Top %d functions by cumulative time:\n" % top)
+    fp.write("\t%10s\t%10s\t%10s\t%s\n" % ("cumtime","tottime","ncalls",
+                                           "function"))
+    functions.sort(reverse=True)
+    for cumtime,tottime,ncalls,module,name in functions[:top]:
+        fp.write("\t%9.3fs\t%9.3fs\t%10d\t%s:%s\n" % (cumtime,tottime,
+                                                    ncalls,module,name))
+
+def module_name(filename):
+    """
+    Return the name of the module to report a file under
+
+    Arguments:
+      filename: file name from the profile statistics
+
+    Returns:
+      Full module name for GFFUtils modules (e.g.
+      'GFFUtils.GFFFile'), the top-level package or module
+      name for other Python files (e.g. 'bcftbx'), or
+      '<built-in>' for built-in functions.
+    """
+    if filename.startswith('~') or filename.startswith('<'):
+        return "<built-in>"
+    filename = os.path.abspath(filename)
+    if filename.startswith(os.path.join(_PACKAGE_PARENT_DIR,
+                                        "GFFUtils")+os.sep):
+        module = os.path.splitext(
+            os.path.relpath(filename,_PACKAGE_PARENT_DIR))[0]
+        return module.replace(os.sep,'.')
+    for path in sorted([p for p in sys.path if p],key=len,reverse=True):
+        path = os.path.abspath(path)
+        if filename.startswith(path+os.sep):
+            relpath = os.path.relpath(filename,path)
+            return os.path.splitext(relpath.split(os.sep)[0])[0]
+    return os.path.splitext(os.path.basename(filename))[0]
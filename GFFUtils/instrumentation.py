@@ -0,0 +1,526 @@
+#!/usr/bin/env python
+#
+#     instrumentation.py: progress and warning reporting utilities
+#     Copyright (C) University of Manchester 2020 Peter Briggs
+#
+
+"""
+Utility classes for reporting on long-running operations without
+generating output for every item processed:
+
+- ProgressReporter: periodically reports the number of items
+  processed, the rate and the estimated time remaining
+- WarningCounter: collects warnings by category and reports a
+  summary of them at the end
+- StageRecorder: records the wall time, CPU time, number of
+  records and peak memory for each stage of a program
+"""
+
+import os
+import sys
+import time
+import json
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+try:
+    import resource
+except ImportError:
+    # Not available e.g. on Windows
+    resource = None
+
+#######################################################################
+# Classes
+#######################################################################
+
+class ProgressReporter(object):
+    """
+    Periodically report progress through a set of items
+
+    Example usage:
+
+    >>> progress = ProgressReporter(total=len(ids),interval=10)
+    >>> for idx in ids:
+    ...    do_something(idx)
+    ...    progress.update()
+    >>> progress.finish()
+
+    A progress message (with the number of items processed,
+    the rate in items per second and, if the total number
+    of items is known, the estimated time remaining) is
+    printed when 'update' is called and at least 'interval'
+    seconds have passed since the last message.
+    """
+    def __init__(self,total=None,interval=10.0,label="items"):
+        """
+        Create a new ProgressReporter instance
+
+        Arguments:
+          total: (optional) total number of items expected
+          interval: minimum interval in seconds between
+            progress messages (set to None to suppress the
+            progress messages)
+          label: name used for the items in the messages
+        """
+        self.__total = total
+        self.__interval = interval
+        self.__label = label
+        self.__count = 0
+        self.__start_time = time.time()
+        self.__last_report = self.__start_time
+
+    @property
+    def count(self):
+        """
+        Return the number of items processed so far
+        """
+        return self.__count
+
+    def elapsed(self):
+        """
+        Return the time in seconds since the reporter was created
+        """
+        return time.time() - self.__start_time
+
+    def rate(self):
+        """
+        Return the number of items processed per second
+        """
+        elapsed = self.elapsed()
+        if elapsed > 0:
+            return float(self.__count)/elapsed
+        return 0.0
+
+    def eta(self):
+        """
+        Return the estimated time in seconds to finish (or None)
+
+        Returns None if the total number of items isn't known
+        or no items have been processed yet.
+        """
+        rate = self.rate()
+        if self.__total is None or not rate:
+            return None
+        return max(self.__total - self.__count,0)/rate
+
+    def update(self,n=1):
+        """
+        Record that more items have been processed
+
+        Arguments:
+          n: number of additional items processed (default: 1)
+        """
+        self.__count += n
+        if self.__interval is None:
+            return
+        now = time.time()
+        if now - self.__last_report >= self.__interval:
+            self.__last_report = now
+            self.report()
+
+    def report(self):
+        """
+        Print a message reporting the current progress
+        """
+        if self.__total is not None:
+            processed = "%d/%d" % (self.__count,self.__total)
+        else:
+            processed = "%d" % self.__count
+        msg = "Processed %s %s (%.1f %s/s" % (processed,
+                                               self.__label,
+                                               self.rate(),
+                                               self.__label)
+        eta = self.eta()
+        if eta is not None:
+            msg += ", ETA %s" % format_time(eta)
+        print("%s)" % msg)
+
+    def finish(self):
+        """
+        Print a summary once all items have been processed
+        """
+        print("Processed %d %s in %s (%.1f %s/s)" % (self.__count,
+                                                     self.__label,
+                                                     format_time(
+                                                         self.elapsed()),
+                                                     self.rate(),
+                                                     self.__label))
+
+class WarningCounter(object):
+    """
+    Collect warnings by category and report a summary
+
+    Example usage:
+
+    >>> warnings = WarningCounter()
+    >>> warnings.add("Missing ID","No ID on line 3")
+    >>> warnings.add("Missing ID","No ID on line 7")
+    >>> warnings.report()
+
+    which logs a single warning for the 'Missing ID'
+    category, with the number of occurrences and the
+    first message.
+    """
+    def __init__(self,max_examples=1):
+        """
+        Create a new WarningCounter instance
+
+        Arguments:
+          max_examples: maximum number of messages to keep
+            for each category (default: 1)
+        """
+        self.__max_examples = max_examples
+        self.__counts = OrderedDict()
+        self.__examples = {}
+
+    def add(self,category,message=None):
+        """
+        Record a warning
+
+        Arguments:
+          category: category for the warning
+          message: (optional) the full warning message
+        """
+        if category not in self.__counts:
+            self.__counts[category] = 0
+            self.__examples[category] = []
+        self.__counts[category] += 1
+        if message is not None and \
+           len(self.__examples[category]) < self.__max_examples:
+            self.__examples[category].append(message)
+
+    def count(self,category=None):
+        """
+        Return the number of warnings recorded
+
+        Arguments:
+          category: if set then only return the count for
+            the specified category (otherwise return the
+            total for all categories)
+        """
+        if category is None:
+            return sum([self.__counts[c] for c in self.__counts])
+        try:
+            return self.__counts[category]
+        except KeyError:
+            return 0
+
+    def categories(self):
+        """
+        Return the categories in the order they were first seen
+        """
+        return list(self.__counts.keys())
+
+    def examples(self,category):
+        """
+        Return the messages stored for a category
+        """
+        return [m for m in self.__examples.get(category,[])]
+
+    def merge(self,warnings):
+        """
+        Add the warnings from another WarningCounter
+
+        Arguments:
+          warnings: WarningCounter instance to merge in
+        """
+        for category in warnings.categories():
+            if category not in self.__counts:
+                self.__counts[category] = 0
+                self.__examples[category] = []
+            self.__counts[category] += warnings.count(category)
+            examples = self.__examples[category]
+            for message in warnings.examples(category):
+                if len(examples) < self.__max_examples:
+                    examples.append(message)
+
+    def reset(self):
+        """
+        Remove all the recorded warnings
+        """
+        self.__counts = OrderedDict()
+        self.__examples = {}
+
+    def report(self):
+        """
+        Log a summary warning for each category
+        """
+        for category in self.__counts:
+            count = self.__counts[category]
+            examples = self.__examples[category]
+            if count == 1 and examples:
+                logging.warning(examples[0])
+                continue
+            msg = "%s (%d occurrence%s)" % (category,
+                                            count,
+                                            's' if count != 1 else '')
+            if examples:
+                msg += ", e.g. %s" % '; '.join(examples)
+            logging.warning(msg)
+
+class StageRecorder(object):
+    """
+    Record the resources used by each stage of a program
+
+    Example usage:
+
+    >>> stats = StageRecorder(trace_memory=True)
+    >>> with stats.stage("parse") as stage:
+    ...    gff = GFFFile("my.gff")
+    ...    stage.records = len(gff)
+    >>> with stats.stage("write",records=len(gff)):
+    ...    gff.write("out.gff")
+    >>> stats.write_json("stats.json")
+
+    For each stage the following are recorded:
+
+    - name: the stage name
+    - wall_time: elapsed time (seconds)
+    - cpu_time: CPU time used by the process (seconds)
+    - records: number of records processed (or None)
+    - peak_traced_memory: peak memory allocated by Python
+      during the stage, in bytes (None unless memory tracing
+      was requested)
+    - max_rss: peak resident set size of the process at the
+      end of the stage, in bytes (None if not available);
+      as this is the peak since the process started, the
+      stage where it increases is the one which needed more
+      memory
+
+    If a stats file is supplied then it is rewritten at the
+    start and end of each stage, with the name of the stage
+    in progress as 'running'; if the process is killed (e.g.
+    for running out of memory) then the file shows which
+    stage it was in.
+
+    Memory tracing uses the 'tracemalloc' module, which adds
+    a significant overhead, so it is off by default. Stages
+    shouldn't be nested when memory tracing is on.
+    """
+    def __init__(self,trace_memory=False,stats_file=None,metadata=None):
+        """
+        Create a new StageRecorder instance
+
+        Arguments:
+          trace_memory: if True then trace the peak memory
+            allocated during each stage (requires the
+            'tracemalloc' module i.e. Python 3)
+          stats_file: (optional) JSON file to keep updated
+            with the stage data
+          metadata: (optional) dictionary of additional items
+            to include in the stats file (e.g. program name
+            and version)
+        """
+        self.__stages = []
+        self.__running = None
+        self.__stats_file = stats_file
+        self.__metadata = OrderedDict()
+        if metadata:
+            self.__metadata.update(metadata)
+        self.__trace_memory = False
+        self.__tracemalloc = None
+        if trace_memory:
+            # Only import tracemalloc when it's needed
+            try:
+                import tracemalloc
+            except ImportError:
+                # Not available in Python 2
+                tracemalloc = None
+            if tracemalloc is None:
+                logging.warning("Memory tracing not available")
+            else:
+                self.__trace_memory = True
+                self.__tracemalloc = tracemalloc
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start()
+
+    @contextmanager
+    def stage(self,name,records=None):
+        """
+        Context manager which records the resources for a stage
+
+        The object returned has a 'records' attribute which
+        can be updated within the context.
+
+        Arguments:
+          name: name of the stage
+          records: (optional) number of records processed
+            in the stage
+        """
+        stage = _StageData(name,records)
+        self.__running = name
+        if self.__stats_file:
+            self.write_json(self.__stats_file)
+        if self.__trace_memory:
+            _reset_traced_peak(self.__tracemalloc)
+        wall_start = time.time()
+        cpu_start = _cpu_time()
+        try:
+            yield stage
+        finally:
+            stage.cpu_time = _cpu_time() - cpu_start
+            stage.wall_time = time.time() - wall_start
+            if self.__trace_memory:
+                stage.peak_traced_memory = \
+                    self.__tracemalloc.get_traced_memory()[1]
+            stage.max_rss = max_rss()
+            self.__stages.append(stage)
+            self.__running = None
+            if self.__stats_file:
+                self.write_json(self.__stats_file)
+
+    def stages(self):
+        """
+        Return the data for the recorded stages
+
+        Returns:
+          List of dictionaries (one for each stage, in the
+          order the stages finished).
+        """
+        return [stage.as_dict() for stage in self.__stages]
+
+    def report(self):
+        """
+        Print a summary of the recorded stages
+        """
+        print("Stage statistics:")
+        print("\t%10s\t%10s\t%10s\t%10s\t%s" % ("wall","cpu",
+                                                  "records","max_rss",
+                                                  "stage"))
+        for stage in self.__stages:
+            print("\t%9.2fs\t%9.2fs\t%10s\t%10s\t%s" %
+                  (stage.wall_time,
+                   stage.cpu_time,
+                   stage.records if stage.records is not None else '-',
+                   format_bytes(stage.max_rss),
+                   stage.name))
+
+    def write_json(self,filen):
+        """
+        Write the data for the recorded stages to a JSON file
+
+        Arguments:
+          filen: path to the output file
+        """
+        data = OrderedDict(self.__metadata)
+        data['trace_memory'] = self.__trace_memory
+        data['running'] = self.__running
+        data['stages'] = self.stages()
+        # Write to a temporary file and then move into place, so
+        # the file is always complete
+        tmp_file = "%s.tmp" % filen
+        with open(tmp_file,'wt') as fp:
+            json.dump(data,fp,indent=2)
+            fp.write("\n")
+        if os.path.exists(filen):
+            os.remove(filen)
+        os.rename(tmp_file,filen)
+
+    def stop(self):
+        """
+        Stop memory tracing (if it was started)
+        """
+        if self.__trace_memory:
+            self.__tracemalloc.stop()
+            self.__trace_memory = False
+
+class _StageData(object):
+    """
+    Internal: resources recorded for a single stage
+    """
+    __slots__ = ('name','records','wall_time','cpu_time',
+                 'peak_traced_memory','max_rss')
+
+    def __init__(self,name,records=None):
+        self.name = name
+        self.records = records
+        self.wall_time = None
+        self.cpu_time = None
+        self.peak_traced_memory = None
+        self.max_rss = None
+
+    def as_dict(self):
+        return OrderedDict([(attr,getattr(self,attr))
+                            for attr in self.__slots__])
+
+#######################################################################
+# Functions
+#######################################################################
+
+def format_time(seconds):
+    """
+    Return a time in seconds as a string e.g. '1h02m03s'
+
+    Arguments:
+      seconds: time interval in seconds
+    """
+    seconds = int(round(seconds))
+    hours = seconds//3600
+    minutes = (seconds%3600)//60
+    seconds = seconds%60
+    if hours:
+        return "%dh%02dm%02ds" % (hours,minutes,seconds)
+    elif minutes:
+        return "%dm%02ds" % (minutes,seconds)
+    return "%ds" % seconds
+
+def format_bytes(nbytes):
+    """
+    Return a size in bytes as a string e.g. '1.5G'
+
+    Arguments:
+      nbytes: size in bytes (or None)
+    """
+    if nbytes is None:
+        return '-'
+    for units in ('','K','M','G'):
+        if nbytes < 1024:
+            break
+        nbytes = nbytes/1024.0
+    else:
+        units = 'T'
+    if not units:
+        return "%d" % nbytes
+    return "%.1f%s" % (nbytes,units)
+
+def max_rss():
+    """
+    Return the peak resident set size of the process in bytes
+
+    Returns None if the 'resource' module isn't available.
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != 'darwin':
+        # Linux reports kilobytes, OS X reports bytes
+        rss = rss*1024
+    return rss
+
+#######################################################################
+# Internal functions
+#######################################################################
+
+def _cpu_time():
+    """
+    Internal: return the CPU time used by the process
+    """
+    try:
+        return time.process_time()
+    except AttributeError:
+        # Python 2
+        return time.clock()
+
+def _reset_traced_peak(tracemalloc):
+    """
+    Internal: reset the peak traced memory to the current size
+
+    Arguments:
+      tracemalloc: the 'tracemalloc' module
+    """
+    try:
+        tracemalloc.reset_peak()
+    except AttributeError:
+        # Python < 3.9: restart tracing to reset the peak
+        tracemalloc.stop()
+        tracemalloc.start()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+#
+#     bench_gff_records.py: benchmark storage of GFF data lines
+#     Copyright (C) University of Manchester 2020 Peter Briggs
+#
+
+"""
+Benchmark the GFFRecordList container used by GFFFile against
+bcftbx's TabFile (which GFFFile was previously based on).
+
+Usage:
+
+    python benchmarks/bench_gff_records.py [--lines N] [--delete F]
+
+A synthetic GFF3 file is generated and its lines are loaded into
+each container, which is then timed for:
+
+- append: appending all the lines
+- iterate: iterating over all the lines
+- get by line number: fetching a random sample of lines using
+  their line numbers
+- delete by line number: deleting the same sample of lines
+  (the way that 'gff_cleaner' removes discarded duplicates)
+"""
+
+import sys
+import os
+import time
+import random
+import tempfile
+from argparse import ArgumentParser
+sys.path.insert(0,os.path.join(os.path.dirname(__file__),'..'))
+sys.path.insert(0,os.path.dirname(__file__))
+from bcftbx.TabFile import TabFile
+from GFFUtils.GFFFile import GFFIterator
+from GFFUtils.GFFFile import GFFDataLine
+from GFFUtils.GFFFile import GFFRecordList
+from GFFUtils.GFFFile import GFF_COLUMNS
+from GFFUtils.GFFFile import ANNOTATION
+from generate import make_gff3
+
+#######################################################################
+# Operations for each container
+#######################################################################
+
+def tabfile_new():
+    return TabFile(None,tab_data_line=GFFDataLine,column_names=GFF_COLUMNS)
+
+def tabfile_get(records,linenos):
+    for n in linenos:
+        records[records.indexByLineNumber(n)]
+
+def tabfile_delete(records,linenos):
+    for n in linenos:
+        del(records[records.indexByLineNumber(n)])
+
+def recordlist_get(records,linenos):
+    for n in linenos:
+        records.getByLineNumber(n)
+
+def recordlist_delete(records,linenos):
+    for n in linenos:
+        records.deleteByLineNumber(n)
+
+CONTAINERS = (("TabFile",tabfile_new,tabfile_get,tabfile_delete),
+              ("GFFRecordList",GFFRecordList,recordlist_get,
+               recordlist_delete),)
+
+#######################################################################
+# Functions
+#######################################################################
+
+def append(records,lines):
+    for line in lines:
+        records.append(tabdataline=line)
+
+def iterate(records):
+    for line in records:
+        pass
+
+def timed(func,*args):
+    """
+    Return the time in seconds taken to run a function
+    """
+    start_time = time.time()
+    func(*args)
+    return time.time() - start_time
+
+if __name__ == "__main__":
+    p = ArgumentParser(description="Benchmark GFFRecordList against "
+                       "TabFile")
+    p.add_argument('--lines',action='store',type=int,default=20000,
+                   help="approximate number of lines in the synthetic "
+                   "GFF3 file (default: 20000)")
+    p.add_argument('--delete',action='store',type=float,default=0.1,
+                   help="fraction of lines to fetch and delete by line "
+                   "number (default: 0.1)")
+    args = p.parse_args()
+    wd = tempfile.mkdtemp()
+    gff_file = os.path.join(wd,"benchmark.gff")
+    make_gff3(gff_file,nlines=args.lines)
+    with open(gff_file,'r') as fp:
+        lines = [line for line in GFFIterator(fp=fp)
+                 if line.type == ANNOTATION]
+    os.remove(gff_file)
+    os.rmdir(wd)
+    linenos = [line.lineno() for line in lines]
+    random.seed(1234)
+    sample = random.sample(linenos,int(len(linenos)*args.delete))
+    print("%d lines (%d fetched and deleted by line number)" %
+          (len(lines),len(sample)))
+    print("%-14s %10s %10s %10s %10s" % ("","append","iterate",
+                                         "get","delete"))
+    for name,new,get,delete in CONTAINERS:
+        records = new()
+        print("%-14s %9.3fs %9.3fs %9.3fs %9.3fs" %
+              (name,
+               timed(append,records,lines),
+               timed(iterate,records),
+               timed(get,records,sample),
+               timed(delete,records,sample)))
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+#
+#     bench_gtf_extract.py: benchmark field extraction for gtf_extract
+#     Copyright (C) University of Manchester 2020 Peter Briggs
+#
+
+"""
+Benchmark the compiled extraction plan used by 'gtf_extract'
+against the original approach of looking up each field by name
+on GTFDataLine objects.
+
+Usage:
+
+    python benchmarks/bench_gtf_extract.py [GTF_FILE]
+
+If no GTF file is supplied then a synthetic GENCODE-style GTF is
+generated. The target is for the compiled plan to process at
+least 5 times as many lines per second as the original approach.
+"""
+
+import sys
+import os
+import time
+import tempfile
+sys.path.insert(0,os.path.join(os.path.dirname(__file__),'..'))
+sys.path.insert(0,os.path.dirname(__file__))
+from GFFUtils.GFFFile import PRAGMA
+from GFFUtils.GFFFile import ANNOTATION
+from GFFUtils.GTFFile import GTFIterator
+from GFFUtils.cli.gtf_extract import compile_extraction_plan
+from GFFUtils.cli.gtf_extract import extract_lines
+from GFFUtils.cli.gtf_extract import write_lines
+from generate import make_gtf
+
+# Fields to extract
+FIELDS = ('seqname','start','end','strand','gene_id','gene_name',
+          'transcript_id','exon_number')
+
+# Minimum speed up required
+TARGET_SPEEDUP = 5.0
+
+def original_extract(gtf_file,fp,field_list,null='.'):
+    """
+    Extract fields using GTFDataLine lookups (original approach)
+    """
+    for line in GTFIterator(gtf_file):
+        if line.type == PRAGMA:
+            continue
+        elif line.type == ANNOTATION:
+            out_line = []
+            for field in field_list:
+                try:
+                    out_line.append(str(line[field]))
+                except KeyError:
+                    try:
+                        out_line.append(str(line['attributes'][field]))
+                    except KeyError:
+                        out_line.append(str(null))
+            fp.write("%s\n" % '\t'.join(out_line))
+
+def compiled_extract(gtf_file,fp,field_list):
+    """
+    Extract fields using the compiled extraction plan
+    """
+    extract = compile_extraction_plan(field_list)
+    with open(gtf_file,'r') as gtf:
+        write_lines(extract_lines(gtf,extract=extract),fp)
+
+class NullWriter(object):
+    """
+    File-like object which discards everything written to it
+    """
+    def write(self,s):
+        pass
+
+def timed(func,*args):
+    """
+    Return the time in seconds taken to run a function
+    """
+    start_time = time.time()
+    func(*args)
+    return time.time() - start_time
+
+if __name__ == "__main__":
+    wd = None
+    if len(sys.argv) > 1:
+        gtf_file = sys.argv[1]
+    else:
+        wd = tempfile.mkdtemp()
+        gtf_file = os.path.join(wd,"benchmark.gtf")
+        make_gtf(gtf_file,nlines=100000)
+    with open(gtf_file,'r') as fp:
+        nlines = sum([1 for line in fp if not line.startswith('#')])
+    print("%s: %d lines" % (gtf_file,nlines))
+    results = []
+    for name,func in (("original",original_extract),
+                      ("compiled",compiled_extract)):
+        elapsed = timed(func,gtf_file,NullWriter(),FIELDS)
+        results.append(elapsed)
+        print("%-10s %8.2fs %12.1f lines/s" % (name,elapsed,
+                                               nlines/elapsed))
+    speedup = results[0]/results[1]
+    print("Speed up: %.1fx (target %.1fx): %s" %
+          (speedup,TARGET_SPEEDUP,
+           "OK" if speedup >= TARGET_SPEEDUP else "BELOW TARGET"))
+    if wd is not None:
+        os.remove(gtf_file)
+        os.rmdir(wd)
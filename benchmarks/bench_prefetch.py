@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+#
+#     bench_prefetch.py: benchmark prefetching when reading GFF data
+#     Copyright (C) University of Manchester 2020 Peter Briggs
+#
+
+"""
+Benchmark loading GFF data with and without the background
+prefetch thread in GFFIterator.
+
+Usage:
+
+    python benchmarks/bench_prefetch.py [--lines N] [--latency MS]
+
+A synthetic GFF3 file is generated and loaded into a GFFFile
+with 'prefetch' off and on. To emulate a slow (e.g. network)
+filesystem, each block read from the file can be delayed by
+the specified latency; with prefetching the delays should
+overlap with the parsing.
+"""
+
+import sys
+import os
+import time
+import tempfile
+from argparse import ArgumentParser
+sys.path.insert(0,os.path.join(os.path.dirname(__file__),'..'))
+sys.path.insert(0,os.path.dirname(__file__))
+from GFFUtils.GFFFile import GFFFile
+from GFFUtils.GFFFile import PREFETCH_BLOCK_SIZE
+from generate import make_gff3
+
+#######################################################################
+# Classes
+#######################################################################
+
+class SlowFile(object):
+    """
+    Wrap a file so that each read is delayed
+
+    Reads by 'readline' are delayed once for every
+    PREFETCH_BLOCK_SIZE bytes, so the total delay is the
+    same as for 'readlines' (which is used by the prefetch
+    thread).
+    """
+    def __init__(self,fp,latency):
+        self.__fp = fp
+        self.__latency = latency
+        self.__nbytes = 0
+    def readline(self):
+        line = self.__fp.readline()
+        self.__nbytes += len(line)
+        if self.__nbytes >= PREFETCH_BLOCK_SIZE:
+            self.__nbytes = 0
+            time.sleep(self.__latency)
+        return line
+    def readlines(self,hint):
+        time.sleep(self.__latency)
+        return self.__fp.readlines(hint)
+
+#######################################################################
+# Functions
+#######################################################################
+
+def load(gff_file,latency,prefetch):
+    """
+    Return the time in seconds taken to load a GFF file
+    """
+    start_time = time.time()
+    with open(gff_file,'rt') as fp:
+        GFFFile(gff_file,fp=SlowFile(fp,latency),prefetch=prefetch)
+    return time.time() - start_time
+
+if __name__ == "__main__":
+    p = ArgumentParser(description="Benchmark loading GFF data with and "
+                       "without prefetching")
+    p.add_argument('--lines',action='store',type=int,default=100000,
+                   help="approximate number of lines in the synthetic "
+                   "GFF3 file (default: 100000)")
+    p.add_argument('--latency',action='store',type=float,default=20.0,
+                   help="delay in milliseconds for each %d byte block "
+                   "read from the file (default: 20)" % PREFETCH_BLOCK_SIZE)
+    p.add_argument('--repeat',action='store',type=int,default=3,
+                   help="number of times to load the file (the best "
+                   "time is reported) (default: 3)")
+    args = p.parse_args()
+    wd = tempfile.mkdtemp()
+    gff_file = os.path.join(wd,"benchmark.gff")
+    make_gff3(gff_file,nlines=args.lines)
+    print("%d bytes, %.1fms latency per block" %
+          (os.path.getsize(gff_file),args.latency))
+    try:
+        for prefetch in (False,True):
+            best = min([load(gff_file,args.latency/1000.0,prefetch)
+                        for i in range(args.repeat)])
+            print("prefetch=%-5s %9.3fs" % (prefetch,best))
+    finally:
+        os.remove(gff_file)
+        os.rmdir(wd)
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+#
+#     bench_startup.py: benchmark startup time of the utilities
+#     Copyright (C) University of Manchester 2020 Peter Briggs
+#
+
+"""
+Benchmark the startup time of the command line utilities.
+
+Usage:
+
+    python benchmarks/bench_startup.py [--repeat N] [--top N] [--budget S]
+
+For each utility this reports:
+
+- the best wall time over several runs for '--version' (which
+  is dominated by interpreter startup and imports), along with
+  the time to start a bare interpreter for comparison; utilities
+  which take longer than the startup budget on top of the bare
+  interpreter are flagged, and the exit status is non-zero
+- the slowest imports when importing the module for the utility
+  (from 'python -X importtime', so requires Python 3.7+)
+"""
+
+import sys
+import os
+import time
+import subprocess
+from argparse import ArgumentParser
+
+# Directory containing the GFFUtils package
+PACKAGE_PARENT_DIR = os.path.dirname(
+    os.path.dirname(os.path.abspath(__file__)))
+
+# Default maximum time (in seconds) for '--version' on top of
+# the time to start a bare interpreter
+STARTUP_BUDGET = 0.5
+
+# Utilities to benchmark
+UTILITIES = ('gff_cleaner',
+             'gff_annotation_extractor',
+             'gtf_extract',
+             'gtf2bed',)
+
+def python_env():
+    """
+    Return environment for running Python with GFFUtils importable
+    """
+    env = dict(os.environ)
+    path = [PACKAGE_PARENT_DIR]
+    if env.get('PYTHONPATH'):
+        path.append(env['PYTHONPATH'])
+    env['PYTHONPATH'] = os.pathsep.join(path)
+    return env
+
+def time_command(cmd,repeat=5):
+    """
+    Return the best wall time in seconds to run a command
+    """
+    best = None
+    for i in range(repeat):
+        start_time = time.time()
+        subprocess.check_call(cmd,env=python_env(),
+                              stdout=subprocess.PIPE)
+        elapsed = time.time() - start_time
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def import_times(module):
+    """
+    Return the import times for a module from 'python -X importtime'
+
+    Returns:
+      List of (CUMULATIVE_USECS,SELF_USECS,MODULE) tuples, sorted
+      with the slowest first.
+    """
+    p = subprocess.Popen([sys.executable,'-X','importtime',
+                          '-c',"import %s" % module],
+                         env=python_env(),
+                         stdout=subprocess.PIPE,
+                         stderr=subprocess.PIPE,
+                         universal_newlines=True)
+    stdout,stderr = p.communicate()
+    times = []
+    for line in stderr.split('\n'):
+        # Lines look like:
+        # import time:  self [us] | cumulative | imported package
+        if not line.startswith("import time:"):
+            continue
+        try:
+            self_us,cumulative_us,name = line[12:].split('|')
+            times.append((int(cumulative_us),int(self_us),name.strip()))
+        except ValueError:
+            # Header line
+            continue
+    times.sort(reverse=True)
+    return times
+
+if __name__ == "__main__":
+    p = ArgumentParser(description="Benchmark the startup time of the "
+                       "GFFUtils command line utilities")
+    p.add_argument('--repeat',action='store',type=int,default=5,
+                   help="number of times to run each command (the best "
+                   "time is reported) (default: 5)")
+    p.add_argument('--top',action='store',type=int,default=10,
+                   help="number of slowest imports to report for each "
+                   "utility (default: 10)")
+    p.add_argument('--budget',action='store',type=float,
+                   default=STARTUP_BUDGET,
+                   help="maximum time in seconds for '--version' on top "
+                   "of starting a bare interpreter (default: %s)" %
+                   STARTUP_BUDGET)
+    args = p.parse_args()
+    baseline = time_command([sys.executable,'-c','pass'],
+                            repeat=args.repeat)
+    print("%-34s %8.3fs" % ("python (no imports)",baseline))
+    over_budget = []
+    for utility in UTILITIES:
+        elapsed = time_command([sys.executable,'-m',
+                                'GFFUtils.cli.%s' % utility,
+                                '--version'],
+                               repeat=args.repeat)
+        if elapsed - baseline > args.budget:
+            over_budget.append(utility)
+            status = " OVER BUDGET"
+        else:
+            status = ""
+        print("%-34s %8.3fs (+%.3fs)%s" % ("%s --version" % utility,
+                                            elapsed,
+                                            elapsed-baseline,
+                                            status))
+    if sys.version_info < (3,7):
+        print("Import times need Python 3.7+")
+        sys.exit(1 if over_budget else 0)
+    for utility in UTILITIES:
+        module = "GFFUtils.cli.%s" % utility
+        print("\nSlowest imports for %s (microseconds):" % module)
+        print("\t%10s\t%10s\t%s" % ("cumulative","self","module"))
+        for cumulative,self_us,name in import_times(module)[:args.top]:
+            print("\t%10d\t%10d\t%s" % (cumulative,self_us,name))
+    if over_budget:
+        print("\nOver startup budget of %.3fs: %s" % (args.budget,
+                                                     ', '.join(over_budget)))
+        sys.exit(1)
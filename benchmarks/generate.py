@@ -0,0 +1,388 @@
+#!/usr/bin/env python
+#
+#     generate.py: generate synthetic GFF3 and GTF data for benchmarks
+#     Copyright (C) University of Manchester 2020 Peter Briggs
+#
+
+"""
+Generate synthetic GFF3 and GTF files for benchmarking.
+
+The data are generated from a seeded random number generator, so
+the same seed and number of lines always produce the same file.
+
+Each gene has one or more transcripts (mRNAs), each of which has
+one or more exons and (for most transcripts) CDS records, e.g.
+
+- GFF3: gene -> mRNA -> exon/CDS (with the exon and CDS records
+  for each transcript interleaved), linked by the 'ID' and 'Parent'
+  attributes, with percent-encoded 'description' values and multi-
+  valued 'Alias' and 'Dbxref' attributes. Every record has an 'ID'
+  and the 'SGD' name of its gene (a small fraction of the names
+  are duplicated between genes), so that the SGD grouping and
+  duplicate resolution operations in gff_cleaner have data to
+  work on
+- GTF: gene, transcript, exon, CDS, start_codon and stop_codon
+  lines in the GENCODE style, with repeated 'tag' attributes
+
+Functions are also provided to generate a mapping file (for the
+SGD name handling operations in gff_cleaner, with the 'best' gene
+for each SGD name so that duplicates can be resolved) and a
+feature data file (for gff_annotation_extractor) to go with a
+GFF3 file.
+
+Usage:
+
+    python benchmarks/generate.py [--gtf] [--lines N] [--seed N] OUTFILE
+"""
+
+import sys
+import random
+from argparse import ArgumentParser
+
+#######################################################################
+# Constants
+#######################################################################
+
+# Default seed for the random number generator
+DEFAULT_SEED = 1234
+
+# Default number of lines to generate
+DEFAULT_NLINES = 10000
+
+# Fraction of genes which reuse the SGD name of an earlier gene
+DUPLICATE_SGD_FRACTION = 0.02
+
+# Words used to make up descriptions
+_WORDS = ('protein','putative','kinase','similar','to','domain',
+          'containing','transporter','subunit','binding','factor',
+          'hypothetical','membrane','regulator','family','member')
+
+#######################################################################
+# Classes
+#######################################################################
+
+class SyntheticGene(object):
+    """
+    Randomly generated gene model
+
+    Attributes:
+      gene_id: ID for the gene
+      name: name of the gene
+      sgd: SGD name for the gene
+      seqname: chromosome name
+      strand: '+' or '-'
+      start: start position of the gene
+      end: end position of the gene
+      description: description of the gene (may include
+        characters which need percent-encoding in GFF3)
+      aliases: list of alternative names
+      transcripts: list of tuples (TRANSCRIPT_ID,EXONS,CDS)
+        where EXONS is a list of (START,END) tuples and CDS
+        is a (START,END) tuple or None
+    """
+    def __init__(self,rng,index,seqname,start,sgd=None):
+        """
+        Generate a new random gene model
+
+        Arguments:
+          rng: random.Random instance
+          index: integer index for the gene
+          seqname: chromosome name
+          start: start position of the gene
+          sgd: (optional) SGD name to use (otherwise a
+            new name is generated from the index)
+        """
+        self.gene_id = "gene%07d" % index
+        self.name = "GEN%d" % index
+        self.sgd = sgd if sgd is not None else "Y%s%03d%s" % \
+                   ("ABCDEFGHIJKLMNOP"[index%16],index%1000,
+                    rng.choice('WC'))
+        self.seqname = seqname
+        self.strand = rng.choice('+-')
+        self.start = start
+        self.description = "%s, %s; %s=%d%%" % (
+            ' '.join([rng.choice(_WORDS) for i in range(3)]),
+            rng.choice(_WORDS),
+            rng.choice(_WORDS),
+            rng.randint(1,100))
+        self.aliases = ["%s_a%d" % (self.name,i)
+                        for i in range(rng.randint(1,3))]
+        self.transcripts = []
+        end = start
+        for i in range(rng.randint(1,3)):
+            exons = []
+            exon_start = start + rng.randint(0,200)
+            for j in range(rng.randint(1,6)):
+                exon_end = exon_start + rng.randint(50,500)
+                exons.append((exon_start,exon_end))
+                exon_start = exon_end + rng.randint(50,1000)
+            if rng.random() < 0.8:
+                cds = (exons[0][0] + rng.randint(0,40),
+                       exons[-1][1] - rng.randint(0,40))
+            else:
+                cds = None
+            self.transcripts.append(("%s.%d" % (self.gene_id,i+1),
+                                     exons,cds))
+            end = max(end,exons[-1][1])
+        self.end = end
+
+    def gff3_lines(self):
+        """
+        Return the GFF3 lines for the gene
+        """
+        lines = []
+        def add(feature,start,end,attributes):
+            lines.append("%s\tbench\t%s\t%d\t%d\t.\t%s\t%s\t%s\n" %
+                         (self.seqname,feature,start,end,self.strand,
+                          '0' if feature == 'CDS' else '.',
+                          ';'.join(attributes)))
+        add('gene',self.start,self.end,
+            ("ID=%s" % self.gene_id,
+             "Name=%s" % self.name,
+             "SGD=%s" % self.sgd,
+             "description=%s" % _percent_encode(self.description),
+             "Alias=%s" % ','.join(self.aliases),
+             "Dbxref=SGD:%s,GeneID:%s" % (self.sgd,
+                                          self.gene_id[4:])))
+        for transcript_id,exons,cds in self.transcripts:
+            add('mRNA',exons[0][0],exons[-1][1],
+                ("ID=%s" % transcript_id,
+                 "Parent=%s" % self.gene_id,
+                 "Name=%s" % transcript_id,
+                 "SGD=%s" % self.sgd))
+            for i,exon in enumerate(exons):
+                add('exon',exon[0],exon[1],
+                    ("ID=%s.exon%d" % (transcript_id,i+1),
+                     "Parent=%s" % transcript_id,
+                     "SGD=%s" % self.sgd))
+                if cds is None:
+                    continue
+                start = max(exon[0],cds[0])
+                end = min(exon[1],cds[1])
+                if start <= end:
+                    add('CDS',start,end,
+                        ("ID=cds_%s" % transcript_id,
+                         "Parent=%s" % transcript_id,
+                         "SGD=%s" % self.sgd))
+        return lines
+
+    def gtf_lines(self):
+        """
+        Return the GTF lines for the gene
+        """
+        lines = []
+        gene_attributes = 'gene_id "%s"; gene_type "protein_coding"; ' \
+                          'gene_name "%s";' % (self.gene_id,self.name)
+        def add(feature,start,end,attributes):
+            lines.append("%s\tbench\t%s\t%d\t%d\t.\t%s\t%s\t%s\n" %
+                         (self.seqname,feature,start,end,self.strand,
+                          '.' if feature in ('gene','transcript','exon')
+                          else '0',
+                          attributes))
+        add('gene',self.start,self.end,"%s level 2;" % gene_attributes)
+        for transcript_id,exons,cds in self.transcripts:
+            attributes = '%s transcript_id "%s"; transcript_name "%s"; ' \
+                         'level 2; tag "basic"; tag "CCDS";' % \
+                         (gene_attributes,transcript_id,transcript_id)
+            add('transcript',exons[0][0],exons[-1][1],attributes)
+            for i,exon in enumerate(exons):
+                add('exon',exon[0],exon[1],
+                    '%s exon_number %d;' % (attributes,i+1))
+            if cds is None:
+                continue
+            for i,exon in enumerate(exons):
+                start = max(exon[0],cds[0])
+                end = min(exon[1],cds[1])
+                if start <= end:
+                    add('CDS',start,end,
+                        '%s exon_number %d;' % (attributes,i+1))
+            add('start_codon',cds[0],cds[0]+2,attributes)
+            add('stop_codon',cds[1]+1,cds[1]+3,attributes)
+        return lines
+
+#######################################################################
+# Functions
+#######################################################################
+
+def generate_genes(nlines,seed=DEFAULT_SEED,gtf=False):
+    """
+    Generate gene models until enough lines have been produced
+
+    Arguments:
+      nlines: minimum number of lines the genes should produce
+      seed: seed for the random number generator
+      gtf: if True then count GTF lines (otherwise GFF3)
+
+    Returns:
+      Generator yielding tuples (GENE,LINES).
+    """
+    rng = random.Random(seed)
+    count = 0
+    index = 0
+    sgds = []
+    seqname = "chr1"
+    pos = 1000
+    while count < nlines:
+        index += 1
+        if sgds and rng.random() < DUPLICATE_SGD_FRACTION:
+            sgd = rng.choice(sgds)
+        else:
+            sgd = None
+        gene = SyntheticGene(rng,index,seqname,pos,sgd=sgd)
+        sgds.append(gene.sgd)
+        if gtf:
+            lines = gene.gtf_lines()
+        else:
+            lines = gene.gff3_lines()
+        count += len(lines)
+        yield (gene,lines)
+        pos = gene.end + rng.randint(100,5000)
+        if pos > 5000000:
+            # Move onto the next chromosome
+            seqname = "chr%d" % (int(seqname[3:]) + 1)
+            pos = 1000
+
+def make_gff3(filen,nlines=DEFAULT_NLINES,seed=DEFAULT_SEED):
+    """
+    Write a synthetic GFF3 file
+
+    Arguments:
+      filen: path to the output file
+      nlines: approximate number of lines to generate
+      seed: seed for the random number generator
+
+    Returns:
+      The number of lines written.
+    """
+    nwritten = 0
+    with open(filen,'wt') as fp:
+        fp.write("##gff-version 3\n")
+        for gene,lines in generate_genes(nlines,seed=seed):
+            fp.write(''.join(lines))
+            nwritten += len(lines)
+    return nwritten
+
+def make_gtf(filen,nlines=DEFAULT_NLINES,seed=DEFAULT_SEED):
+    """
+    Write a synthetic GTF file
+
+    Arguments:
+      filen: path to the output file
+      nlines: approximate number of lines to generate
+      seed: seed for the random number generator
+
+    Returns:
+      The number of lines written.
+    """
+    nwritten = 0
+    with open(filen,'wt') as fp:
+        fp.write("#!genome-build synthetic\n")
+        for gene,lines in generate_genes(nlines,seed=seed,gtf=True):
+            fp.write(''.join(lines))
+            nwritten += len(lines)
+    return nwritten
+
+def make_mapping_file(filen,nlines=DEFAULT_NLINES,seed=DEFAULT_SEED,
+                      missing_fraction=0.01):
+    """
+    Write a mapping file for a synthetic GFF3 file
+
+    The mapping file has a line (with columns 'name','chr',
+    'start','end','strand') for the first gene with each SGD
+    name, which is the 'best' gene when the name is
+    duplicated, plus additional genes which are missing from
+    the GFF3.
+
+    Arguments:
+      filen: path to the output file
+      nlines: number of lines used to generate the GFF3
+      seed: seed used to generate the GFF3
+      missing_fraction: fraction of genes in the mapping
+        file which aren't in the GFF3
+
+    Returns:
+      The number of lines written.
+    """
+    rng = random.Random(seed+1)
+    nwritten = 0
+    sgds = set()
+    with open(filen,'wt') as fp:
+        for gene,lines in generate_genes(nlines,seed=seed):
+            if gene.sgd in sgds:
+                # Duplicated SGD name
+                continue
+            sgds.add(gene.sgd)
+            fp.write("%s\t%s\t%d\t%d\t%s\n" % (gene.sgd,
+                                                 gene.seqname,
+                                                 gene.start,
+                                                 gene.end,
+                                                 gene.strand))
+            nwritten += 1
+            if rng.random() < missing_fraction:
+                fp.write("MISSING%d\t%s\t%d\t%d\t%s\n" % (nwritten,
+                                                          gene.seqname,
+                                                          gene.end+10,
+                                                          gene.end+90,
+                                                          gene.strand))
+                nwritten += 1
+    return nwritten
+
+def make_feature_data_file(filen,nlines=DEFAULT_NLINES,seed=DEFAULT_SEED):
+    """
+    Write a feature data file for a synthetic GFF3 file
+
+    The file has a header line followed by a line for each
+    transcript, with the transcript ID and a random count.
+
+    Arguments:
+      filen: path to the output file
+      nlines: number of lines used to generate the GFF3
+      seed: seed used to generate the GFF3
+
+    Returns:
+      The number of features written.
+    """
+    rng = random.Random(seed+2)
+    nwritten = 0
+    with open(filen,'wt') as fp:
+        fp.write("#ID\tcount\n")
+        for gene,lines in generate_genes(nlines,seed=seed):
+            for transcript_id,exons,cds in gene.transcripts:
+                fp.write("%s\t%d\n" % (transcript_id,
+                                       rng.randint(0,10000)))
+                nwritten += 1
+    return nwritten
+
+def _percent_encode(s):
+    """
+    Internal: percent-encode reserved characters for GFF3
+    """
+    for c in ('%',';','=','&',','):
+        s = s.replace(c,"%%%02X" % ord(c))
+    return s
+
+#######################################################################
+# Main program
+#######################################################################
+
+if __name__ == "__main__":
+    p = ArgumentParser(description="Generate synthetic GFF3 or GTF "
+                       "data for benchmarking")
+    p.add_argument('outfile',metavar="OUTFILE",
+                   help="file to write the data to")
+    p.add_argument('--gtf',action='store_true',
+                   help="generate GTF (default is GFF3)")
+    p.add_argument('--lines',action='store',type=int,
+                   default=DEFAULT_NLINES,
+                   help="approximate number of lines to generate "
+                   "(default: %d)" % DEFAULT_NLINES)
+    p.add_argument('--seed',action='store',type=int,
+                   default=DEFAULT_SEED,
+                   help="seed for the random number generator "
+                   "(default: %d)" % DEFAULT_SEED)
+    args = p.parse_args()
+    if args.gtf:
+        nlines = make_gtf(args.outfile,args.lines,seed=args.seed)
+    else:
+        nlines = make_gff3(args.outfile,args.lines,seed=args.seed)
+    print("Wrote %d lines to %s" % (nlines,args.outfile))
@@ -0,0 +1,436 @@
+#!/usr/bin/env python
+#
+#     run_benchmarks.py: run performance benchmarks for GFFUtils
+#     Copyright (C) University of Manchester 2020 Peter Briggs
+#
+
+"""
+Run performance benchmarks for GFFUtils on synthetic data.
+
+Synthetic GFF3 and GTF files (see 'generate.py') are created at
+each of the requested scales, and each benchmark is timed on
+them. The benchmarks cover:
+
+- reading: GFFIterator, GTFIterator, GFFFile load and write
+- cleaning: each of the functions in GFFUtils.clean
+- annotation: GFFAnnotationLookup build and query
+- command line: each of the utilities run end-to-end
+
+The results are written as JSON, so that they can be compared
+between versions to detect regressions, e.g.
+
+    python benchmarks/run_benchmarks.py --lines 10000 --lines 100000 \\
+        -o results.json
+
+Use '--list' to see the names of the benchmarks, and '--filter'
+to only run those with names containing a string.
+
+The exit status is non-zero if any of the benchmarks failed.
+"""
+
+import sys
+import os
+import time
+import json
+import shutil
+import platform
+import tempfile
+import subprocess
+from argparse import ArgumentParser
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0,os.path.dirname(BENCHMARK_DIR))
+sys.path.insert(0,BENCHMARK_DIR)
+from bcftbx.TabFile import TabFile
+from GFFUtils import get_version
+from GFFUtils.GFFFile import GFFFile
+from GFFUtils.GFFFile import GFFIterator
+from GFFUtils.GTFFile import GTFIterator
+from GFFUtils.clean.generic import GFFUpdateAttributes
+from GFFUtils.clean.generic import GFFApplyAttributeRules
+from GFFUtils.clean.generic import GFFAddExonIDs
+from GFFUtils.clean.generic import GFFAddIDAttributes
+from GFFUtils.clean.generic import GFFDecodeAttributes
+from GFFUtils.clean.sgd import IndexedMappingData
+from GFFUtils.clean.sgd import GroupByID
+from GFFUtils.clean.sgd import GFFGetDuplicateSGDs
+from GFFUtils.clean.sgd import GFFResolveDuplicateSGDs
+from GFFUtils.clean.sgd import GFFGroupSGDs
+from GFFUtils.clean.sgd import GFFInsertMissingGenes
+from GFFUtils.annotation import GFFAnnotationLookup
+from generate import DEFAULT_SEED
+from generate import make_gff3
+from generate import make_gtf
+from generate import make_mapping_file
+from generate import make_feature_data_file
+
+#######################################################################
+# Module globals
+#######################################################################
+
+# Registered benchmarks as (NAME,FORMAT,FUNCTION) tuples
+BENCHMARKS = []
+
+#######################################################################
+# Classes
+#######################################################################
+
+class Workspace(object):
+    """
+    Temporary directory with synthetic data for one scale
+
+    Attributes:
+      dir: path to the temporary directory
+      nlines: number of lines requested
+      gff3: path to the GFF3 file
+      gtf: path to the GTF file
+      mapping: path to the mapping file (for the GFF3)
+      feature_data: path to the feature data file (for the GFF3)
+      gff3_lines: number of lines in the GFF3 file
+      gtf_lines: number of lines in the GTF file
+    """
+    def __init__(self,nlines,seed=DEFAULT_SEED,tmp_dir=None):
+        """
+        Create the temporary directory and synthetic data
+
+        Arguments:
+          nlines: approximate number of lines for the
+            GFF3 and GTF files
+          seed: seed for the random number generator
+          tmp_dir: (optional) directory to create the
+            temporary directory under
+        """
+        self.nlines = nlines
+        self.dir = tempfile.mkdtemp(prefix="gffutils_bench.",
+                                    dir=tmp_dir)
+        self.gff3 = os.path.join(self.dir,"bench.gff")
+        self.gtf = os.path.join(self.dir,"bench.gtf")
+        self.mapping = os.path.join(self.dir,"mapping.txt")
+        self.feature_data = os.path.join(self.dir,"features.txt")
+        self.gff3_lines = make_gff3(self.gff3,nlines,seed=seed)
+        self.gtf_lines = make_gtf(self.gtf,nlines,seed=seed)
+        make_mapping_file(self.mapping,nlines,seed=seed)
+        make_feature_data_file(self.feature_data,nlines,seed=seed)
+
+    def path(self,name):
+        """
+        Return the path for a file in the workspace
+        """
+        return os.path.join(self.dir,name)
+
+    def remove(self):
+        """
+        Remove the temporary directory
+        """
+        shutil.rmtree(self.dir)
+
+#######################################################################
+# Functions
+#######################################################################
+
+def benchmark(name,format='gff3'):
+    """
+    Decorator registering a benchmark
+
+    The decorated function is called with a Workspace and
+    should do any setup, and then return a function which
+    performs the operation to be timed. The number of lines
+    in the input file for the specified format is used to
+    calculate the rate.
+
+    Arguments:
+      name: name of the benchmark
+      format: input file used by the benchmark ('gff3' or
+        'gtf')
+    """
+    def wrapper(func):
+        BENCHMARKS.append((name,format,func))
+        return func
+    return wrapper
+
+def run_command(ws,args):
+    """
+    Run a GFFUtils utility as a subprocess
+
+    Arguments:
+      ws: Workspace instance (used as the working directory)
+      args: list with the name of the utility module (e.g.
+        'gtf_extract') followed by its arguments
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [os.path.dirname(BENCHMARK_DIR)] +
+        [p for p in env.get('PYTHONPATH','').split(os.pathsep) if p])
+    cmd = [sys.executable,'-m','GFFUtils.cli.%s' % args[0]] + args[1:]
+    with open(os.devnull,'w') as devnull:
+        status = subprocess.call(cmd,cwd=ws.dir,env=env,
+                                 stdout=devnull,stderr=devnull)
+    if status != 0:
+        raise Exception("'%s' returned exit code %d" % (' '.join(args),
+                                                        status))
+
+def run_benchmarks(ws,repeat=3,name_filter=None):
+    """
+    Run the registered benchmarks on a workspace
+
+    Arguments:
+      ws: Workspace instance
+      repeat: number of times to run each benchmark (the
+        best time is reported)
+      name_filter: (optional) list of strings; only run
+        benchmarks whose names contain one of the strings
+
+    Returns:
+      List of dictionaries with the results.
+    """
+    results = []
+    for name,format,func in BENCHMARKS:
+        if name_filter and not [f for f in name_filter if f in name]:
+            continue
+        nlines = ws.gff3_lines if format == 'gff3' else ws.gtf_lines
+        result = dict(name=name,
+                      format=format,
+                      lines=nlines,
+                      repeat=repeat)
+        try:
+            timings = []
+            for i in range(repeat):
+                operation = func(ws)
+                start_time = time.time()
+                operation()
+                timings.append(time.time() - start_time)
+            result['timings'] = timings
+            result['seconds'] = min(timings)
+            result['lines_per_second'] = nlines/max(min(timings),1e-9)
+            sys.stderr.write("%-40s %8d lines %10.3fs %12.1f lines/s\n" %
+                             (name,nlines,result['seconds'],
+                              result['lines_per_second']))
+        except Exception as ex:
+            result['error'] = str(ex)
+            sys.stderr.write("%-40s %8d lines FAILED: %s\n" %
+                             (name,nlines,ex))
+        results.append(result)
+    return results
+
+#######################################################################
+# Benchmarks
+#######################################################################
+
+@benchmark("GFFIterator")
+def bench_gff_iterator(ws):
+    def op():
+        for line in GFFIterator(ws.gff3):
+            pass
+    return op
+
+@benchmark("GTFIterator",format='gtf')
+def bench_gtf_iterator(ws):
+    def op():
+        for line in GTFIterator(ws.gtf):
+            pass
+    return op
+
+@benchmark("GFFFile.load")
+def bench_gff_file_load(ws):
+    return lambda: GFFFile(ws.gff3)
+
+@benchmark("GFFFile.write")
+def bench_gff_file_write(ws):
+    gff = GFFFile(ws.gff3)
+    return lambda: gff.write(ws.path("out.gff"))
+
+@benchmark("clean.GFFUpdateAttributes")
+def bench_update_attributes(ws):
+    gff = GFFFile(ws.gff3)
+    return lambda: GFFUpdateAttributes(gff,
+                                       update_keys={'Name':'SGD'},
+                                       exclude_keys=['Dbxref'])
+
+# Attribute rules used by the attribute rule benchmarks
+ATTRIBUTE_RULES = (('update',{'Name':'SGD'},True),
+                   ('exclude',['Dbxref']),
+                   ('exclude_nokeys',),
+                   ('decode',))
+
+@benchmark("clean.GFFApplyAttributeRules")
+def bench_apply_attribute_rules(ws):
+    gff = GFFFile(ws.gff3)
+    return lambda: GFFApplyAttributeRules(gff,ATTRIBUTE_RULES)
+
+@benchmark("clean.GFFAddExonIDs")
+def bench_add_exon_ids(ws):
+    gff = GFFFile(ws.gff3)
+    return lambda: GFFAddExonIDs(gff)
+
+@benchmark("clean.GFFAddIDAttributes")
+def bench_add_id_attributes(ws):
+    gff = GFFFile(ws.gff3)
+    # Remove the exon IDs so that there are IDs to add
+    for record in gff:
+        if record['feature'] == 'exon':
+            del(record['attributes']['ID'])
+    return lambda: GFFAddIDAttributes(gff)
+
+@benchmark("clean.GFFDecodeAttributes")
+def bench_decode_attributes(ws):
+    gff = GFFFile(ws.gff3)
+    return lambda: GFFDecodeAttributes(gff)
+
+@benchmark("clean.GroupByID")
+def bench_group_by_id(ws):
+    gff = GFFFile(ws.gff3)
+    GFFGroupSGDs(gff)
+    return lambda: GroupByID(gff)
+
+@benchmark("clean.GFFGetDuplicateSGDs")
+def bench_get_duplicate_sgds(ws):
+    gff = GFFFile(ws.gff3)
+    return lambda: GFFGetDuplicateSGDs(gff)
+
+@benchmark("clean.GFFResolveDuplicateSGDs")
+def bench_resolve_duplicate_sgds(ws):
+    gff = GFFFile(ws.gff3)
+    mapping = IndexedMappingData(
+        TabFile(ws.mapping,column_names=('name','chr','start','end',
+                                         'strand')))
+    GFFGroupSGDs(gff)
+    duplicates = GFFGetDuplicateSGDs(gff)
+    return lambda: GFFResolveDuplicateSGDs(gff,mapping,duplicates)
+
+@benchmark("clean.GFFGroupSGDs")
+def bench_group_sgds(ws):
+    gff = GFFFile(ws.gff3)
+    return lambda: GFFGroupSGDs(gff)
+
+@benchmark("clean.GFFInsertMissingGenes")
+def bench_insert_missing_genes(ws):
+    gff = GFFFile(ws.gff3)
+    mapping = IndexedMappingData(
+        TabFile(ws.mapping,column_names=('name','chr','start','end',
+                                         'strand')))
+    return lambda: GFFInsertMissingGenes(gff,mapping)
+
+@benchmark("GFFAnnotationLookup.build")
+def bench_annotation_lookup_build(ws):
+    return lambda: GFFAnnotationLookup(GFFIterator(ws.gff3),compact=True)
+
+@benchmark("GFFAnnotationLookup.build.gtf",format='gtf')
+def bench_annotation_lookup_build_gtf(ws):
+    return lambda: GFFAnnotationLookup(GTFIterator(ws.gtf,
+                                                   feature_types=('gene',)),
+                                       compact=True)
+
+@benchmark("GFFAnnotationLookup.query")
+def bench_annotation_lookup_query(ws):
+    lookup = GFFAnnotationLookup(GFFIterator(ws.gff3),compact=True)
+    with open(ws.feature_data,'rt') as fp:
+        ids = [line.split('\t')[0] for line in fp
+               if not line.startswith('#')]
+    def op():
+        lookup.clearCache()
+        for idx in ids:
+            lookup.getAnnotation(idx)
+    return op
+
+@benchmark("cli.gff_cleaner")
+def bench_cli_gff_cleaner(ws):
+    return lambda: run_command(ws,['gff_cleaner',
+                                   '-o',ws.path("cleaned.gff"),
+                                   '--add-missing-ids',
+                                   '--add-exon-ids',
+                                   '--clean-replace-attributes',
+                                   ws.gff3])
+
+@benchmark("cli.gff_annotation_extractor")
+def bench_cli_gff_annotation_extractor(ws):
+    return lambda: run_command(ws,['gff_annotation_extractor',
+                                   '-o',ws.path("annotated.txt"),
+                                   ws.gff3,
+                                   ws.feature_data])
+
+@benchmark("cli.gtf_extract",format='gtf')
+def bench_cli_gtf_extract(ws):
+    return lambda: run_command(ws,['gtf_extract',
+                                   '-o',ws.path("extract.txt"),
+                                   '-f','exon',
+                                   '--fields',
+                                   'chrom,start,end,gene_id,gene_name',
+                                   ws.gtf])
+
+@benchmark("cli.gtf2bed",format='gtf')
+def bench_cli_gtf2bed(ws):
+    return lambda: run_command(ws,['gtf2bed',
+                                   '-o',ws.path("genes.bed"),
+                                   ws.gtf])
+
+@benchmark("cli.gtf2bed.bed12",format='gtf')
+def bench_cli_gtf2bed_bed12(ws):
+    return lambda: run_command(ws,['gtf2bed',
+                                   '--bed12',
+                                   '-o',ws.path("transcripts.bed"),
+                                   ws.gtf])
+
+#######################################################################
+# Main program
+#######################################################################
+
+if __name__ == "__main__":
+    p = ArgumentParser(description="Run performance benchmarks for "
+                       "GFFUtils on synthetic GFF3 and GTF data and "
+                       "output the results as JSON")
+    p.add_argument('--lines',action='append',type=int,dest='scales',
+                   help="approximate number of lines in the synthetic "
+                   "data; can be specified multiple times to run at "
+                   "different scales (default: 10000)")
+    p.add_argument('--seed',action='store',type=int,default=DEFAULT_SEED,
+                   help="seed for generating the synthetic data "
+                   "(default: %d)" % DEFAULT_SEED)
+    p.add_argument('--repeat',action='store',type=int,default=3,
+                   help="number of times to run each benchmark; the "
+                   "best time is reported (default: 3)")
+    p.add_argument('--filter',action='append',dest='name_filter',
+                   help="only run benchmarks with names containing "
+                   "NAME_FILTER (can be specified multiple times)")
+    p.add_argument('--list',action='store_true',
+                   help="list the benchmarks and exit")
+    p.add_argument('--tmp-dir',action='store',default=None,
+                   help="directory to write the synthetic data under")
+    p.add_argument('-o',action='store',dest='output_json',default=None,
+                   help="write the results to OUTPUT_JSON (default is "
+                   "to write to stdout)")
+    args = p.parse_args()
+    if args.list:
+        for name,format,func in BENCHMARKS:
+            print("%s (%s)" % (name,format))
+        sys.exit(0)
+    scales = args.scales if args.scales else [10000]
+    results = []
+    for nlines in scales:
+        sys.stderr.write("Generating synthetic data (%d lines)\n" %
+                         nlines)
+        ws = Workspace(nlines,seed=args.seed,tmp_dir=args.tmp_dir)
+        try:
+            for result in run_benchmarks(ws,repeat=args.repeat,
+                                         name_filter=args.name_filter):
+                result['scale'] = nlines
+                results.append(result)
+        finally:
+            ws.remove()
+    report = dict(metadata=dict(gffutils_version=get_version(),
+                                python_version=platform.python_version(),
+                                platform=platform.platform(),
+                                timestamp=time.strftime(
+                                    "%Y-%m-%dT%H:%M:%S"),
+                                seed=args.seed,
+                                repeat=args.repeat),
+                  results=results)
+    if args.output_json:
+        with open(args.output_json,'wt') as fp:
+            json.dump(report,fp,indent=2,sort_keys=True)
+        sys.stderr.write("Wrote results to %s\n" % args.output_json)
+    else:
+        json.dump(report,sys.stdout,indent=2,sort_keys=True)
+        sys.stdout.write("\n")
+    failed = [result for result in results if 'error' in result]
+    if failed:
+        sys.stderr.write("%d benchmark(s) FAILED\n" % len(failed))
+        sys.exit(1)
@@ -85,6 +85,86 @@ u"""chr1\tTest\tCDS\t28789\t29049\t0\t-\t0\tID=abc;kaks=-le+100;SGD=;ncbi=-1e+10
         attributes = gff[0]['attributes']
         self.assertEqual(attributes['Name'],'def')
 
+class TestGFFApplyAttributeRules(unittest.TestCase):
+
+    def setUp(self):
+        # Make file-like object to read data in
+        self.fp = StringIO(
+u"""chr1\tTest\tCDS\t28789\t29049\t0\t-\t0\tID=abc;kaks=-le+100;SGD=YEL0W;ncbi=-1e+100;Name=def;123-234;456-567
+chr1\tTest\tCDS\t29050\t29160\t0\t-\t0\tID=ghi;kaks=-le+100;SGD=;ncbi=-1e+100;Name=jkl;description=semicolon%3B here
+""")
+
+    def test_apply_attribute_rules(self):
+        """
+        GFFApplyAttributeRules: apply multiple rules in one pass
+        """
+        gff = GFFFile('test.gff',self.fp)
+        GFFApplyAttributeRules(gff,[('update',{'ID':'SGD','Name':'SGD'},True),
+                                    ('exclude',['kaks']),
+                                    ('exclude',['ncbi']),
+                                    ('exclude_nokeys',)])
+        # Check first record
+        attributes = gff[0]['attributes']
+        self.assertEqual(attributes.keys(),['ID','SGD','Name'])
+        self.assertEqual(attributes['ID'],'YEL0W')
+        self.assertEqual(attributes['Name'],'YEL0W')
+        self.assertEqual(attributes.nokeys(),[])
+        # Check second record (empty SGD so no update)
+        attributes = gff[1]['attributes']
+        self.assertEqual(attributes.keys(),['ID','SGD','Name','description'])
+        self.assertEqual(attributes['ID'],'ghi')
+        self.assertEqual(attributes['Name'],'jkl')
+        self.assertEqual(str(attributes),
+                         "ID=ghi;SGD=;Name=jkl;description=semicolon%3B here")
+
+    def test_apply_attribute_rules_decode(self):
+        """
+        GFFApplyAttributeRules: apply 'decode' rule
+        """
+        gff = GFFFile('test.gff',self.fp)
+        GFFApplyAttributeRules(gff,[('exclude',['kaks','ncbi','SGD']),
+                                    ('decode',)])
+        self.assertEqual(str(gff[1]['attributes']),
+                         "ID=ghi;Name=jkl;description=semicolon; here")
+
+    def test_apply_attribute_rules_order(self):
+        """
+        GFFApplyAttributeRules: rules are applied in order
+        """
+        gff = GFFFile('test.gff',self.fp)
+        GFFApplyAttributeRules(gff,[('exclude',['SGD']),
+                                    ('update',{'Name':'SGD'},True)])
+        attributes = gff[0]['attributes']
+        self.assertTrue('SGD' not in attributes)
+        self.assertEqual(attributes['Name'],'def')
+
+    def test_apply_attribute_rules_update_in_attribute_order(self):
+        """
+        GFFApplyAttributeRules: keys are updated in attribute order
+        """
+        update_keys = {'Name':'ID','ID':'SGD'}
+        gff = GFFFile('test.gff',StringIO(self.fp.getvalue()))
+        GFFApplyAttributeRules(gff,[('update',update_keys,True)])
+        # 'ID' precedes 'Name' in the attributes, so is updated
+        # first and 'Name' gets the updated value
+        attributes = gff[0]['attributes']
+        self.assertEqual(attributes['ID'],'YEL0W')
+        self.assertEqual(attributes['Name'],'YEL0W')
+        # Same result as GFFUpdateAttributes
+        expected = GFFFile('test.gff',StringIO(self.fp.getvalue()))
+        GFFUpdateAttributes(expected,update_keys)
+        for data,expected_data in zip(gff,expected):
+            self.assertEqual(str(data['attributes']),
+                             str(expected_data['attributes']))
+
+    def test_compile_attribute_rules_bad_rule(self):
+        """
+        GFFCompileAttributeRules: raise ValueError for unknown rule
+        """
+        self.assertRaises(ValueError,
+                          GFFCompileAttributeRules,
+                          [('exclude',['kaks']),('rename',{})])
+
 class TestGFFAddExonIDs(unittest.TestCase):
 
     def setUp(self):
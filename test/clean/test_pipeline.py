@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+import unittest
+import tempfile
+import shutil
+import os
+from io import StringIO
+from GFFUtils.GFFFile import GFFFile
+from GFFUtils.clean.generic import GFFAddExonIDs
+from GFFUtils.clean.generic import GFFDecodeAttributes
+from GFFUtils.clean.pipeline import CleaningPipeline
+
+class TestCleaningPipeline(unittest.TestCase):
+
+    def setUp(self):
+        # Make file-like object for GFF pseudo-data
+        self.fp = StringIO(
+u"""chr1\tTest\texon\t1890\t3287\t.\t+\t.\tParent=DDB0216437;Note=ORF2%3B fragment
+chr1\tTest\tCDS\t5505\t7769\t.\t+\t.\tParent=DDB0216439
+chr1\tTest\texon\t9635\t9889\t.\t-\t.\tParent=DDB0216441
+""")
+        # Temporary working dir
+        self.wd = tempfile.mkdtemp()
+
+    def tearDown(self):
+        # Remove temporary working dir
+        if os.path.isdir(self.wd):
+            shutil.rmtree(self.wd)
+
+    def test_cleaning_pipeline(self):
+        """
+        CleaningPipeline: run stages in order
+        """
+        def prepend(gff_data,prefix):
+            for data in gff_data:
+                data['seqname'] = prefix+str(data['seqname'])
+        pipeline = CleaningPipeline()
+        pipeline.add_stage("prepend",prepend,"Sbay_")
+        pipeline.add_stage("exon IDs",GFFAddExonIDs)
+        pipeline.add_stage("decode",GFFDecodeAttributes)
+        self.assertEqual(pipeline.stages(),["prepend","exon IDs","decode"])
+        gff = pipeline.run(GFFFile('test.gff',self.fp))
+        self.assertEqual(str(gff[0]),
+                         "Sbay_chr1\tTest\texon\t1890\t3287\t.\t+\t.\t"
+                         "ID=exon:DDB0216437:00000001;Parent=DDB0216437;"
+                         "Note=ORF2; fragment")
+        self.assertEqual(str(gff[1]),
+                         "Sbay_chr1\tTest\tCDS\t5505\t7769\t.\t+\t.\t"
+                         "Parent=DDB0216439")
+        self.assertEqual(str(gff[2]),
+                         "Sbay_chr1\tTest\texon\t9635\t9889\t.\t-\t.\t"
+                         "ID=exon:DDB0216441:00000002;Parent=DDB0216441")
+        # Check timings
+        timings = pipeline.timings()
+        self.assertEqual([t[0] for t in timings],
+                         ["prepend","exon IDs","decode"])
+        for t in timings:
+            self.assertTrue(t[1] >= 0.0)
+
+    def test_cleaning_pipeline_checkpoints(self):
+        """
+        CleaningPipeline: write checkpoint files after each stage
+        """
+        checkpoint_base = os.path.join(self.wd,"test")
+        pipeline = CleaningPipeline(checkpoint_base=checkpoint_base)
+        pipeline.add_stage("exon IDs",GFFAddExonIDs)
+        pipeline.add_stage("decode",GFFDecodeAttributes)
+        self.assertEqual(pipeline.checkpoint_file(1),
+                         os.path.join(self.wd,"test_stage1.gff"))
+        pipeline.run(GFFFile('test.gff',self.fp))
+        for checkpoint in ("test_stage1.gff","test_stage2.gff"):
+            self.assertTrue(os.path.exists(os.path.join(self.wd,
+                                                        checkpoint)))
+        # Checkpoint data reflects the state after each stage
+        self.assertEqual(
+            str(GFFFile(os.path.join(self.wd,"test_stage1.gff"))[0]),
+            "chr1\tTest\texon\t1890\t3287\t.\t+\t.\t"
+            "ID=exon:DDB0216437:00000001;Parent=DDB0216437;"
+            "Note=ORF2%3B fragment")
+
+    def test_cleaning_pipeline_first_stage(self):
+        """
+        CleaningPipeline: start from a later stage
+        """
+        def prepend(gff_data,prefix):
+            for data in gff_data:
+                data['seqname'] = prefix+str(data['seqname'])
+        completed = []
+        def after_stage(n,name,gff_data):
+            completed.append((n,name,str(gff_data[0]['seqname'])))
+        pipeline = CleaningPipeline()
+        pipeline.add_stage("prepend 1",prepend,"A_")
+        pipeline.add_stage("prepend 2",prepend,"B_")
+        pipeline.add_stage("prepend 3",prepend,"C_")
+        gff = pipeline.run(GFFFile('test.gff',self.fp),first_stage=2,
+                           after_stage=after_stage)
+        self.assertEqual(str(gff[0]['seqname']),"C_B_chr1")
+        self.assertEqual(completed,[(2,"prepend 2","B_chr1"),
+                                    (3,"prepend 3","C_B_chr1")])
+        self.assertEqual([t[0] for t in pipeline.timings()],
+                         ["prepend 2","prepend 3"])
@@ -191,6 +191,27 @@ YEL0W02\tchr2\t40406\t40864\t-
         self.assertEqual(len(result["unresolved_sgds_no_overlaps"]),0)
         self.assertEqual(len(result["unresolved_sgds_multiple_matches"]),0)
     
+    def test_resolve_duplicate_sgds_indexed_mapping_data(self):
+        """
+        GFFResolveDuplicateSGDs: use indexed mapping data
+        """
+        # Load data
+        gff = GFFFile('test.gff',self.fp)
+        mapping = IndexedMappingData(
+            TabFile('map.txt',self.mp_resolve_all,
+                    column_names=('name','chr','start','end','strand')))
+        # Fetch duplicates and resolve
+        duplicates = GFFGetDuplicateSGDs(gff)
+        result = GFFResolveDuplicateSGDs(gff,mapping,duplicates,1000)
+        # Check results of resolution
+        discard = result["discard"]
+        self.assertEqual(len(discard),3,"wrong number of duplicates marked for discard")
+        self.assertTrue(discard[0] == gff[0])
+        self.assertTrue(discard[1] == gff[1])
+        self.assertTrue(discard[2] == gff[2])
+        self.assertEqual(len(result["resolved_sgds"]),3)
+        self.assertEqual(len(result["unresolved_sgds"]),0)
+
     def test_resolve_duplicate_sgds_no_mapping_gene(self):
         """
         GFFResolveDuplicateSGDs: missing mapping gene
@@ -335,6 +356,36 @@ YEL0W02\tchr2\t40406\t40864\t-
         self.assertTrue('YEL0W01' in result["unresolved_sgds_multiple_matches"])
         self.assertTrue('YEL0W01' in result["unresolved_sgds"])
 
+class TestIndexedMappingData(unittest.TestCase):
+
+    def setUp(self):
+        # Make a file-like object for mapping data
+        self.mp = StringIO(
+u"""YEL0W01\tchr1\t28789\t29049\t-
+YEL0W03\tchr1\t34525\t37004\t-
+YEL0W01\tchr1\t39195\t39569\t-
+YEL0W02\tchr2\t40406\t40864\t-
+""")
+
+    def test_indexed_mapping_data(self):
+        """
+        IndexedMappingData: look up genes by name
+        """
+        mapping = IndexedMappingData(
+            TabFile('map.txt',self.mp,
+                    column_names=('name','chr','start','end','strand')))
+        self.assertEqual(len(mapping),4)
+        self.assertEqual([gene['name'] for gene in mapping],
+                         ['YEL0W01','YEL0W03','YEL0W01','YEL0W02'])
+        genes = mapping.lookup('name','YEL0W01')
+        self.assertEqual(len(genes),2)
+        self.assertEqual(genes[0]['start'],28789)
+        self.assertEqual(genes[1]['start'],39195)
+        self.assertEqual(mapping.lookup('name','YEL0W04'),[])
+        genes = mapping.lookup('chr','chr2')
+        self.assertEqual(len(genes),1)
+        self.assertEqual(genes[0]['name'],'YEL0W02')
+
 class TestGFFGroupSGDs(unittest.TestCase):
 
     def setUp(self):
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+
+import unittest
+import logging
+from io import StringIO
+from GFFUtils.GFFFile import ANNOTATION
+from GFFUtils.GTFFile import GTFIterator
+from GFFUtils.cli.gtf2bed import GeneSpanAggregator
+from GFFUtils.cli.gtf2bed import TranscriptModel
+from GFFUtils.cli.gtf2bed import TranscriptModelBuilder
+from GFFUtils.cli.gtf2bed import write_gene_lines
+
+gtf_data = u"""#!genome-build GRCm38.p3
+chr1\tHAVANA\texon\t3073253\t3073400\t.\t+\t.\tgene_id "G1"; transcript_id "T1"; gene_name "Gene1"; transcript_name "Gene1-001";
+chr1\tHAVANA\texon\t3073500\t3074322\t.\t+\t.\tgene_id "G1"; transcript_id "T1"; gene_name "Gene1"; transcript_name "Gene1-001";
+chr1\tHAVANA\texon\t3073100\t3073300\t.\t+\t.\tgene_id "G1"; transcript_id "T2"; gene_name "Gene1"; transcript_name "Gene1-002";
+chr1\tHAVANA\tCDS\t3073200\t3073300\t.\t+\t0\tgene_id "G1"; transcript_id "T2"; gene_name "Gene1"; transcript_name "Gene1-002";
+chr2\tHAVANA\texon\t5000\t6000\t.\t-\t.\tgene_id "G2"; transcript_id "T3";
+chr2\tHAVANA\texon\t7000\t7500\t.\t-\t.\tgene_id "G2"; transcript_id "T3";
+"""
+
+def aggregate(data,**kws):
+    # Helper to run GeneSpanAggregator on GTF data
+    fp = StringIO()
+    spans = GeneSpanAggregator(fp,**kws)
+    for line in GTFIterator(fp=StringIO(data)):
+        if line.type == ANNOTATION:
+            spans.add(line)
+    spans.finish()
+    return fp.getvalue()
+
+def gene_lines(data):
+    # Helper to run write_gene_lines on GTF data
+    fp = StringIO()
+    write_gene_lines(GTFIterator(fp=StringIO(data)),fp)
+    return fp.getvalue()
+
+class TestWriteGeneLines(unittest.TestCase):
+
+    def test_write_gene_lines(self):
+        """
+        write_gene_lines: output a line for each gene
+        """
+        data = u"chr1\tHAVANA\tgene\t3073000\t3075000\t.\t+\t.\tgene_id \"G1\"; gene_name \"Gene1\";\n" + gtf_data
+        self.assertEqual(gene_lines(data),
+                         u"Gene1\tchr1\t3073000\t3075000\t+\tgene\n")
+
+    def test_write_gene_lines_repeated_gene_names(self):
+        """
+        write_gene_lines: output consecutive genes with the same name
+        """
+        data = u"""chr1\tENSEMBL\tgene\t1000\t1100\t.\t+\t.\tgene_id "G1"; gene_name "Y_RNA";
+chr1\tENSEMBL\texon\t1000\t1100\t.\t+\t.\tgene_id "G1"; transcript_id "T1"; gene_name "Y_RNA";
+chr1\tENSEMBL\tgene\t5000\t5100\t.\t+\t.\tgene_id "G2"; gene_name "Y_RNA";
+chr1\tENSEMBL\texon\t5000\t5100\t.\t+\t.\tgene_id "G2"; transcript_id "T2"; gene_name "Y_RNA";
+"""
+        # Capture warnings
+        warnings = StringIO()
+        handler = logging.StreamHandler(warnings)
+        logger = logging.getLogger()
+        logger.addHandler(handler)
+        try:
+            self.assertEqual(gene_lines(data),
+                             u"Y_RNA\tchr1\t1000\t1100\t+\tgene\n"
+                             u"Y_RNA\tchr1\t5000\t5100\t+\tgene\n")
+        finally:
+            logger.removeHandler(handler)
+        self.assertEqual(warnings.getvalue(),u"")
+
+class TestGeneSpanAggregator(unittest.TestCase):
+
+    def test_gene_spans_from_exons(self):
+        """
+        GeneSpanAggregator: compute gene spans from exons
+        """
+        self.assertEqual(aggregate(gtf_data),
+                         u"Gene1\tchr1\t3073100\t3074322\t+\tgene\n"
+                         u"G2\tchr2\t5000\t7500\t-\tgene\n")
+
+    def test_gene_spans_from_exons_sorted(self):
+        """
+        GeneSpanAggregator: compute gene spans from exons for sorted input
+        """
+        self.assertEqual(aggregate(gtf_data,sorted_input=True),
+                         u"Gene1\tchr1\t3073100\t3074322\t+\tgene\n"
+                         u"G2\tchr2\t5000\t7500\t-\tgene\n")
+
+    def test_transcript_spans_from_exons(self):
+        """
+        GeneSpanAggregator: compute gene and transcript spans from exons
+        """
+        self.assertEqual(aggregate(gtf_data,transcripts=True),
+                         u"Gene1\tchr1\t3073100\t3074322\t+\tgene\n"
+                         u"Gene1-001\tchr1\t3073253\t3074322\t+\ttranscript\n"
+                         u"Gene1-002\tchr1\t3073100\t3073300\t+\ttranscript\n"
+                         u"G2\tchr2\t5000\t7500\t-\tgene\n"
+                         u"T3\tchr2\t5000\t7500\t-\ttranscript\n")
+
+    def test_explicit_gene_lines(self):
+        """
+        GeneSpanAggregator: use span from explicit gene lines
+        """
+        data = u"chr1\tHAVANA\tgene\t3073000\t3075000\t.\t+\t.\tgene_id \"G1\"; gene_name \"Gene1\";\n" + gtf_data
+        self.assertEqual(aggregate(data),
+                         u"Gene1\tchr1\t3073000\t3075000\t+\tgene\n"
+                         u"G2\tchr2\t5000\t7500\t-\tgene\n")
+
+class TestTranscriptModel(unittest.TestCase):
+
+    def test_transcript_model_bed12(self):
+        """
+        TranscriptModel: output coding transcript as BED12
+        """
+        t = TranscriptModel("T1","chr1","-")
+        t.add_exon(1501,1800)
+        t.add_exon(1001,1200)
+        t.add_cds(1501,1600)
+        t.add_cds(1101,1200)
+        self.assertEqual(t.bed12(),
+                         "chr1\t1000\t1800\tT1\t0\t-\t1100\t1600\t0\t2\t"
+                         "200,300,\t0,500,")
+
+    def test_transcript_model_bed12_non_coding(self):
+        """
+        TranscriptModel: output non-coding transcript as BED12
+        """
+        t = TranscriptModel("T1","chr1","+")
+        t.add_exon(1001,1200)
+        self.assertEqual(t.bed12(),
+                         "chr1\t1000\t1200\tT1\t0\t+\t1200\t1200\t0\t1\t"
+                         "200,\t0,")
+
+    def test_transcript_model_no_exons(self):
+        """
+        TranscriptModel: return None for BED12 if there are no exons
+        """
+        t = TranscriptModel("T1","chr1","+")
+        t.add_cds(1001,1200)
+        self.assertEqual(t.bed12(),None)
+
+def build_bed12(data,**kws):
+    # Helper to run TranscriptModelBuilder on GTF data
+    fp = StringIO()
+    models = TranscriptModelBuilder(fp,**kws)
+    for line in GTFIterator(fp=StringIO(data)):
+        if line.type == ANNOTATION:
+            models.add(line)
+    models.finish()
+    return (fp.getvalue(),models)
+
+class TestTranscriptModelBuilder(unittest.TestCase):
+
+    def setUp(self):
+        self.expected = [
+            u"chr1\t3073252\t3074322\tT1\t0\t+\t3074322\t3074322\t0\t2\t148,823,\t0,247,",
+            u"chr1\t3073099\t3073300\tT2\t0\t+\t3073199\t3073300\t0\t1\t201,\t0,",
+            u"chr2\t4999\t7500\tT3\t0\t-\t7500\t7500\t0\t2\t1001,501,\t0,2000,",
+        ]
+
+    def test_build_bed12(self):
+        """
+        TranscriptModelBuilder: output BED12 for unsorted input
+        """
+        bed12,models = build_bed12(gtf_data)
+        self.assertEqual(bed12.split('\n')[:-1],self.expected)
+        self.assertEqual(models.nwritten,3)
+        self.assertFalse(models.spilled)
+
+    def test_build_bed12_sorted(self):
+        """
+        TranscriptModelBuilder: output BED12 for sorted input
+        """
+        bed12,models = build_bed12(gtf_data,sorted_input=True)
+        self.assertEqual(bed12.split('\n')[:-1],self.expected)
+
+    def test_build_bed12_spill(self):
+        """
+        TranscriptModelBuilder: output BED12 when spilling to temporary files
+        """
+        bed12,models = build_bed12(gtf_data,max_models=1,nshards=2)
+        self.assertEqual(sorted(bed12.split('\n')[:-1]),
+                         sorted(self.expected))
+        self.assertTrue(models.spilled)
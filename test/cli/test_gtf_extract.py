@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+
+import unittest
+import tempfile
+import shutil
+import os
+from io import StringIO
+from GFFUtils.cli.gtf_extract import compile_extraction_plan
+from GFFUtils.cli.gtf_extract import extract_lines
+from GFFUtils.cli.gtf_extract import write_lines
+from GFFUtils.cli.gtf_extract import find_chunks
+from GFFUtils.cli.gtf_extract import extract_file_parallel
+
+gtf_data = u"""#!genome-build GRCm38.p3
+##description: test data
+chr1\tHAVANA\tgene\t3073253\t3074322\t.\t+\t.\tgene_id "ENSMUSG00000102693.1"; gene_type "TEC"; gene_name "4933401J01Rik"; level 2;
+chr1\tHAVANA\ttranscript\t3073253\t3074322\t.\t+\t.\tgene_id "ENSMUSG00000102693.1"; transcript_id "ENSMUST00000193812.1"; gene_name "4933401J01Rik"; tag "basic"; tag "CCDS";
+chr1\tHAVANA\texon\t3073253\t3074322\t.\t+\t.\tgene_id "ENSMUSG00000102693.1"; transcript_id "ENSMUST00000193812.1"; gene_name "4933401J01Rik"; exon_number 1;
+"""
+
+gff_data = u"""##gff-version\t3
+DDB0232428\t.\tgene\t1890\t3287\t.\t+\t.\tID=DDB_G0267178;Name=DDB_G0267178;description=ORF2%3B fragment
+DDB0232428\t.\tmRNA\t1890\t3287\t.\t+\t.\tID=DDB0216437;Parent=DDB_G0267178
+"""
+
+class TestCompileExtractionPlan(unittest.TestCase):
+
+    def test_extract_columns(self):
+        """
+        compile_extraction_plan: extract standard columns
+        """
+        extract = compile_extraction_plan(['seqname','end','start','strand'])
+        fields = gtf_data.split('\n')[2].split('\t')
+        self.assertEqual(extract(fields),
+                         ['chr1','3074322','3073253','+'])
+
+    def test_extract_gtf_attributes(self):
+        """
+        compile_extraction_plan: extract GTF attributes
+        """
+        extract = compile_extraction_plan(['seqname','gene_name',
+                                           'missing','tag','level'])
+        fields = gtf_data.split('\n')[3].split('\t')
+        self.assertEqual(extract(fields),
+                         ['chr1','4933401J01Rik','.','basic','.'])
+
+    def test_extract_gff_attributes(self):
+        """
+        compile_extraction_plan: extract GFF attributes
+        """
+        extract = compile_extraction_plan(['ID','description','Parent'],
+                                          is_gff=True,null='-')
+        fields = gff_data.split('\n')[1].split('\t')
+        self.assertEqual(extract(fields),
+                         ['DDB_G0267178','ORF2; fragment','-'])
+
+class TestExtractLines(unittest.TestCase):
+
+    def test_extract_all_lines(self):
+        """
+        extract_lines: output annotation lines unchanged
+        """
+        output = list(extract_lines(StringIO(gtf_data)))
+        self.assertEqual(output,
+                         ["%s\n" % l for l in gtf_data.split('\n')[2:5]])
+
+    def test_extract_lines_for_feature_type(self):
+        """
+        extract_lines: output fields for one feature type
+        """
+        extract = compile_extraction_plan(['seqname','start','end',
+                                           'transcript_id'])
+        output = list(extract_lines(StringIO(gtf_data),
+                                    feature_type='exon',
+                                    extract=extract))
+        self.assertEqual(output,
+                         ["chr1\t3073253\t3074322\tENSMUST00000193812.1\n"])
+
+    def test_extract_lines_keep_header(self):
+        """
+        extract_lines: output pragmas but not comments when keeping headers
+        """
+        output = list(extract_lines(StringIO(gtf_data),
+                                    feature_type='gene',
+                                    keep_header=True))
+        self.assertEqual(output[0],"##description: test data\n")
+        self.assertEqual(len(output),2)
+
+    def test_extract_lines_gff_pragma(self):
+        """
+        extract_lines: raise ValueError for GFF input unless is_gff is set
+        """
+        self.assertRaises(ValueError,
+                          list,
+                          extract_lines(StringIO(gff_data)))
+        output = list(extract_lines(StringIO(gff_data),is_gff=True))
+        self.assertEqual(len(output),2)
+
+class TestWriteLines(unittest.TestCase):
+
+    def test_write_lines(self):
+        """
+        write_lines: write lines in batches
+        """
+        fp = StringIO()
+        lines = [u"line%d\n" % i for i in range(7)]
+        self.assertEqual(write_lines(lines,fp,batch_size=3),7)
+        self.assertEqual(fp.getvalue(),''.join(lines))
+
+class TestExtractFileParallel(unittest.TestCase):
+
+    def setUp(self):
+        # Temporary working dir
+        self.wd = tempfile.mkdtemp()
+        self.gtf_file = os.path.join(self.wd,"test.gtf")
+        with open(self.gtf_file,'w') as fp:
+            fp.write(gtf_data*20)
+
+    def tearDown(self):
+        # Remove temporary working dir
+        if os.path.isdir(self.wd):
+            shutil.rmtree(self.wd)
+
+    def test_find_chunks(self):
+        """
+        find_chunks: chunks cover the file and end on line boundaries
+        """
+        chunks = find_chunks(self.gtf_file,chunk_size=100)
+        self.assertTrue(len(chunks) > 1)
+        self.assertEqual(chunks[0][0],0)
+        self.assertEqual(chunks[-1][1],os.path.getsize(self.gtf_file))
+        with open(self.gtf_file,'rb') as fp:
+            data = fp.read()
+        for i,chunk in enumerate(chunks):
+            self.assertEqual(data[chunk[1]-1:chunk[1]],b'\n')
+            if i > 0:
+                self.assertEqual(chunk[0],chunks[i-1][1])
+
+    def test_extract_file_parallel(self):
+        """
+        extract_file_parallel: output matches serial extraction
+        """
+        field_list = ['seqname','start','gene_name','exon_number']
+        expected = StringIO()
+        with open(self.gtf_file,'r') as fp:
+            write_lines(extract_lines(
+                fp,
+                extract=compile_extraction_plan(field_list),
+                keep_header=True),expected)
+        output = StringIO()
+        nlines = extract_file_parallel(self.gtf_file,output,2,
+                                       field_list=field_list,
+                                       keep_header=True,
+                                       chunk_size=100)
+        self.assertEqual(nlines,80)
+        self.assertEqual(output.getvalue(),expected.getvalue())
+
+    def test_extract_file_parallel_gff_pragma(self):
+        """
+        extract_file_parallel: raise ValueError for GFF input unless is_gff is set
+        """
+        gff_file = os.path.join(self.wd,"test.gff")
+        with open(gff_file,'w') as fp:
+            fp.write(gff_data)
+        self.assertRaises(ValueError,
+                          extract_file_parallel,
+                          gff_file,StringIO(),2)
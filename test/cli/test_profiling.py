@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+
+import unittest
+import tempfile
+import shutil
+import subprocess
+import sys
+import os
+import cProfile
+import pstats
+from argparse import ArgumentParser
+import GFFUtils.GFFFile
+from GFFUtils.GFFFile import parse_gff_attributes
+from GFFUtils.cli.profiling import add_profile_option
+from GFFUtils.cli.profiling import check_profile_file
+from GFFUtils.cli.profiling import stop_profiling
+from GFFUtils.cli.profiling import module_name
+
+# Directory containing the GFFUtils package
+PACKAGE_PARENT_DIR = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+gtf_data = u"""chr1\tHAVANA\texon\t3073253\t3073400\t.\t+\t.\tgene_id "G1"; transcript_id "T1";
+chr1\tHAVANA\texon\t3073500\t3074322\t.\t+\t.\tgene_id "G1"; transcript_id "T1";
+"""
+
+class TestAddProfileOption(unittest.TestCase):
+
+    def test_add_profile_option(self):
+        """
+        add_profile_option: handle '--profile' and '--profile-file'
+        """
+        p = ArgumentParser()
+        add_profile_option(p)
+        self.assertEqual(p.parse_args([]).profile_file,None)
+        self.assertEqual(p.parse_args(['--profile']).profile_file,'')
+        self.assertEqual(
+            p.parse_args(['--profile-file','run.pstats']).profile_file,
+            'run.pstats')
+        self.assertEqual(
+            p.parse_args(['--profile-file','run.pstats',
+                          '--profile']).profile_file,
+            'run.pstats')
+
+    def test_add_profile_option_doesnt_consume_positionals(self):
+        """
+        add_profile_option: '--profile' doesn't consume positionals
+        """
+        p = ArgumentParser()
+        p.add_argument('gff_files',nargs='*')
+        add_profile_option(p)
+        args = p.parse_args(['--profile','a.gff','b.gff'])
+        self.assertEqual(args.profile_file,'')
+        self.assertEqual(args.gff_files,['a.gff','b.gff'])
+
+class TestCheckProfileFile(unittest.TestCase):
+
+    def setUp(self):
+        # Temporary working dir
+        self.wd = tempfile.mkdtemp()
+
+    def tearDown(self):
+        # Remove temporary working dir
+        shutil.rmtree(self.wd)
+
+    def _make_file(self,name):
+        # Create a file in the working directory
+        filen = os.path.join(self.wd,name)
+        with open(filen,'wt') as fp:
+            fp.write("data\n")
+        return filen
+
+    def test_check_profile_file_ok(self):
+        """
+        check_profile_file: accept new and existing '.pstats' files
+        """
+        input_file = self._make_file("input.gff")
+        check_profile_file(os.path.join(self.wd,"new.txt"),
+                           input_files=(input_file,))
+        check_profile_file(self._make_file("old.pstats"),
+                           input_files=(input_file,None))
+
+    def test_check_profile_file_is_input(self):
+        """
+        check_profile_file: refuse to overwrite an input file
+        """
+        input_file = self._make_file("input.pstats")
+        self.assertRaises(ValueError,
+                          check_profile_file,
+                          input_file,
+                          input_files=(input_file,))
+
+    def test_check_profile_file_not_pstats(self):
+        """
+        check_profile_file: refuse to overwrite an existing non-pstats file
+        """
+        self.assertRaises(ValueError,
+                          check_profile_file,
+                          self._make_file("input.gff"))
+
+class TestProfileCommandLine(unittest.TestCase):
+
+    def setUp(self):
+        # Temporary working dir
+        self.wd = tempfile.mkdtemp()
+        self.gtf_file = os.path.join(self.wd,"input.gtf")
+        with open(self.gtf_file,'wt') as fp:
+            fp.write(gtf_data)
+
+    def tearDown(self):
+        # Remove temporary working dir
+        shutil.rmtree(self.wd)
+
+    def _run_gtf_extract(self,args):
+        # Run gtf_extract in the working directory and return
+        # the exit code
+        env = dict(os.environ)
+        path = [PACKAGE_PARENT_DIR]
+        if env.get('PYTHONPATH'):
+            path.append(env['PYTHONPATH'])
+        env['PYTHONPATH'] = os.pathsep.join(path)
+        p = subprocess.Popen([sys.executable,'-m',
+                              'GFFUtils.cli.gtf_extract'] + list(args),
+                             cwd=self.wd,
+                             env=env,
+                             stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE)
+        p.communicate()
+        return p.returncode
+
+    def _gtf_file_contents(self):
+        # Return the contents of the input GTF file
+        with open(self.gtf_file,'rt') as fp:
+            return fp.read()
+
+    def test_profile_doesnt_overwrite_input(self):
+        """
+        Command line: '--profile INPUT' doesn't overwrite INPUT
+        """
+        self.assertEqual(
+            self._run_gtf_extract(['--profile',self.gtf_file,
+                                   '--fields','chrom,gene_id']),0)
+        self.assertEqual(self._gtf_file_contents(),gtf_data)
+        self.assertTrue(os.path.exists(
+            os.path.join(self.wd,"gtf_extract.pstats")))
+
+    def test_profile_file_refuses_input(self):
+        """
+        Command line: '--profile-file INPUT' fails without writing INPUT
+        """
+        self.assertNotEqual(
+            self._run_gtf_extract(['--profile-file',self.gtf_file,
+                                   self.gtf_file]),0)
+        self.assertEqual(self._gtf_file_contents(),gtf_data)
+
+class TestModuleName(unittest.TestCase):
+
+    def test_module_name_gffutils(self):
+        """
+        module_name: return full name for GFFUtils modules
+        """
+        self.assertEqual(module_name(GFFUtils.GFFFile.__file__),
+                         "GFFUtils.GFFFile")
+
+    def test_module_name_builtin(self):
+        """
+        module_name: return '<built-in>' for built-in functions
+        """
+        self.assertEqual(module_name("~"),"<built-in>")
+
+    def test_module_name_other(self):
+        """
+        module_name: return top-level name for other modules
+        """
+        self.assertEqual(module_name(unittest.__file__),"unittest")
+
+class TestProfileReport(unittest.TestCase):
+
+    def setUp(self):
+        # Temporary working dir
+        self.wd = tempfile.mkdtemp()
+
+    def tearDown(self):
+        # Remove temporary working dir
+        if os.path.isdir(self.wd):
+            shutil.rmtree(self.wd)
+
+    def test_stop_profiling(self):
+        """
+        stop_profiling: write statistics and report hot spots
+        """
+        profile_file = os.path.join(self.wd,"test.pstats")
+        profile = cProfile.Profile()
+        profile.enable()
+        for i in range(100):
+            parse_gff_attributes("ID=gene%d;Name=Gene%d" % (i,i))
+        report_file = os.path.join(self.wd,"report.txt")
+        with open(report_file,'wt') as fp:
+            stop_profiling(profile,profile_file,top=5,fp=fp)
+        self.assertTrue(os.path.exists(profile_file))
+        with open(report_file,'rt') as fp:
+            report = fp.read()
+        self.assertTrue("GFFUtils.GFFFile:parse_gff_attributes" in report)
+        self.assertTrue("Top 5 functions by cumulative time" in report)
+        stats = pstats.Stats(profile_file)
+        self.assertTrue(len(stats.stats) > 0)
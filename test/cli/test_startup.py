@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+
+import unittest
+import subprocess
+import sys
+import os
+
+# Directory containing the GFFUtils package
+PACKAGE_PARENT_DIR = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Modules for the command line utilities
+CLI_MODULES = ('GFFUtils.cli.gff_cleaner',
+               'GFFUtils.cli.gff_annotation_extractor',
+               'GFFUtils.cli.gtf_extract',
+               'GFFUtils.cli.gtf2bed',)
+
+# Modules which shouldn't be imported until they're needed
+DEFERRED_MODULES = ('bcftbx.TabFile',
+                    'GFFUtils.GFFFile',
+                    'GFFUtils.GTFFile',
+                    'GFFUtils.annotation',
+                    'GFFUtils.clean.sgd',
+                    'multiprocessing',
+                    'sqlite3',
+                    'cProfile',
+                    'pstats',
+                    'tracemalloc',)
+
+def run_python(args):
+    """
+    Run Python with GFFUtils importable and return the stdout
+    """
+    env = dict(os.environ)
+    path = [PACKAGE_PARENT_DIR]
+    if env.get('PYTHONPATH'):
+        path.append(env['PYTHONPATH'])
+    env['PYTHONPATH'] = os.pathsep.join(path)
+    p = subprocess.Popen([sys.executable] + list(args),
+                         env=env,
+                         stdout=subprocess.PIPE,
+                         stderr=subprocess.PIPE,
+                         universal_newlines=True)
+    stdout,stderr = p.communicate()
+    if p.returncode != 0:
+        raise Exception("Failed to run %s: %s" % (args,stderr))
+    return stdout
+
+class TestStartup(unittest.TestCase):
+
+    def test_heavy_modules_are_deferred(self):
+        """
+        Command line utilities: heavy modules not imported at startup
+        """
+        for module in CLI_MODULES:
+            imported = run_python(
+                ['-c',
+                 "import sys; import %s; print('\\n'.join(sys.modules))"
+                 % module]).split('\n')
+            for deferred in DEFERRED_MODULES:
+                self.assertFalse(deferred in imported,
+                                 "%s imports %s" % (module,deferred))
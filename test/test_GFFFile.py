@@ -1,5 +1,10 @@
 #!/usr/bin/env python
 
+import os
+import gc
+import shutil
+import tempfile
+import threading
 import unittest
 from io import StringIO
 from GFFUtils.GFFFile import *
@@ -44,6 +49,112 @@ DDB0232428	Sequencing Center	CDS	1890	3287	.	+	.	Parent=DDB0216437
         self.assertEqual(ncomment,1)
         self.assertEqual(nannotation,6)
 
+    def test_gff_iterator_feature_types(self):
+        """Test iteration only returning specified feature types
+        """
+        iterator = GFFIterator(fp=self.fp,feature_types=('gene','exon'))
+        self.assertEqual(iterator.format,"gff")
+        lines = [line for line in iterator]
+        self.assertEqual([line.type for line in lines],
+                         [PRAGMA,COMMENT,ANNOTATION,ANNOTATION])
+        self.assertEqual([line.lineno() for line in lines],[1,2,5,7])
+        self.assertEqual(lines[2]['feature'],"gene")
+        self.assertEqual(lines[3]['feature'],"exon")
+
+    def test_gff_iterator_line_filter(self):
+        """Test iteration skipping lines rejected by a filter
+        """
+        iterator = GFFIterator(fp=self.fp,
+                               line_filter=lambda line:
+                               "Parent=DDB0216437" in line)
+        lines = [line for line in iterator
+                 if line.type == ANNOTATION]
+        self.assertEqual([line['feature'] for line in lines],
+                         ["exon","CDS"])
+
+    def test_gff_iterator_prefetch(self):
+        """Test iteration reading the data in a background thread
+        """
+        expected = [(line.type,line.lineno(),str(line))
+                    for line in GFFIterator(fp=StringIO(self.fp.getvalue()))]
+        lines = [(line.type,line.lineno(),str(line))
+                 for line in GFFIterator(fp=self.fp,prefetch=True)]
+        self.assertEqual(len(lines),8)
+        self.assertEqual(lines,expected)
+
+    def test_gff_iterator_after_eof(self):
+        """Test iteration keeps stopping after the end of the file
+        """
+        wd = tempfile.mkdtemp()
+        try:
+            gff_file = os.path.join(wd,"test.gff")
+            with open(gff_file,'wt') as fp:
+                fp.write(self.fp.getvalue())
+            for prefetch in (False,True):
+                iterator = GFFIterator(gff_file,prefetch=prefetch)
+                self.assertEqual(len([line for line in iterator]),8)
+                self.assertRaises(StopIteration,next,iterator)
+                self.assertRaises(StopIteration,next,iterator)
+        finally:
+            shutil.rmtree(wd)
+
+    def test_gff_iterator_prefetch_close(self):
+        """Test abandoning iteration when reading in a background thread
+        """
+        nthreads = threading.active_count()
+        # NB enough data to fill the prefetch queue
+        data = self.fp.getvalue().split('\n',2)[2]*20000
+        # Close explicitly
+        iterator = GFFIterator(fp=StringIO(data),prefetch=True)
+        line = next(iterator)
+        self.assertEqual(line.type,ANNOTATION)
+        iterator.close()
+        self.assertEqual(threading.active_count(),nthreads)
+        self.assertRaises(StopIteration,next,iterator)
+        # Delete without closing
+        iterator = GFFIterator(fp=StringIO(data),prefetch=True)
+        line = next(iterator)
+        del(iterator)
+        gc.collect()
+        self.assertEqual(threading.active_count(),nthreads)
+
+class TestPrefetchReader(unittest.TestCase):
+    """Tests for the PrefetchReader class
+    """
+
+    def test_prefetch_reader(self):
+        """PrefetchReader: read lines in multiple blocks
+        """
+        text = u"".join([u"line %d\n" % i for i in range(100)])
+        reader = PrefetchReader(StringIO(text),block_size=20,max_blocks=2)
+        lines = []
+        while True:
+            line = reader.readline()
+            if not line:
+                break
+            lines.append(line)
+        self.assertEqual(u"".join(lines),text)
+        self.assertEqual(reader.readline(),'')
+        reader.close()
+
+    def test_prefetch_reader_close_early(self):
+        """PrefetchReader: stop reader thread before EOF
+        """
+        text = u"".join([u"line %d\n" % i for i in range(1000)])
+        reader = PrefetchReader(StringIO(text),block_size=20,max_blocks=2)
+        self.assertEqual(reader.readline(),u"line 0\n")
+        reader.close()
+        self.assertEqual(reader.readline(),'')
+
+    def test_prefetch_reader_error(self):
+        """PrefetchReader: errors in reader thread are raised
+        """
+        fp = StringIO(u"line 0\n")
+        fp.close()
+        reader = PrefetchReader(fp)
+        self.assertRaises(ValueError,reader.readline)
+        reader.close()
+
 class TestGFFFile(unittest.TestCase):
     """Basic unit tests for the GFFFile class
     """
@@ -76,6 +187,143 @@ DDB0232428	Sequencing Center	CDS	1890	3287	.	+	.	Parent=DDB0216437
             self.assertEqual(feature[i],gff[i]['feature'],
                              "Incorrect feature '%s' on data line %d" % (gff[i]['feature'],i))
 
+class TestGFFRecordList(unittest.TestCase):
+    """Unit tests for the GFFRecordList class
+    """
+
+    def setUp(self):
+        # Populate list with lines numbered 1 to 10
+        self.records = GFFRecordList()
+        for i in range(1,11):
+            self.records.append(tabdataline=GFFDataLine(
+                "chr1\tTest\texon\t%d\t%d\t.\t+\t.\tID=exon%d"
+                % (i*100,i*100+50,i),lineno=i))
+
+    def ids(self):
+        return [str(line['attributes']['ID']) for line in self.records]
+
+    def test_append_and_iterate(self):
+        """GFFRecordList: append and iterate over lines
+        """
+        self.assertEqual(len(self.records),10)
+        self.assertEqual(self.ids(),["exon%d" % i for i in range(1,11)])
+        line = self.records.append(tabdata="chr2\tTest\tgene\t1\t500\t."
+                                   "\t+\t.\tID=gene1")
+        self.assertEqual(len(self.records),11)
+        self.assertEqual(self.records[10],line)
+        self.assertEqual(self.records[-1]['feature'],'gene')
+
+    def test_get_by_line_number(self):
+        """GFFRecordList: get line by line number
+        """
+        self.assertEqual(
+            str(self.records.getByLineNumber(4)['attributes']['ID']),
+            "exon4")
+        self.assertRaises(IndexError,self.records.getByLineNumber,11)
+
+    def test_delete_by_line_number(self):
+        """GFFRecordList: delete lines by line number
+        """
+        line = self.records.deleteByLineNumber(3)
+        self.assertEqual(line.lineno(),3)
+        self.records.deleteByLineNumber(7)
+        self.assertEqual(len(self.records),8)
+        self.assertEqual(self.ids(),["exon1","exon2","exon4","exon5",
+                                     "exon6","exon8","exon9","exon10"])
+        self.assertRaises(IndexError,self.records.deleteByLineNumber,3)
+        self.assertRaises(IndexError,self.records.getByLineNumber,7)
+        self.assertEqual(self.records.getByLineNumber(8).lineno(),8)
+        # Positions are updated after deletions
+        self.assertEqual(self.records.indexByLineNumber(8),5)
+        self.assertEqual(self.records[5].lineno(),8)
+
+    def test_delete_majority_of_lines(self):
+        """GFFRecordList: delete most lines (triggers compaction)
+        """
+        for i in range(1,10):
+            self.records.deleteByLineNumber(i)
+        self.assertEqual(len(self.records),1)
+        self.assertEqual(self.ids(),["exon10"])
+        self.assertEqual(self.records.indexByLineNumber(10),0)
+
+    def test_delete_while_iterating(self):
+        """GFFRecordList: delete lines while iterating (past compaction threshold)
+        """
+        seen = []
+        for line in self.records:
+            seen.append(line.lineno())
+            if line.lineno() == 1:
+                # Delete enough lines to pass the compaction threshold
+                for i in range(3,10):
+                    self.records.deleteByLineNumber(i)
+        self.assertEqual(seen,[1,2,10])
+        self.assertEqual(len(self.records),3)
+        self.assertEqual(self.ids(),["exon1","exon2","exon10"])
+        self.assertEqual(self.records.indexByLineNumber(10),2)
+
+    def test_delete_while_iterating_nested(self):
+        """GFFRecordList: delete lines inside nested iterations
+        """
+        seen = []
+        for line in self.records:
+            for line0 in self.records:
+                if line0.lineno() > line.lineno() and line0.lineno() % 2:
+                    self.records.deleteByLineNumber(line0.lineno())
+            seen.append(line.lineno())
+        self.assertEqual(seen,[1,2,4,6,8,10])
+        self.assertEqual(self.ids(),["exon1","exon2","exon4","exon6",
+                                     "exon8","exon10"])
+
+    def test_delete_by_position(self):
+        """GFFRecordList: delete lines by position
+        """
+        del(self.records[self.records.indexByLineNumber(2)])
+        del(self.records[self.records.indexByLineNumber(5)])
+        del(self.records[-1])
+        self.assertEqual(len(self.records),7)
+        self.assertEqual(self.ids(),["exon1","exon3","exon4","exon6",
+                                     "exon7","exon8","exon9"])
+        del(self.records[1:3])
+        self.assertEqual(self.ids(),["exon1","exon6","exon7","exon8",
+                                     "exon9"])
+        self.assertEqual(self.records.getByLineNumber(7).lineno(),7)
+
+    def test_insert(self):
+        """GFFRecordList: insert lines
+        """
+        self.records.deleteByLineNumber(1)
+        line = self.records.insert(2)
+        line['feature'] = 'CDS'
+        self.assertEqual(len(self.records),10)
+        self.assertEqual(self.records[2]['feature'],'CDS')
+        self.assertEqual(self.records[3].lineno(),4)
+        self.assertEqual(self.records.indexByLineNumber(4),3)
+
+    def test_slice(self):
+        """GFFRecordList: get slice of lines
+        """
+        self.records.deleteByLineNumber(2)
+        self.assertEqual([line.lineno() for line in self.records[1:4]],
+                         [3,4,5])
+
+    def test_lookup(self):
+        """GFFRecordList: look up lines by field value
+        """
+        self.records.append(tabdata="chr2\tTest\tgene\t1\t500\t.\t+"
+                            "\t.\tID=gene1")
+        self.assertEqual(len(self.records.lookup('feature','exon')),10)
+        self.assertEqual(len(self.records.lookup('seqname','chr2')),1)
+        self.assertEqual(self.records.lookup('feature','CDS'),[])
+
+    def test_sort(self):
+        """GFFRecordList: sort lines
+        """
+        self.records.deleteByLineNumber(5)
+        self.records.sort(lambda line: line.lineno(),reverse=True)
+        self.assertEqual([line.lineno() for line in self.records],
+                         [10,9,8,7,6,4,3,2,1])
+        self.assertEqual(self.records.indexByLineNumber(10),0)
+
 class TestGFFAttributes(unittest.TestCase):
     """Unit tests for GFFAttributes class
     """
@@ -218,6 +466,22 @@ class TestGFFID(unittest.TestCase):
         self.assertEqual(gffid.index,2)
         self.assertEqual(str(gffid),'CDS:XYZ123-A:2')
 
+class TestParseGFFAttributes(unittest.TestCase):
+    """Tests for the parse_gff_attributes function
+    """
+
+    def test_parse_gff_attributes(self):
+        """Extract keyed values from GFF attributes
+        """
+        self.assertEqual(parse_gff_attributes("ID=DDB0216437;"
+                                              "Parent=DDB_G0267178;"
+                                              "Note;"
+                                              "description=ORF2 %3B fragment;"),
+                         { 'ID': "DDB0216437",
+                           'Parent': "DDB_G0267178",
+                           'description': "ORF2 ; fragment" })
+        self.assertEqual(parse_gff_attributes(""),{})
+
 class TestOrderedDictionary(unittest.TestCase):
     """Unit tests for the OrderedDictionary class
     """
@@ -184,3 +184,31 @@ chr1	ENSEMBL	transcript	11872	14412	.	+	.	gene_id "ENSG00000223972.4"; transcrip
         for i in range(len(gtf)):
             self.assertEqual(feature[i],gtf[i]['feature'],
                              "Incorrect feature '%s' on data line %d" % (gtf[i]['feature'],i))
+
+class TestParseGTFAttributes(unittest.TestCase):
+    """Tests for the parse_gtf_attributes function
+    """
+
+    def test_parse_gtf_attributes(self):
+        """Extract values from GTF attributes
+        """
+        self.assertEqual(parse_gtf_attributes('gene_id "ENSG00000223972.4"; '
+                                              'exon_number 1;  '
+                                              'tag "basic"; tag "CCDS";'),
+                         { 'gene_id': "ENSG00000223972.4",
+                           'exon_number': "1",
+                           'tag': "basic" })
+        self.assertEqual(parse_gtf_attributes(""),{})
+
+    def test_parse_gtf_attributes_percent_decoding(self):
+        """Percent-decode values from GTF attributes
+        """
+        attributes = 'gene_id "G1"; note "a%3Bb%2Cc"; gene_name "X%2C1";'
+        data = parse_gtf_attributes(attributes)
+        self.assertEqual(data,
+                         { 'gene_id': "G1",
+                           'note': "a;b,c",
+                           'gene_name': "X,1" })
+        gtf_attributes = GTFAttributes(attributes)
+        for key in data:
+            self.assertEqual(data[key],gtf_attributes[key])
@@ -7,8 +7,10 @@ import os
 from io import StringIO
 from GFFUtils.GFFFile import GFFFile
 from GFFUtils.GFFFile import GFFDataLine
+from GFFUtils.GFFFile import GFFIterator
 from GFFUtils.GTFFile import GTFFile
 from GFFUtils.GTFFile import GTFDataLine
+from GFFUtils.GTFFile import GTFIterator
 from GFFUtils.annotation import *
 
 # Example GFF file fragment
@@ -81,6 +83,97 @@ class TestGFFAnnotationLookup(unittest.TestCase):
         self.assertEqual(annot.gene_length,692)
         self.assertEqual(annot.description,"Description of gene naa20")
 
+    def test_gff_annotation_lookup_parent_cycle(self):
+        """
+        GFFAnnotationLookup: handle parent cycle in GFF file
+        """
+        # Load GFF data with a cycle of parents
+        gff = GFFFile("test.gff",StringIO(u"""##gff-version   3
+chr1	.	gene	100	200	.	+	.	ID=gene1;Name=gene1
+chr1	.	mRNA	100	200	.	+	.	ID=mrna1;Parent=mrna2
+chr1	.	mRNA	100	200	.	+	.	ID=mrna2;Parent=mrna1
+chr1	.	CDS	100	200	.	+	.	ID=cds1;Parent=mrna1
+"""))
+        lookup = GFFAnnotationLookup(gff)
+        # No ancestor genes for features in or below the cycle
+        self.assertEqual(lookup.getAncestorGene("mrna1"),None)
+        self.assertEqual(lookup.getAncestorGene("mrna2"),None)
+        self.assertEqual(lookup.getAncestorGene("cds1"),None)
+        self.assertEqual(lookup.getAncestorGene("gene1"),None)
+        # Annotation is still returned for the feature
+        annot = lookup.getAnnotation("cds1")
+        self.assertEqual(annot.parent_feature_name,"cds1")
+        self.assertEqual(annot.parent_gene_name,"")
+
+    def test_gff_annotation_lookup_dangling_parent(self):
+        """
+        GFFAnnotationLookup: handle missing parent in GFF file
+        """
+        # Load GFF data with a reference to a missing parent
+        gff = GFFFile("test.gff",StringIO(u"""##gff-version   3
+chr1	.	gene	100	200	.	+	.	ID=gene1;Name=gene1
+chr1	.	mRNA	100	200	.	+	.	ID=mrna1;Parent=gene1
+chr1	.	mRNA	100	200	.	+	.	ID=mrna2;Parent=gene2
+chr1	.	CDS	100	200	.	+	.	ID=cds2;Parent=mrna2
+"""))
+        lookup = GFFAnnotationLookup(gff)
+        self.assertEqual(str(lookup.getAncestorGene("mrna1")),
+                         "chr1	.	gene	100	200	.	+	.	ID=gene1;Name=gene1")
+        self.assertEqual(lookup.getAncestorGene("mrna2"),None)
+        self.assertEqual(lookup.getAncestorGene("cds2"),None)
+
+    def test_gff_annotation_lookup_counts_warnings(self):
+        """
+        GFFAnnotationLookup: count warnings for missing features
+        """
+        gff = GFFFile("test.gff",StringIO(gff_data))
+        lookup = GFFAnnotationLookup(gff)
+        self.assertEqual(lookup.warnings.count(),0)
+        lookup.getAnnotation("missing1")
+        lookup.getAnnotation("missing2")
+        self.assertEqual(
+            lookup.warnings.count("Unable to locate parent data"),2)
+
+    def test_gff_annotation_lookup_cache(self):
+        """
+        GFFAnnotationLookup: cache annotations with LRU eviction
+        """
+        gff = GFFFile("test.gff",StringIO(gff_data))
+        lookup = GFFAnnotationLookup(gff,cache_size=2)
+        self.assertEqual(lookup.cacheInfo(),(0,0,2,0))
+        annot = lookup.getAnnotation("DDB0166998")
+        self.assertEqual(lookup.cacheInfo(),(0,1,2,1))
+        # Repeat lookup returns cached annotation
+        self.assertTrue(lookup.getAnnotation("DDB0166998") is annot)
+        self.assertEqual(lookup.cacheInfo(),(1,1,2,1))
+        # Least recently used annotation is discarded
+        lookup.getAnnotation("DDB0167147")
+        lookup.getAnnotation("DDB0238097")
+        self.assertEqual(lookup.cacheInfo(),(1,3,2,2))
+        self.assertFalse(lookup.getAnnotation("DDB0166998") is annot)
+        self.assertEqual(lookup.cacheInfo(),(1,4,2,2))
+        # Clear the cache
+        lookup.clearCache()
+        self.assertEqual(lookup.cacheInfo(),(0,0,2,0))
+
+    def test_gff_annotation_lookup_prefetch(self):
+        """
+        GFFAnnotationLookup: prefetch annotations for multiple IDs
+        """
+        gff = GFFFile("test.gff",StringIO(gff_data))
+        lookup = GFFAnnotationLookup(gff)
+        annotations = lookup.prefetch(("DDB0166998",
+                                       "DDB0167147",
+                                       "DDB0166998"))
+        self.assertEqual(sorted(annotations.keys()),
+                         ["DDB0166998","DDB0167147"])
+        self.assertEqual(annotations["DDB0167147"].parent_gene_name,
+                         "DDB_G0275629")
+        self.assertEqual(lookup.cacheInfo().misses,2)
+        self.assertTrue(lookup.getAnnotation("DDB0167147") is
+                        annotations["DDB0167147"])
+        self.assertEqual(lookup.cacheInfo().hits,1)
+
     def test_gff_annotation_lookup_from_gtf(self):
         """
         GFFAnnotationLookup: lookup from GTF file
@@ -113,6 +206,167 @@ class TestGFFAnnotationLookup(unittest.TestCase):
         self.assertEqual(annot.gene_length,2543)
         self.assertEqual(annot.description,"")
 
+    def test_gff_annotation_lookup_from_gff_iterator(self):
+        """
+        GFFAnnotationLookup: compact lookup from GFF iterator
+        """
+        # Build lookup directly from GFF data
+        lookup = GFFAnnotationLookup(GFFIterator(fp=StringIO(gff_data)),
+                                     compact=True)
+        # getDataFromID
+        data = lookup.getDataFromID("DDB_G0276345")
+        self.assertEqual(len(data),1)
+        self.assertTrue(isinstance(data[0],GFFAnnotationRecord))
+        self.assertEqual(data[0]['feature'],"gene")
+        self.assertEqual(data[0].lineno(),12)
+        self.assertEqual(list(data[0]['attributes']),
+                         ['Name','description'])
+        # getParentID
+        self.assertEqual(lookup.getParentID("DDB0166998"),"DDB_G0276345")
+        # getAncestorGene
+        self.assertEqual(str(lookup.getAncestorGene("DDB0166998")),
+                         "DDB0232429	gene	6679320	6680012	+")
+        # getAnnotation
+        annot = lookup.getAnnotation("DDB0166998")
+        self.assertEqual(annot.parent_feature_name,"DDB0166998")
+        self.assertEqual(annot.parent_feature_type,"mRNA")
+        self.assertEqual(annot.parent_feature_parent,"DDB_G0276345")
+        self.assertEqual(annot.parent_gene_name,"naa20")
+        self.assertEqual(annot.chr,"DDB0232429")
+        self.assertEqual(annot.start,6679320)
+        self.assertEqual(annot.end,6680012)
+        self.assertEqual(annot.strand,"+")
+        self.assertEqual(annot.gene_locus,"DDB0232429:6679320-6680012")
+        self.assertEqual(annot.gene_length,692)
+        self.assertEqual(annot.description,"Description of gene naa20")
+
+    def test_gff_annotation_lookup_from_gtf_iterator(self):
+        """
+        GFFAnnotationLookup: compact lookup from GTF iterator
+        """
+        # Build lookup directly from GTF 'gene' lines
+        lookup = GFFAnnotationLookup(GTFIterator(fp=StringIO(gtf_data),
+                                                 feature_types=('gene',)),
+                                     compact=True)
+        # getDataFromID
+        data = lookup.getDataFromID("ENSG00000223972.4")
+        self.assertEqual(len(data),1)
+        self.assertEqual(data[0].format,"gtf")
+        self.assertEqual(data[0]['attributes']['gene_name'],"DDX11L1")
+        self.assertEqual(data[0]['attributes']['Parent'],None)
+        # getAnnotation
+        annot = lookup.getAnnotation("ENSG00000223972.4")
+        self.assertEqual(annot.parent_feature_name,"ENSG00000223972.4")
+        self.assertEqual(annot.parent_feature_type,"gene")
+        self.assertEqual(annot.parent_feature_parent,None)
+        self.assertEqual(annot.parent_gene_name,"DDX11L1")
+        self.assertEqual(annot.chr,"chr1")
+        self.assertEqual(annot.start,11869)
+        self.assertEqual(annot.end,14412)
+        self.assertEqual(annot.strand,"+")
+        self.assertEqual(annot.gene_locus,"chr1:11869-14412")
+        self.assertEqual(annot.gene_length,2543)
+        self.assertEqual(annot.description,"")
+
+class TestGFFAnnotationLookupDB(unittest.TestCase):
+
+    def setUp(self):
+        # Temporary directory
+        self.wd = tempfile.mkdtemp()
+        # Database file path
+        self.db_file = os.path.join(self.wd,"lookup.db")
+
+    def tearDown(self):
+        if os.path.exists(self.wd):
+            shutil.rmtree(self.wd)
+
+    def test_gff_annotation_lookup_db_from_gff(self):
+        """
+        GFFAnnotationLookupDB: save and reload lookup from GFF file
+        """
+        # Save lookup built from GFF data
+        gff = GFFFile("test.gff",StringIO(gff_data))
+        GFFAnnotationLookup(gff).save(self.db_file)
+        self.assertTrue(is_annotation_lookup_db(self.db_file))
+        # Reopen
+        lookup = GFFAnnotationLookupDB(self.db_file)
+        self.assertEqual(lookup.format,"gff")
+        # getDataFromID
+        data = lookup.getDataFromID("DDB0166998")
+        self.assertEqual(len(data),2)
+        self.assertEqual([d.lineno() for d in data],[5,13])
+        self.assertRaises(KeyError,lookup.getDataFromID,"missing")
+        # getParentID
+        self.assertEqual(lookup.getParentID("DDB0166998"),"DDB_G0276345")
+        self.assertRaises(KeyError,lookup.getParentID,"DDB_G0276345")
+        # getAncestorGene
+        gene = lookup.getAncestorGene("DDB0166998")
+        self.assertEqual(str(gene),"DDB0232429	gene	6679320	6680012	+")
+        self.assertEqual(gene['attributes']['Name'],"naa20")
+        self.assertEqual(lookup.getAncestorGene("DDB_G0276345"),None)
+        # getAnnotation
+        annot = lookup.getAnnotation("DDB0166998")
+        self.assertEqual(annot.parent_feature_name,"DDB0166998")
+        self.assertEqual(annot.parent_feature_type,"mRNA")
+        self.assertEqual(annot.parent_feature_parent,"DDB_G0276345")
+        self.assertEqual(annot.parent_gene_name,"naa20")
+        self.assertEqual(annot.chr,"DDB0232429")
+        self.assertEqual(annot.start,6679320)
+        self.assertEqual(annot.end,6680012)
+        self.assertEqual(annot.strand,"+")
+        self.assertEqual(annot.gene_locus,"DDB0232429:6679320-6680012")
+        self.assertEqual(annot.gene_length,692)
+        self.assertEqual(annot.description,"Description of gene naa20")
+
+    def test_gff_annotation_lookup_db_from_gtf(self):
+        """
+        GFFAnnotationLookupDB: save and reload lookup from GTF file
+        """
+        # Save lookup built from GTF data
+        gtf = GTFFile("test.gtf",StringIO(gtf_data))
+        GFFAnnotationLookup(gtf).save(self.db_file)
+        # Reopen
+        lookup = GFFAnnotationLookupDB(self.db_file)
+        self.assertEqual(lookup.format,"gtf")
+        # getAnnotation
+        annot = lookup.getAnnotation("ENSG00000223972.4")
+        self.assertEqual(annot.parent_feature_name,"ENSG00000223972.4")
+        self.assertEqual(annot.parent_feature_type,"gene")
+        self.assertEqual(annot.parent_feature_parent,None)
+        self.assertEqual(annot.parent_gene_name,"DDX11L1")
+        self.assertEqual(annot.chr,"chr1")
+        self.assertEqual(annot.gene_locus,"chr1:11869-14412")
+        self.assertEqual(annot.gene_length,2543)
+
+    def test_gff_annotation_lookup_db_save(self):
+        """
+        GFFAnnotationLookupDB: save lookup to another database
+        """
+        gff = GFFFile("test.gff",StringIO(gff_data))
+        GFFAnnotationLookup(gff).save(self.db_file)
+        lookup = GFFAnnotationLookupDB(self.db_file)
+        # Save to a new database and reopen
+        db_file2 = os.path.join(self.wd,"lookup2.db")
+        lookup.save(db_file2)
+        self.assertTrue(is_annotation_lookup_db(db_file2))
+        lookup2 = GFFAnnotationLookupDB(db_file2)
+        self.assertEqual(lookup2.format,"gff")
+        self.assertEqual(lookup2.getAnnotation("DDB0166998").parent_gene_name,
+                         "naa20")
+        # Saving to the same database leaves it unchanged
+        lookup.save(self.db_file)
+        self.assertEqual(lookup.getAnnotation("DDB0166998").parent_gene_name,
+                         "naa20")
+
+    def test_gff_annotation_lookup_db_not_a_database(self):
+        """
+        GFFAnnotationLookupDB: raise exception for non-database file
+        """
+        with open(self.db_file,'w') as fp:
+            fp.write(gff_data)
+        self.assertFalse(is_annotation_lookup_db(self.db_file))
+        self.assertRaises(Exception,GFFAnnotationLookupDB,self.db_file)
+
 class TestGFFAnnotation(unittest.TestCase):
 
     def test_empty_gff_annotation(self):
@@ -238,6 +492,8 @@ alignment_not_unique	0
         self.assertEqual(htseq.count('DDB0166998'),2)
         self.assertEqual(htseq.count('DDB0167147'),0)
         self.assertEqual(htseq.count('DDB0167277'),16)
+        # counts
+        self.assertEqual(htseq.counts(),[2,0,16])
         # table
         self.assertEqual(htseq.table().keys(),["total_counted_into_genes",
                                                "no_feature",
@@ -252,6 +508,180 @@ alignment_not_unique	0
         self.assertEqual(htseq.table()["not_aligned"],19996043)
         self.assertEqual(htseq.table()["alignment_not_unique"],0)
 
+class TestHTSeqCountMatrix(unittest.TestCase):
+
+    def setUp(self):
+        # Temporary directory
+        self.wd = tempfile.mkdtemp()
+        # htseq-count fragments
+        self.htseq_files = []
+        for name,counts in (("counts1.txt","""DDB0166998	2
+DDB0167147	0
+DDB0167277	16
+__no_feature	120515
+__ambiguous	422601
+"""),
+                            ("counts2.txt","""DDB0166998	5
+DDB0167147	7
+DDB0167277	1
+__no_feature	10
+__ambiguous	20
+"""),
+                            ("counts3.txt","""DDB0167277	3
+DDB0166998	4
+DDB0167147	9
+__no_feature	30
+__ambiguous	40
+"""),
+                            ("counts4.txt","""DDB0166998	4
+DDB0167147	9
+DDB0167999	3
+__no_feature	30
+__ambiguous	40
+""")):
+            htseq_file = os.path.join(self.wd,name)
+            with open(htseq_file,'wt') as fp:
+                fp.write(counts)
+            self.htseq_files.append(htseq_file)
+
+    def tearDown(self):
+        if os.path.exists(self.wd):
+            shutil.rmtree(self.wd)
+
+    def test_htseq_count_matrix(self):
+        """
+        HTSeqCountMatrix: combine counts from multiple files
+        """
+        counts = HTSeqCountMatrix()
+        for htseq_file in self.htseq_files[:3]:
+            counts.add(htseq_file,HTSeqCountFile(htseq_file))
+        self.assertEqual(counts.names(),self.htseq_files[:3])
+        self.assertEqual(counts.feature_IDs(),['DDB0166998',
+                                               'DDB0167147',
+                                               'DDB0167277'])
+        # Counts from third file are realigned
+        self.assertEqual(counts.counts('DDB0166998'),[2,5,4])
+        self.assertEqual(counts.counts('DDB0167147'),[0,7,9])
+        self.assertEqual(counts.counts('DDB0167277'),[16,1,3])
+        self.assertEqual(list(counts.column(self.htseq_files[2])),[4,9,3])
+        # Trailing table
+        table = counts.table()
+        self.assertEqual(table.keys(),["total_counted_into_genes",
+                                       "__no_feature",
+                                       "__ambiguous"])
+        self.assertEqual(table["total_counted_into_genes"],[18,13,16])
+        self.assertEqual(table["__no_feature"],[120515,10,30])
+        self.assertEqual(table["__ambiguous"],[422601,20,40])
+
+    def test_htseq_count_matrix_mismatched_features(self):
+        """
+        HTSeqCountMatrix: raise exception if features don't match
+        """
+        counts = HTSeqCountMatrix()
+        counts.add(self.htseq_files[0],
+                   HTSeqCountFile(self.htseq_files[0]))
+        self.assertRaises(Exception,
+                          counts.add,
+                          self.htseq_files[3],
+                          HTSeqCountFile(self.htseq_files[3]))
+
+class TestRestrictLookupIDs(unittest.TestCase):
+
+    def setUp(self):
+        # Temporary directory
+        self.wd = tempfile.mkdtemp()
+        # GFF file
+        self.gff_file = os.path.join(self.wd,"test.gff")
+        with open(self.gff_file,'wt') as fp:
+            fp.write(gff_data)
+        # GTF file
+        self.gtf_file = os.path.join(self.wd,"test.gtf")
+        with open(self.gtf_file,'wt') as fp:
+            fp.write(gtf_data)
+
+    def tearDown(self):
+        if os.path.exists(self.wd):
+            shutil.rmtree(self.wd)
+
+    def test_read_feature_ids(self):
+        """
+        read_feature_ids: collect IDs from feature data files
+        """
+        feature_file = os.path.join(self.wd,"features.txt")
+        with open(feature_file,'wt') as fp:
+            fp.write("""#Gene	Counts
+DDB0166998	167
+
+DDB0167147	8787
+""")
+        self.assertEqual(read_feature_ids((feature_file,)),
+                         set(("DDB0166998","DDB0167147")))
+
+    def test_read_feature_ids_htseq_count(self):
+        """
+        read_feature_ids: collect IDs from htseq-count files
+        """
+        htseq_files = []
+        for i,feature_id in enumerate(("DDB0166998","DDB0167147")):
+            htseq_file = os.path.join(self.wd,"htseq%d.txt" % i)
+            with open(htseq_file,'wt') as fp:
+                fp.write("""%s	2
+no_feature	120515
+ambiguous	422601
+""" % feature_id)
+            htseq_files.append(htseq_file)
+        self.assertEqual(read_feature_ids(htseq_files,htseq_count=True),
+                         set(("DDB0166998","DDB0167147")))
+
+    def test_find_lookup_ids_gff(self):
+        """
+        find_lookup_ids: include parents from GFF
+        """
+        self.assertEqual(find_lookup_ids(self.gff_file,("DDB0166998",)),
+                         set(("DDB0166998","DDB_G0276345")))
+
+    def test_find_lookup_ids_gtf(self):
+        """
+        find_lookup_ids: only feature IDs for GTF
+        """
+        self.assertEqual(find_lookup_ids(self.gtf_file,
+                                         ("ENSG00000223972.4",),
+                                         format='gtf'),
+                         set(("ENSG00000223972.4",)))
+
+    def test_restricted_lookup_from_gff(self):
+        """
+        GFFAnnotationLookup: lookup restricted to IDs from GFF
+        """
+        ids = find_lookup_ids(self.gff_file,("DDB0166998",))
+        lookup = GFFAnnotationLookup(
+            GFFIterator(self.gff_file,line_filter=id_line_filter(ids)),
+            compact=True)
+        self.assertEqual(len(lookup.getDataFromID("DDB0166998")),2)
+        self.assertEqual(len(lookup.getDataFromID("DDB_G0276345")),1)
+        self.assertRaises(KeyError,lookup.getDataFromID,"DDB0167147")
+        annot = lookup.getAnnotation("DDB0166998")
+        self.assertEqual(annot.parent_gene_name,"naa20")
+
+    def test_restricted_lookup_from_gtf(self):
+        """
+        GFFAnnotationLookup: lookup restricted to IDs from GTF
+        """
+        line_filter = id_line_filter(set(("ENSG00000223972.4",)),
+                                     format='gtf')
+        lookup = GFFAnnotationLookup(
+            GTFIterator(self.gtf_file,line_filter=line_filter),
+            compact=True)
+        annot = lookup.getAnnotation("ENSG00000223972.4")
+        self.assertEqual(annot.parent_gene_name,"DDX11L1")
+        line_filter = id_line_filter(set(("ENSG00000000000.1",)),
+                                     format='gtf')
+        lookup = GFFAnnotationLookup(
+            GTFIterator(self.gtf_file,line_filter=line_filter),
+            compact=True)
+        self.assertRaises(KeyError,lookup.getDataFromID,
+                          "ENSG00000223972.4")
+
 class TestAnnotateFeatureData(unittest.TestCase):
 
     def setUp(self):
@@ -345,6 +775,61 @@ DDB0166998	167	DDB0166998	mRNA	DDB_G0276345	naa20	DDB0232429	6679320	6680012	+	6
 DDB0167147	8787	DDB0167147	mRNA	DDB_G0275629	DDB_G0275629	DDB0232429	5954835	5955486	+	651	DDB0232429:5954835-5955486	Description of gene DDB_G0275629
 """)
 
+    def test_annotate_feature_data_preserves_input_fields(self):
+        """
+        annotate_feature_data: input fields are output unchanged
+        """
+        # Make feature file
+        with open(self.feature_data_file,'wt') as fp:
+            fp.write("""#Gene	Score	Comment
+DDB0166998	1.50	  spaces  
+DDB0167147	007	
+""")
+        # Load GFF data
+        gff = GFFFile("test.gff",StringIO(gff_data))
+        lookup = GFFAnnotationLookup(gff)
+        # Do annotation
+        annotate_feature_data(lookup,
+                              self.feature_data_file,
+                              self.out_file)
+        # Check output
+        with open(self.out_file,'rt') as fp:
+            self.assertEqual(fp.read(),
+                             """Gene	Score	Comment	exon_parent	feature_type_exon_parent	gene_ID	gene_name	chr	start	end	strand	gene_length	locus	description
+DDB0166998	1.50	  spaces  	DDB0166998	mRNA	DDB_G0276345	naa20	DDB0232429	6679320	6680012	+	692	DDB0232429:6679320-6680012	Description of gene naa20
+DDB0167147	007		DDB0167147	mRNA	DDB_G0275629	DDB_G0275629	DDB0232429	5954835	5955486	+	651	DDB0232429:5954835-5955486	Description of gene DDB_G0275629
+""")
+
+    def test_annotate_feature_data_multiple_processes(self):
+        """
+        annotate_feature_data: annotates using multiple processes
+        """
+        # Make feature file
+        feature_ids = ("DDB0166998","DDB0167147","DDB0238097","missing")
+        with open(self.feature_data_file,'wt') as fp:
+            fp.write("#Gene	Counts\n")
+            for i in range(50):
+                fp.write("%s	%d\n" % (feature_ids[i%4],i))
+        # Load GFF data
+        gff = GFFFile("test.gff",StringIO(gff_data))
+        lookup = GFFAnnotationLookup(gff)
+        # Do annotation with one process
+        annotate_feature_data(lookup,
+                              self.feature_data_file,
+                              self.out_file)
+        with open(self.out_file,'rt') as fp:
+            expected = fp.read()
+        # Do annotation with multiple processes
+        out_file = os.path.join(self.wd,"out.parallel.txt")
+        annotate_feature_data(lookup,
+                              self.feature_data_file,
+                              out_file,
+                              nprocs=3,
+                              chunk_size=4)
+        # Check output
+        with open(out_file,'rt') as fp:
+            self.assertEqual(fp.read(),expected)
+
 class TestAnnotateHtseqCountData(unittest.TestCase):
 
     def setUp(self):
@@ -389,4 +874,115 @@ alignment_not_unique	0
 DDB0166998	mRNA	DDB_G0276345	naa20	DDB0232429	6679320	6680012	+	692	DDB0232429:6679320-6680012	Description of gene naa20	2
 DDB0167147	mRNA	DDB_G0275629	DDB_G0275629	DDB0232429	5954835	5955486	+	651	DDB0232429:5954835-5955486	Description of gene DDB_G0275629	0
 """)
-        pass
+        with open(os.path.join(self.wd,"out_stats.txt"),'rt') as fp:
+            self.assertEqual(fp.read(),
+                             """count	%s
+total_counted_into_genes	2
+no_feature	120515
+ambiguous	422601
+too_low_aQual	0
+not_aligned	19996043
+alignment_not_unique	0
+""" % self.htseq_count_file)
+
+    def test_annotate_htseq_count_data_multiple_threads(self):
+        """
+        annotate_htseq_count_data: load files using multiple threads
+        """
+        # Additional htseq-count files
+        htseq_count_files = [self.htseq_count_file]
+        for i in range(2,5):
+            htseq_count_file = os.path.join(self.wd,"htseq_counts%d.txt" % i)
+            with open(htseq_count_file,'wt') as fp:
+                fp.write("""DDB0166998	%d
+DDB0167147	%d
+no_feature	15
+ambiguous	42
+too_low_aQual	1
+not_aligned	1999
+alignment_not_unique	2
+""" % (i,i*10))
+            htseq_count_files.append(htseq_count_file)
+        # Load GFF data
+        gff = GFFFile("test.gff",StringIO(gff_data))
+        lookup = GFFAnnotationLookup(gff)
+        # Do annotation
+        annotate_htseq_count_data(lookup,
+                                  htseq_count_files,
+                                  self.out_file,
+                                  nthreads=3)
+        # Check output (counts should be in the original order)
+        with open(self.out_file,'rt') as fp:
+            self.assertEqual(fp.read(),
+                             """exon_parent	feature_type_exon_parent	gene_ID	gene_name	chr	start	end	strand	gene_length	locus	description	htseq_counts.txt	htseq_counts2.txt	htseq_counts3.txt	htseq_counts4.txt
+DDB0166998	mRNA	DDB_G0276345	naa20	DDB0232429	6679320	6680012	+	692	DDB0232429:6679320-6680012	Description of gene naa20	2	2	3	4
+DDB0167147	mRNA	DDB_G0275629	DDB_G0275629	DDB0232429	5954835	5955486	+	651	DDB0232429:5954835-5955486	Description of gene DDB_G0275629	0	20	30	40
+""")
+
+    def test_annotate_htseq_count_data_stream(self):
+        """
+        annotate_htseq_count_data: annotates from GFF file (stream mode)
+        """
+        # Second htseq-count file
+        htseq_count_file2 = os.path.join(self.wd,"htseq_counts2.txt")
+        with open(htseq_count_file2,'wt') as fp:
+            fp.write("""DDB0166998	7
+DDB0167147	3
+no_feature	15
+ambiguous	42
+too_low_aQual	1
+not_aligned	1999
+alignment_not_unique	2
+""")
+        # Load GFF data
+        gff = GFFFile("test.gff",StringIO(gff_data))
+        lookup = GFFAnnotationLookup(gff)
+        # Do annotation
+        annotate_htseq_count_data(lookup,
+                                  (self.htseq_count_file,
+                                   htseq_count_file2),
+                                  self.out_file,
+                                  stream=True)
+        # Check output
+        with open(self.out_file,'rt') as fp:
+            self.assertEqual(fp.read(),
+                             """exon_parent	feature_type_exon_parent	gene_ID	gene_name	chr	start	end	strand	gene_length	locus	description	htseq_counts.txt	htseq_counts2.txt
+DDB0166998	mRNA	DDB_G0276345	naa20	DDB0232429	6679320	6680012	+	692	DDB0232429:6679320-6680012	Description of gene naa20	2	7
+DDB0167147	mRNA	DDB_G0275629	DDB_G0275629	DDB0232429	5954835	5955486	+	651	DDB0232429:5954835-5955486	Description of gene DDB_G0275629	0	3
+""")
+        with open(os.path.join(self.wd,"out_stats.txt"),'rt') as fp:
+            self.assertEqual(fp.read(),
+                             """count	%s	%s
+total_counted_into_genes	2	10
+no_feature	120515	15
+ambiguous	422601	42
+too_low_aQual	0	1
+not_aligned	19996043	1999
+alignment_not_unique	0	2
+""" % (self.htseq_count_file,htseq_count_file2))
+
+    def test_annotate_htseq_count_data_stream_mismatched_features(self):
+        """
+        annotate_htseq_count_data: stream mode fails for mismatched files
+        """
+        # Second htseq-count file with features in different order
+        htseq_count_file2 = os.path.join(self.wd,"htseq_counts2.txt")
+        with open(htseq_count_file2,'wt') as fp:
+            fp.write("""DDB0167147	3
+DDB0166998	7
+no_feature	15
+ambiguous	42
+too_low_aQual	1
+not_aligned	1999
+alignment_not_unique	2
+""")
+        # Load GFF data
+        gff = GFFFile("test.gff",StringIO(gff_data))
+        lookup = GFFAnnotationLookup(gff)
+        # Do annotation
+        self.assertRaises(Exception,
+                          annotate_htseq_count_data,
+                          lookup,
+                          (self.htseq_count_file,htseq_count_file2),
+                          self.out_file,
+                          stream=True)
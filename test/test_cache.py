@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import unittest
+from GFFUtils.cache import StageCache
+
+class TestStageCache(unittest.TestCase):
+
+    def setUp(self):
+        # Create a temporary working directory
+        self.wd = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.wd,"cache")
+
+    def tearDown(self):
+        # Remove the temporary working directory
+        shutil.rmtree(self.wd)
+
+    def _make_file(self,name,contents):
+        # Create a file in the working directory
+        filen = os.path.join(self.wd,name)
+        with open(filen,'wt') as fp:
+            fp.write(contents)
+        return filen
+
+    def test_cache_creates_directory(self):
+        """
+        StageCache: cache directory is created if missing
+        """
+        cache = StageCache(self.cache_dir)
+        self.assertTrue(os.path.isdir(self.cache_dir))
+        self.assertEqual(cache.cache_dir,self.cache_dir)
+
+    def test_key(self):
+        """
+        StageCache: keys depend on all the parts
+        """
+        cache = StageCache(self.cache_dir)
+        self.assertEqual(cache.key("a","b"),cache.key("a","b"))
+        self.assertNotEqual(cache.key("a","b"),cache.key("b","a"))
+        self.assertNotEqual(cache.key("ab"),cache.key("a","b"))
+        self.assertNotEqual(cache.key("a",None),cache.key("a",False))
+
+    def test_file_digest(self):
+        """
+        StageCache: file digests depend on the contents
+        """
+        cache = StageCache(self.cache_dir)
+        file1 = self._make_file("file1.txt","Some data\n")
+        file2 = self._make_file("file2.txt","Some data\n")
+        file3 = self._make_file("file3.txt","Other data\n")
+        self.assertEqual(cache.file_digest(file1),cache.file_digest(file2))
+        self.assertNotEqual(cache.file_digest(file1),
+                            cache.file_digest(file3))
+
+    def test_save_and_load_data(self):
+        """
+        StageCache: store and restore an object
+        """
+        cache = StageCache(self.cache_dir)
+        key = cache.key("stage1")
+        self.assertFalse(cache.has(key))
+        self.assertEqual(cache.load(key),None)
+        cache.save(key,data=(10,['a','b','c']))
+        self.assertTrue(cache.has(key))
+        self.assertEqual(cache.load(key),(10,['a','b','c']))
+        self.assertFalse(cache.has(cache.key("stage2")))
+
+    def test_save_and_fetch_files(self):
+        """
+        StageCache: store and fetch files
+        """
+        cache = StageCache(self.cache_dir)
+        filen = self._make_file("report.txt","Report\n")
+        key = cache.key("stage1")
+        self.assertEqual(cache.file(key,"report.txt"),None)
+        cache.save(key,files={"report.txt":filen})
+        os.remove(filen)
+        cached_file = cache.file(key,"report.txt")
+        self.assertNotEqual(cached_file,None)
+        with open(cached_file,'rt') as fp:
+            self.assertEqual(fp.read(),"Report\n")
+        self.assertEqual(cache.file(key,"missing.txt"),None)
+        self.assertEqual(cache.load(key),None)
+
+    def test_save_existing_entry_is_unchanged(self):
+        """
+        StageCache: saving an existing entry leaves it unchanged
+        """
+        cache = StageCache(self.cache_dir)
+        key = cache.key("stage1")
+        cache.save(key,data="first")
+        cache.save(key,data="second")
+        self.assertEqual(cache.load(key),"first")
+        self.assertEqual(os.listdir(os.path.dirname(cache.path(key))),
+                         [key])
+
+    def test_load_bad_entry_and_remove(self):
+        """
+        StageCache: unreadable entry can be removed and replaced
+        """
+        cache = StageCache(self.cache_dir)
+        key = cache.key("stage1")
+        cache.save(key,data="first")
+        with open(os.path.join(cache.path(key),"data.pickle"),'wb') as fp:
+            fp.write(b"not a pickle")
+        self.assertTrue(cache.has(key))
+        self.assertEqual(cache.load(key),None)
+        cache.remove(key)
+        self.assertFalse(cache.has(key))
+        cache.save(key,data="second")
+        self.assertEqual(cache.load(key),"second")
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from GFFUtils.instrumentation import ProgressReporter
+from GFFUtils.instrumentation import WarningCounter
+from GFFUtils.instrumentation import StageRecorder
+from GFFUtils.instrumentation import format_time
+from GFFUtils.instrumentation import format_bytes
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+class TestProgressReporter(unittest.TestCase):
+
+    def test_progress_reporter(self):
+        """
+        ProgressReporter: count items and estimate time remaining
+        """
+        progress = ProgressReporter(total=10,interval=None)
+        self.assertEqual(progress.count,0)
+        self.assertEqual(progress.eta(),None)
+        for i in range(4):
+            progress.update()
+        progress.update(n=2)
+        self.assertEqual(progress.count,6)
+        self.assertTrue(progress.rate() >= 0.0)
+
+    def test_progress_reporter_no_total(self):
+        """
+        ProgressReporter: no time remaining if total not known
+        """
+        progress = ProgressReporter(interval=None)
+        progress.update(n=5)
+        self.assertEqual(progress.count,5)
+        self.assertEqual(progress.eta(),None)
+
+class TestWarningCounter(unittest.TestCase):
+
+    def test_warning_counter(self):
+        """
+        WarningCounter: count warnings by category
+        """
+        warnings = WarningCounter()
+        self.assertEqual(warnings.count(),0)
+        warnings.add("Missing ID","No ID on line 3")
+        warnings.add("Missing ID","No ID on line 7")
+        warnings.add("Bad parent","Bad parent on line 4")
+        self.assertEqual(warnings.count(),3)
+        self.assertEqual(warnings.count("Missing ID"),2)
+        self.assertEqual(warnings.count("Bad parent"),1)
+        self.assertEqual(warnings.count("Other"),0)
+        self.assertEqual(warnings.categories(),["Missing ID","Bad parent"])
+        self.assertEqual(warnings.examples("Missing ID"),["No ID on line 3"])
+        warnings.reset()
+        self.assertEqual(warnings.count(),0)
+        self.assertEqual(warnings.categories(),[])
+
+    def test_warning_counter_merge(self):
+        """
+        WarningCounter: merge warnings from another counter
+        """
+        warnings = WarningCounter(max_examples=2)
+        warnings.add("Missing ID","No ID on line 3")
+        other = WarningCounter()
+        other.add("Missing ID","No ID on line 7")
+        other.add("Missing ID","No ID on line 9")
+        other.add("Bad parent","Bad parent on line 4")
+        warnings.merge(other)
+        self.assertEqual(warnings.count("Missing ID"),3)
+        self.assertEqual(warnings.count("Bad parent"),1)
+        self.assertEqual(warnings.examples("Missing ID"),
+                         ["No ID on line 3","No ID on line 7"])
+
+class TestStageRecorder(unittest.TestCase):
+
+    def setUp(self):
+        self.wd = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.wd)
+
+    def test_stage_recorder(self):
+        """
+        StageRecorder: record time and records for each stage
+        """
+        stats = StageRecorder()
+        with stats.stage("parse") as stage:
+            data = [str(i) for i in range(1000)]
+            stage.records = len(data)
+        with stats.stage("write",records=10):
+            pass
+        stages = stats.stages()
+        self.assertEqual([s['name'] for s in stages],["parse","write"])
+        self.assertEqual([s['records'] for s in stages],[1000,10])
+        for s in stages:
+            self.assertTrue(s['wall_time'] >= 0.0)
+            self.assertTrue(s['cpu_time'] >= 0.0)
+            self.assertEqual(s['peak_traced_memory'],None)
+
+    def test_stage_recorder_exception(self):
+        """
+        StageRecorder: stage is recorded if an exception is raised
+        """
+        stats = StageRecorder()
+        try:
+            with stats.stage("fails"):
+                raise KeyError("Oops")
+        except KeyError:
+            pass
+        self.assertEqual([s['name'] for s in stats.stages()],["fails"])
+
+    @unittest.skipIf(tracemalloc is None,"tracemalloc not available")
+    def test_stage_recorder_trace_memory(self):
+        """
+        StageRecorder: trace peak memory for each stage
+        """
+        stats = StageRecorder(trace_memory=True)
+        try:
+            with stats.stage("allocate"):
+                data = [str(i) for i in range(100000)]
+                del(data)
+            with stats.stage("nothing"):
+                pass
+        finally:
+            stats.stop()
+        allocate,nothing = stats.stages()
+        self.assertTrue(allocate['peak_traced_memory'] > 1000000)
+        self.assertTrue(nothing['peak_traced_memory'] <
+                        allocate['peak_traced_memory'])
+
+    def test_stage_recorder_stats_file(self):
+        """
+        StageRecorder: stats file is updated for each stage
+        """
+        stats_file = os.path.join(self.wd,"stats.json")
+        stats = StageRecorder(stats_file=stats_file,
+                              metadata=dict(program="test"))
+        with stats.stage("parse",records=5):
+            with open(stats_file,'rt') as fp:
+                data = json.load(fp)
+            self.assertEqual(data['program'],"test")
+            self.assertEqual(data['running'],"parse")
+            self.assertEqual(data['stages'],[])
+        with open(stats_file,'rt') as fp:
+            data = json.load(fp)
+        self.assertEqual(data['running'],None)
+        self.assertEqual(len(data['stages']),1)
+        self.assertEqual(data['stages'][0]['name'],"parse")
+        self.assertEqual(data['stages'][0]['records'],5)
+
+    def test_stage_recorder_write_json(self):
+        """
+        StageRecorder: write the stage data to a JSON file
+        """
+        stats_file = os.path.join(self.wd,"stats.json")
+        stats = StageRecorder()
+        with stats.stage("parse"):
+            pass
+        stats.write_json(stats_file)
+        with open(stats_file,'rt') as fp:
+            data = json.load(fp)
+        self.assertEqual(data['trace_memory'],False)
+        self.assertEqual(data['stages'],stats.stages())
+
+class TestFormatBytes(unittest.TestCase):
+
+    def test_format_bytes(self):
+        """
+        format_bytes: convert bytes to string
+        """
+        self.assertEqual(format_bytes(None),"-")
+        self.assertEqual(format_bytes(512),"512")
+        self.assertEqual(format_bytes(1536),"1.5K")
+        self.assertEqual(format_bytes(3*1024*1024),"3.0M")
+        self.assertEqual(format_bytes(2*1024**3),"2.0G")
+
+class TestFormatTime(unittest.TestCase):
+
+    def test_format_time(self):
+        """
+        format_time: convert seconds to string
+        """
+        self.assertEqual(format_time(5),"5s")
+        self.assertEqual(format_time(65.2),"1m05s")
+        self.assertEqual(format_time(3723),"1h02m03s")